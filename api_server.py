@@ -0,0 +1,311 @@
+import argparse
+import base64
+import io
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+import engine
+from engine import EngineError
+from normalize import normalize_mask, open_normalized
+from config import (
+    API_HOST, API_PORT, API_MAX_BATCH_SIZE, API_MAX_WAIT_MS, API_MAX_QUEUE, API_REQUEST_TIMEOUT_S,
+    DEFAULT_MODEL_IDS, setup_logging,
+)
+
+logger = logging.getLogger("studio.api")
+
+# --- Local HTTP inference API ---
+#   POST /v1/text2img  {"prompt", "negative_prompt", "seed", "guidance_scale", "steps", "width", "height"}
+#   POST /v1/img2img   {... "image": <base64 PNG/JPEG>, "strength"}
+#   POST /v1/inpaint   {... "image", "mask", "strength"}
+#   GET  /healthz      queue depth and batching stats
+# Responses: {"images": [<base64 PNG>], "seed", "batch_size", "queue_wait_s", "total_s"}.
+#
+# Requests go through a DynamicBatcher. Concurrent requests with the same op, model,
+# size, steps, guidance and strength are merged into one batched pipeline call
+# (engine.*_batch); prompts and seeds stay per request.
+
+INPUT_MAX_SIZE = 1024
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class _PendingRequest:
+    def __init__(self, key, payload):
+        self.key = key
+        self.payload = payload
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self.batch_size = None
+        self.queue_wait_s = None
+
+
+class DynamicBatcher:
+    # run_batch(key, payloads) -> one result per payload, in order. Runs on a single
+    # worker thread, so the pipelines are never called concurrently.
+    def __init__(self, run_batch, max_batch_size=API_MAX_BATCH_SIZE, max_wait_ms=API_MAX_WAIT_MS, max_queue=API_MAX_QUEUE):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0, max_wait_ms) / 1000
+        self.max_queue = max_queue
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {"requests": 0, "batches": 0, "rejected": 0, "max_batch_seen": 0}
+        self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, payload, timeout=API_REQUEST_TIMEOUT_S):
+        request = _PendingRequest(key, payload)
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"Queue full ({self.max_queue} waiting)")
+            self._pending.append(request)
+            self._cond.notify_all()
+        if not request.done.wait(timeout):
+            request.cancelled = True
+            raise TimeoutError(f"Request not served within {timeout} s")
+        if request.error is not None:
+            raise request.error
+        return request
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return []
+            # Oldest request decides the key; its arrival opens the batching window
+            first = self._pending[0]
+            deadline = first.enqueued + self.max_wait_s
+            while True:
+                batch = [r for r in self._pending if r.key == first.key and not r.cancelled][:self.max_batch_size]
+                remaining = deadline - time.perf_counter()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+            taken = {id(r) for r in batch}
+            self._pending = [r for r in self._pending if id(r) not in taken and not r.cancelled]
+            return batch
+
+    def _loop(self):
+        while not self._closed:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = self.run_batch(batch[0].key, [r.payload for r in batch])
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                with self._cond:
+                    self._stats["requests"] += len(batch)
+                    self._stats["batches"] += 1
+                    self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
+                for request in batch:
+                    request.batch_size = len(batch)
+                    request.queue_wait_s = started - request.enqueued
+                    request.done.set()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+        stats["mean_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else None
+        stats.update(max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_s * 1000, max_queue=self.max_queue)
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+
+# --- Pipelines / batch execution ---
+class PipelineRunner:
+    # pipeline_loader(kind, model_id) -> pipe; pipes stay loaded for the server's lifetime
+    def __init__(self, pipeline_loader=None, cpu_options=None):
+        self.pipeline_loader = pipeline_loader or (lambda kind, model_id: engine.load_pipeline(kind, model_id, cpu_options)[0])
+        self._pipes = {}
+
+    def pipe(self, kind, model_id):
+        if (kind, model_id) not in self._pipes:
+            self._pipes[(kind, model_id)] = self.pipeline_loader(kind, model_id)
+        return self._pipes[(kind, model_id)]
+
+    def __call__(self, key, payloads):
+        kind, model_id, steps, guidance_scale, strength = key[:5]
+        pipe = self.pipe(kind, model_id)
+        prompts = [p["prompt"] for p in payloads]
+        negative_prompts = [p["negative_prompt"] for p in payloads]
+        seeds = [p["seed"] for p in payloads]
+        if kind == "text2img":
+            width, height = key[5]
+            result = engine.text2img_batch(pipe, prompts, negative_prompts, seeds, guidance_scale, steps, width, height)
+        elif kind == "img2img":
+            result = engine.img2img_batch(
+                pipe, [p["image"] for p in payloads], prompts, negative_prompts, seeds, guidance_scale, steps, strength)
+        else:
+            result = engine.inpaint_batch(
+                pipe, [p["image"] for p in payloads], [p["mask"] for p in payloads],
+                prompts, negative_prompts, seeds, guidance_scale, steps, strength)
+        return [{"image": image, "seed": seed} for image, seed in zip(result.images, result.seeds)]
+
+
+# --- Request parsing ---
+def _decode_image(data, mode, max_size=None):
+    if not isinstance(data, str) or not data:
+        raise ValueError("expected a base64-encoded image")
+    if data.startswith("data:"):
+        data = data.split(",", 1)[1]
+    source = io.BytesIO(base64.b64decode(data))
+    return open_normalized(source, max_size, mode) if max_size else Image.open(source).convert(mode)
+
+def _encode_png(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+def parse_request(kind, body):
+    # -> (batch key, payload); everything in the key must match for two requests to share a call
+    if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+    if not body.get("prompt"):
+        raise ValueError("'prompt' is required")
+    model_id = body.get("model_id") or DEFAULT_MODEL_IDS[kind]
+    steps = int(body.get("steps", 30))
+    guidance_scale = float(body.get("guidance_scale", 7.5))
+    strength = float(body.get("strength", 0.75)) if kind != "text2img" else None
+    if not 1 <= steps <= 150:
+        raise ValueError("'steps' must be between 1 and 150")
+    payload = {
+        "prompt": str(body["prompt"]),
+        "negative_prompt": str(body.get("negative_prompt", "")),
+        "seed": engine.resolve_seed(int(body.get("seed", -1))),
+    }
+    if kind == "text2img":
+        width, height = int(body.get("width", 512)), int(body.get("height", 512))
+        if width % 8 or height % 8 or not (64 <= width <= 2048 and 64 <= height <= 2048):
+            raise ValueError("'width'/'height' must be multiples of 8 between 64 and 2048")
+        size = (width, height)
+    else:
+        if "image" not in body:
+            raise ValueError("'image' is required")
+        payload["image"] = _decode_image(body["image"], "RGB", INPUT_MAX_SIZE)
+        size = payload["image"].size
+        if kind == "inpaint":
+            if "mask" not in body:
+                raise ValueError("'mask' is required")
+            payload["mask"] = normalize_mask(_decode_image(body["mask"], "L"), size)
+    return (kind, model_id, steps, guidance_scale, strength, size), payload
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "ImageStudioAPI/1.0"
+    routes = {"/v1/text2img": "text2img", "/v1/img2img": "img2img", "/v1/inpaint": "inpaint"}
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok", "batcher": self.server.batcher.stats()})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        kind = self.routes.get(self.path)
+        if kind is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            key, payload = parse_request(kind, json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, KeyError, TypeError, OSError) as e: # Bad JSON / fields (e.g. null numbers) / undecodable images
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            request = self.server.batcher.submit(key, payload, timeout=self.server.request_timeout)
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)})
+            return
+        except TimeoutError as e:
+            self._send_json(504, {"error": str(e)})
+            return
+        except EngineError as e:
+            self._send_json(500, {"error": str(e), "hint": e.hint})
+            return
+        except Exception as e:
+            logger.exception("Batch failed")
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {
+            "images": [_encode_png(request.result["image"])],
+            "seed": request.result["seed"],
+            "batch_size": request.batch_size,
+            "queue_wait_s": request.queue_wait_s,
+            "total_s": time.perf_counter() - start,
+        })
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def make_server(host=API_HOST, port=API_PORT, batcher=None, request_timeout=API_REQUEST_TIMEOUT_S):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.batcher = batcher or DynamicBatcher(PipelineRunner())
+    server.request_timeout = request_timeout
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP inference API with dynamic request batching.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=API_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=API_MAX_WAIT_MS)
+    parser.add_argument("--max-queue", type=int, default=API_MAX_QUEUE)
+    parser.add_argument("--threads", type=int, default=0, help="CPU intra-op threads (0 = torch default)")
+    args = parser.parse_args()
+    setup_logging()
+
+    batcher = DynamicBatcher(
+        PipelineRunner(cpu_options={"num_threads": args.threads}),
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, max_queue=args.max_queue,
+    )
+    server = make_server(args.host, args.port, batcher)
+    logger.info("Serving on http://%s:%d (batch <= %d, window %.0f ms)", args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()
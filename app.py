@@ -1,11 +1,16 @@
 import streamlit as st
 import numpy as np
-import torch # Keep torch import if checking cuda availability here
+from lazy_imports import cuda_available, cuda_device_name # torch itself is only imported when a model loads
 
 # Import from local modules
-from config import configure_page, apply_theme, apply_custom_css, setup_directories
+from config import configure_page, apply_theme, apply_custom_css, setup_directories, setup_logging, METRICS_LOG_PATH, PROFILE_FIRST_STEP, PROFILE_LAST_STEP, TOKEN_MERGING_MIN_TOKENS, DEFAULT_SCHEDULER, DEADLINE_DEFAULT_S
 from utils import add_to_history # Only add_to_history if used directly in sidebar? Check usage.
 from projects import load_projects
+from latent_cache import get_latent_cache
+from performance import cpu_perf_options, default_thread_count
+from speedups import speedup_options
+from schedulers import scheduler_names, recommended_steps
+from memory_planner import describe_plan
 
 # Import App functions from modes
 from modes.inpainting import inpainting_app
@@ -18,6 +23,7 @@ from modes.projects_display import project_manager_app
 # --- Initial Setup ---
 configure_page()
 setup_directories()
+setup_logging()
 apply_custom_css() # Apply CSS early
 apply_theme()      # Apply theme right after CSS
 
@@ -115,7 +121,14 @@ with st.sidebar:
         st.markdown("---")
         st.markdown("### 🛠️ Generation Settings")
 
-        num_inference_steps = st.slider("Steps", 10, 150, 30, 5, key="common_steps", help="Number of denoising steps. More steps take longer but can improve quality (diminishing returns).")
+        # Picking a sampler moves the step slider to that sampler's recommended count
+        st.session_state.scheduler_preset = st.selectbox(
+            "Sampler", scheduler_names(), index=scheduler_names().index(DEFAULT_SCHEDULER), key="common_scheduler",
+            on_change=lambda: st.session_state.update(common_steps=recommended_steps(st.session_state.common_scheduler)),
+            help="Multistep samplers (DPM++, UniPC) reach a comparable image in far fewer steps than the model's default scheduler. Switching reuses the loaded model.",
+        )
+        st.session_state.setdefault("common_steps", recommended_steps(DEFAULT_SCHEDULER)) # Set here, not via value=, since on_change writes it
+        num_inference_steps = st.slider("Steps", 5, 150, step=1, key="common_steps", help="Number of denoising steps. More steps take longer but can improve quality (diminishing returns).")
         guidance_scale = st.slider("Guidance (CFG)", 1.0, 20.0, 7.5, 0.5, key="common_cfg", help="How strongly the prompt guides generation. Higher values follow the prompt more closely, lower values allow more creativity.")
         seed = st.number_input("Seed", -1, 2**32 - 1, 42, key="common_seed", help="Controls randomness. Set to -1 for a random seed on each run.")
 
@@ -123,6 +136,12 @@ with st.sidebar:
         if mode in ["inpaint", "restore", "editor", "batch"]: # Modes using strength
              strength = st.slider("Strength / Influence", 0.0, 1.0, 0.75, 0.05, key="common_strength", help="For Inpaint/Img2Img/Restore: Controls how much the original image is changed (0.0 = no change, 1.0 = max change).")
 
+        # Latency budget: steps/size above become upper bounds, fitted to measured per-step cost (deadline.py)
+        st.session_state.deadline_s = None
+        if mode in ["text2img", "restore", "editor", "batch"]: # Modes going through process_text2img / process_img2img
+            if st.checkbox("⏱️ Latency budget", False, key="deadline_enabled", help="Fit each image into a time budget: steps, then guidance, then size are reduced as needed, using the measured speed of this model on this device."):
+                st.session_state.deadline_s = st.number_input("Seconds per image", 1.0, 600.0, DEADLINE_DEFAULT_S, 1.0, key="deadline_seconds")
+
         # Size settings only for Text2Img and potentially Batch Text2Img
         width, height, num_images = 512, 512, 1 # Defaults
         if mode == "text2img" or (mode == "batch" and st.session_state.get("batch_op_type") == "Text-to-Image Variations"):
@@ -135,6 +154,45 @@ with st.sidebar:
             if mode == "text2img": # Only show num_images for single text2img
                  num_images = st.slider("Number of Images", 1, 4, 1, key="common_num_images", help="How many images to generate at once.")
 
+        # CPU-only hosts: expose thread / memory-format / autocast / compile knobs
+        if not cuda_available():
+            cpu_defaults = cpu_perf_options()
+            with st.expander("🖥️ CPU Performance Mode", expanded=False):
+                max_threads = default_thread_count()
+                perf_cols = st.columns(2)
+                with perf_cols[0]:
+                    cpu_threads = st.number_input("Intra-op threads", 0, max_threads, min(cpu_defaults["num_threads"], max_threads), key="cpu_perf_threads", help="Threads used inside each operator. 0 = PyTorch default.")
+                with perf_cols[1]:
+                    cpu_interop_threads = st.number_input("Inter-op threads", 0, max_threads, min(cpu_defaults["num_interop_threads"], max_threads), key="cpu_perf_interop", help="Threads for running independent operators in parallel. Can only be changed before the first generation.")
+                cpu_channels_last = st.checkbox("channels_last memory format", cpu_defaults["channels_last"], key="cpu_perf_channels_last", help="NHWC layout for UNet/VAE convolutions. Reloads the model when changed.")
+                cpu_bf16 = st.checkbox("bfloat16 autocast", cpu_defaults["bf16_autocast"], key="cpu_perf_bf16", help="Faster on CPUs with AVX512-BF16/AMX; may slightly change results.")
+                cpu_compile = st.checkbox("torch.compile UNet", cpu_defaults["compile_unet"], key="cpu_perf_compile", help="Compiles the UNet at load time (slow first load, faster steps). Reloads the model when changed.")
+                cpu_quantize = st.checkbox("int8 dynamic quantization", cpu_defaults["quantize_int8"], key="cpu_perf_quantize", help="Quantizes text encoder / UNet linear layers to int8: less RAM, faster steps, small quality change. Cached on disk after the first load.")
+            st.session_state.cpu_perf_options = {
+                "num_threads": cpu_threads,
+                "num_interop_threads": cpu_interop_threads,
+                "channels_last": cpu_channels_last,
+                "bf16_autocast": cpu_bf16,
+                "compile_unet": cpu_compile,
+                "quantize_int8": cpu_quantize,
+            }
+
+        # Opt-in shortcuts that cut UNet work per generation (speedups.py)
+        speedup_defaults = speedup_options()
+        with st.expander("🚀 Speedups", expanded=False):
+            cfg_truncation = st.slider("Guidance for first % of steps", 0.1, 1.0, speedup_defaults["cfg_truncation"], 0.05, key="speedup_cfg_truncation", help="Classifier-free guidance doubles the UNet batch. Dropping it for the late steps saves UNet work: 0.5 = ~25% less, 0.35 = ~33% less. 1.0 = off.")
+            cfg_skip_unit = st.checkbox("Skip guidance when CFG ≈ 1", speedup_defaults["cfg_skip_unit_scale"], key="speedup_cfg_skip_unit", help="Guidance scales this close to 1 barely change the result; run only the conditional branch.")
+            feature_cache = st.checkbox("Reuse deep UNet features", speedup_defaults["feature_cache"], key="speedup_feature_cache", help="Runs the full UNet only every few steps and reuses its deep features in between (DeepCache-style). Off for distilled few-step models and runs under 10 steps.")
+            feature_cache_interval = st.number_input("Full UNet every N steps (0 = model default)", 0, 10, speedup_defaults["feature_cache_interval"], key="speedup_feature_cache_interval", disabled=not feature_cache)
+            token_merging_ratio = st.slider("Token merging ratio", 0.0, 0.7, speedup_defaults["token_merging"], 0.05, key="speedup_token_merging", help=f"Merges this fraction of similar latent tokens before self-attention in the highest-resolution UNet blocks (latents of at least {TOKEN_MERGING_MIN_TOKENS} tokens; 768 px = 9216). 0.3-0.5 cuts s/step and attention memory at 768-1024 px. 0 = off.")
+        st.session_state.speedup_options = {
+            "cfg_truncation": cfg_truncation,
+            "cfg_skip_unit_scale": cfg_skip_unit,
+            "feature_cache": feature_cache,
+            "feature_cache_interval": int(feature_cache_interval),
+            "token_merging": token_merging_ratio,
+        }
+
     # --- History Panel ---
     st.markdown("---")
     st.markdown("### 📜 History (Last 5)")
@@ -149,6 +207,73 @@ with st.sidebar:
     else:
         st.caption("No generations yet.")
 
+    # --- Performance Panel ---
+    # Filled after the main area runs so it shows the generation from this rerun
+    performance_panel = st.empty()
+    if mode != "projects":
+        if st.button("🔬 Profile next run", key="profile_next_run", help=f"Capture a PyTorch profiler trace of denoising steps {PROFILE_FIRST_STEP}-{PROFILE_LAST_STEP} of the next generation."):
+            st.session_state.profile_armed = True
+        if st.session_state.get("profile_armed"):
+            st.caption("Profiler armed: the next generation will be profiled.")
+
+
+def render_performance_panel():
+    with performance_panel.container():
+        with st.expander("⚡ Performance", expanded=False):
+            last_run = st.session_state.get("last_run_metrics")
+            if last_run:
+                st.caption(f"**Last run:** {last_run['kind']} · {last_run['params'].get('scheduler', 'Model default')} · {last_run['total_s']:.2f} s total"
+                           + (f" · {last_run['steps_per_s']:.2f} steps/s" if last_run.get("steps_per_s") else ""))
+                stage_rows = {stage: f"{seconds:.3f} s" for stage, seconds in last_run["stages_s"].items()}
+                output_stages = st.session_state.get("last_run_output_stages", {})
+                if output_stages.get("run_id") == last_run["run_id"]:
+                    stage_rows["png_encode"] = f"{output_stages['png_encode_s']:.3f} s"
+                    stage_rows["transfer (payload)"] = f"{output_stages['transfer_bytes'] / 2**20:.2f} MB"
+                st.table(stage_rows)
+                memory_line = f"Peak RSS: {last_run['peak_rss_bytes'] / 2**20:.0f} MB"
+                if last_run.get("peak_device_bytes"):
+                    memory_line += f" · Peak GPU: {last_run['peak_device_bytes'] / 2**20:.0f} MB"
+                st.caption(memory_line)
+                if last_run.get("speedups"):
+                    st.caption("Speedups: " + ", ".join(f"{k}={v}" for k, v in last_run["speedups"].items())
+                               + (f" · guidance for {last_run['cfg_guided_steps']} steps" if last_run.get("cfg_guided_steps") else "")
+                               + (f" · {last_run['feature_cache']['reused_steps']} of {last_run['feature_cache']['full_steps'] + last_run['feature_cache']['reused_steps']} UNet calls reused cached features" if last_run.get("feature_cache") else ""))
+                last_deadline = st.session_state.get("last_deadline")
+                if last_deadline and last_deadline["run_id"] == last_run["run_id"]:
+                    st.caption(f"Latency budget: {last_deadline['budget_s']:.0f} s · predicted {last_deadline['predicted_s']:.1f} s · actual {last_deadline['actual_s']:.1f} s"
+                               f" (cost model from {last_deadline['samples']} runs, {last_deadline['basis']})")
+                if last_run.get("token_merging"):
+                    st.caption(f"Token merging: {last_run['token_merging']:.0%} of self-attention tokens")
+                if last_run.get("error"):
+                    st.caption(f"Error: {last_run['error']}")
+            else:
+                st.caption("No generation measured yet.")
+
+            last_load = st.session_state.get("last_model_load")
+            if last_load:
+                st.caption(f"**Last model load:** {last_load['pipeline']} ({last_load['model_id']}) in {last_load['seconds']:.1f} s")
+                if last_load.get("format"):
+                    st.caption(f"Weights: {last_load['format']} ({'manifest' if last_load.get('manifest_hit') else 'format search'}"
+                               f"{', parallel components' if last_load.get('parallel') else ''})")
+
+            cache_stats = get_latent_cache().stats()
+            st.caption("**Latent cache** (encoded Img2Img/Inpainting inputs)")
+            st.caption(
+                f"Hit rate: {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} hits / {cache_stats['misses']} misses) · "
+                f"{cache_stats['entries']}/{cache_stats['max_entries']} entries · "
+                f"{cache_stats['bytes'] / 2**20:.1f}/{cache_stats['max_bytes'] / 2**20:.0f} MB · "
+                f"{cache_stats['evictions']} evictions"
+            )
+            last_plan = st.session_state.get("last_memory_plan")
+            if last_plan:
+                st.caption(f"**Memory plan (last run):** {describe_plan(last_plan)}")
+                for reason in last_plan["reasons"]:
+                    st.caption(f"• {reason}")
+            last_profile = st.session_state.get("last_profile")
+            if last_profile:
+                st.caption(f"**Last profile:** trace `{last_profile['trace']}` (open in chrome://tracing or Perfetto), operators `{last_profile['table']}`")
+            st.caption(f"Structured log: `{METRICS_LOG_PATH}`")
+
 
 # --- Main Area Router ---
 def main():
@@ -181,8 +306,9 @@ def main():
 
 if __name__ == '__main__':
     # Check CUDA availability once at the start (optional, models.py handles device)
-    if torch.cuda.is_available():
-        st.sidebar.success(f"CUDA Available ({torch.cuda.get_device_name(0)})")
+    if cuda_available():
+        st.sidebar.success(f"CUDA Available ({cuda_device_name()})")
     else:
         st.sidebar.warning("CUDA not available, running on CPU (will be slow).")
-    main()
\ No newline at end of file
+    main()
+    render_performance_panel()
\ No newline at end of file
@@ -0,0 +1,389 @@
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import engine
+from engine import EngineError
+from normalize import normalize_image, normalize_mask, open_normalized
+from worker_pool import WorkerPool, tuned_split
+from config import BATCH_RUNS_DIR, DEFAULT_MODEL_IDS, INPAINT_MAX_SIZE, ENHANCE_MAX_SIZE, DEFAULT_SCHEDULER, setup_logging
+from schedulers import scheduler_names
+
+logger = logging.getLogger("studio.batch")
+
+# --- Resumable command-line batch runner ---
+# Same operations and parameters as the Batch Processing UI, driven by a manifest
+# (JSONL or CSV, one job per row):
+#
+#   {"op": "inpaint", "image": "in/a.jpg", "mask": "in/mask.png", "prompt": "a sunset"}
+#   {"op": "text2img", "base_prompt": "photo of a cat", "variation": "wearing a hat"}
+#   {"op": "enhance", "image": "in/b.jpg", "prompt": "sharp focus", "strength": 0.5}
+#
+#   python batch_runner.py jobs.jsonl --output-dir batch_runs/cats --seed 42
+#
+# Each finished row is written to <output-dir>/images and checkpointed in
+# progress.jsonl; rerunning the same command skips rows already done.
+# Unless a row sets "seed", row i uses seed + i, so reruns reproduce the same images.
+# --workers N shards rows across N processes (see worker_pool.py); results are
+# written and checkpointed in manifest order within each op/model group.
+
+OP_ALIASES = {
+    "inpaint": "inpaint", "inpainting": "inpaint",
+    "text2img": "text2img", "t2i": "text2img",
+    "img2img": "img2img", "enhance": "img2img", "enhancement": "img2img",
+}
+FIELD_TYPES = {
+    "seed": int, "steps": int, "width": int, "height": int, "num_images": int,
+    "guidance_scale": float, "strength": float,
+}
+
+
+# --- Per-item preparation (shared with modes/batch.py) ---
+def item_seed(base_seed, index):
+    return (int(base_seed) + index) % 2**32
+
+def prepare_inpaint_mask(image, mask):
+    resized_mask = normalize_mask(mask, image.size)
+    # Ensure mask is inverted correctly (white = inpaint)
+    mask_array = np.array(resized_mask)
+    if np.mean(mask_array) < 127: # Mostly black means user likely painted area to *keep*
+        return Image.fromarray(255 - mask_array)
+    return resized_mask
+
+def prepare_enhance_image(image):
+    # Resize for model compatibility if needed (a no-op for inputs loaded through normalize)
+    return normalize_image(image, ENHANCE_MAX_SIZE)
+
+
+# --- Manifest ---
+def read_manifest(path):
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="") as f:
+            rows = [{k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ""}
+                    for row in csv.DictReader(f)]
+    else:
+        rows = []
+        with open(path) as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_no}: invalid JSON ({e})")
+    for row in rows:
+        for name, cast in FIELD_TYPES.items():
+            if name in row:
+                row[name] = cast(row[name])
+    return rows
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_job(row, index, args, base_seed, manifest_dir):
+    op = OP_ALIASES.get(str(row.get("op", args.op or "")).lower())
+    if op is None:
+        raise ValueError(f"unknown op {row.get('op')!r}")
+    prompt = row.get("prompt")
+    if prompt is None and "base_prompt" in row:
+        prompt = f"{row['base_prompt']}, {row['variation']}" if row.get("variation") else row["base_prompt"]
+    if not prompt:
+        raise ValueError("missing prompt")
+    job = {
+        "op": op,
+        "id": str(row.get("id", index)),
+        "model_id": row.get("model_id") or (args.inpaint_model_id if op == "inpaint" else args.model_id) or DEFAULT_MODEL_IDS[op],
+        "prompt": prompt,
+        "negative_prompt": row.get("negative_prompt", args.negative_prompt),
+        "seed": row["seed"] if "seed" in row else item_seed(base_seed, index),
+        "guidance_scale": row.get("guidance_scale", args.guidance_scale),
+        "steps": row.get("steps", args.steps),
+        "scheduler": row.get("scheduler", args.scheduler),
+        "strength": row.get("strength", args.strength),
+        "width": row.get("width", args.width),
+        "height": row.get("height", args.height),
+        "num_images": row.get("num_images", 1),
+    }
+    for key in ("image", "mask"):
+        if row.get(key):
+            job[key] = manifest_dir / row[key]
+    if op in ("inpaint", "img2img") and "image" not in job:
+        raise ValueError(f"{op} row needs an 'image'")
+    if op == "inpaint" and "mask" not in job:
+        raise ValueError("inpaint row needs a 'mask'")
+    return job
+
+
+def _open_input(value, mode, max_size=None):
+    # Manifest rows carry paths; in-app batches (worker_pool) pass decoded images.
+    # Either way the input is resampled once, straight to its model-compatible size.
+    if isinstance(value, Image.Image):
+        image = value if value.mode == mode else value.convert(mode)
+        return normalize_image(image, max_size) if max_size else image
+    return open_normalized(value, max_size, mode) if max_size else Image.open(value).convert(mode)
+
+def run_job(pipe, job):
+    if job["op"] == "text2img":
+        result = engine.text2img(
+            pipe, job["prompt"], job["negative_prompt"], job["seed"], job["guidance_scale"], job["steps"],
+            job["width"], job["height"], num_images=job["num_images"], scheduler=job.get("scheduler"),
+        )
+        return result.images
+    if job["op"] == "inpaint":
+        image = _open_input(job["image"], "RGB", INPAINT_MAX_SIZE)
+        mask = prepare_inpaint_mask(image, _open_input(job["mask"], "L"))
+        result = engine.inpaint(
+            pipe, image, mask, job["prompt"], job["negative_prompt"], job["seed"],
+            job["guidance_scale"], job["steps"], job["strength"], scheduler=job.get("scheduler"),
+        )
+    else:
+        image = _open_input(job["image"], "RGB", ENHANCE_MAX_SIZE)
+        result = engine.img2img(
+            pipe, image, job["prompt"], job["negative_prompt"], job["seed"],
+            job["guidance_scale"], job["steps"], job["strength"], scheduler=job.get("scheduler"),
+        )
+    return result.images
+
+
+# --- Run directory / checkpointing ---
+def _save_png(image, path):
+    tmp_path = path.with_suffix(".tmp")
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+def _append_progress(progress_path, entry):
+    with open(progress_path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def load_progress(progress_path):
+    # Last entry per row wins, so a failed row that was retried counts as done
+    entries = {}
+    if progress_path.exists():
+        with open(progress_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Torn last line from a killed run
+                entries[entry["index"]] = entry
+    return entries
+
+_RUN_DEFAULTS = ("op", "model_id", "inpaint_model_id", "negative_prompt", "guidance_scale", "steps", "scheduler", "strength", "width", "height")
+
+def _changed_defaults(run, args):
+    # CLI settings that differ from the ones the run started with (keys an older run.json lacks are skipped)
+    changed = [k for k, v in run.get("defaults", {}).items() if getattr(args, k, v) != v]
+    if args.seed != -1 and args.seed != run["base_seed"]:
+        changed.append("seed")
+    return changed
+
+def init_run(output_dir, manifest_path, args):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / "images").mkdir(exist_ok=True)
+    run_path = output_dir / "run.json"
+    manifest_sha = _file_sha256(manifest_path)
+    if run_path.exists():
+        run = json.loads(run_path.read_text())
+        if run["manifest_sha256"] != manifest_sha and not args.force:
+            raise SystemExit(f"{manifest_path} changed since this run started; use --force or a new --output-dir.")
+        changed = _changed_defaults(run, args)
+        if changed and not args.force:
+            # Resuming with other defaults would mix settings within one run
+            raise SystemExit(
+                f"{', '.join('--' + k.replace('_', '-') for k in changed)} changed since this run started (see {run_path}); "
+                "use the same flags, --force or a new --output-dir.")
+        return run
+    # A random base seed is fixed once per run so a resumed run continues the same sequence
+    base_seed = args.seed if args.seed != -1 else int(np.random.randint(0, 2**32 - 1))
+    run = {
+        "manifest": str(manifest_path),
+        "manifest_sha256": manifest_sha,
+        "base_seed": base_seed,
+        "started": datetime.datetime.now().isoformat(),
+        "defaults": {k: getattr(args, k) for k in _RUN_DEFAULTS},
+    }
+    run_path.write_text(json.dumps(run, indent=2))
+    return run
+
+
+# --- Execution backends ---
+# Both yield (index, job, images, error, seconds) in job order.
+
+def _execute_sequential(jobs, args):
+    pipes = {}
+    for index, job in jobs:
+        start = time.perf_counter()
+        key = (job["op"], job["model_id"])
+        try:
+            if key not in pipes:
+                pipes[key], _ = engine.load_pipeline(job["op"], job["model_id"], {"num_threads": args.threads})
+            images, error = run_job(pipes[key], job), None
+        except (EngineError, OSError, ValueError, KeyError) as e:
+            images, error = [], str(e)
+        except Exception as e:
+            # Unexpected (e.g. a RuntimeError while denoising): fail this row, keep the run going
+            logger.exception("Row %d raised an unexpected error", index)
+            images, error = [], f"{type(e).__name__}: {e}"
+        yield index, job, images, error, time.perf_counter() - start
+
+def _resolve_workers(args, jobs):
+    # Sets args.workers/args.threads_per_worker; True when the process pool should be used
+    if args.workers == "auto":
+        first = jobs[0][1] if jobs else None
+        split = tuned_split(first["op"], first["model_id"]) if first else None
+        if split is None:
+            logger.info("No worker tuning for this model yet (python worker_pool.py); running in-process.")
+            args.workers = 1
+        else:
+            args.workers, args.threads_per_worker = split
+            logger.info("Using tuned split: %d workers x %d threads", *split)
+    args.workers = int(args.workers)
+    if args.workers > 1 and not args.threads_per_worker:
+        args.threads_per_worker = max(1, (args.threads or os.cpu_count()) // args.workers)
+    return args.workers > 1 and len(jobs) > 1
+
+def _execute_parallel(jobs, args):
+    # One pool per (op, model) group, in manifest order of first appearance
+    groups = {}
+    for index, job in jobs:
+        groups.setdefault((job["op"], job["model_id"]), []).append((index, job))
+    for (op, model_id), group in groups.items():
+        logger.info("Starting %d workers x %d threads for %s (%s)", args.workers, args.threads_per_worker, op, model_id)
+        with WorkerPool(op, model_id, min(args.workers, len(group)), args.threads_per_worker) as pool:
+            for (index, job), result in zip(group, pool.map([job for _, job in group])):
+                yield index, job, result["images"], result["error"], result["seconds"]
+
+
+def summarize_run(rows, progress, item_seconds, images_written, elapsed, interrupted):
+    done = [e for e in progress.values() if e["status"] == "ok"]
+    by_op = {}
+    for entry in progress.values():
+        counts = by_op.setdefault(entry["op"], {"ok": 0, "failed": 0})
+        counts[entry["status"]] += 1
+    return {
+        "rows": len(rows),
+        "done": len(done),
+        "failed": sum(1 for e in progress.values() if e["status"] == "failed"),
+        "remaining": len(rows) - len(done),
+        "interrupted": interrupted,
+        "this_run": {
+            "rows_processed": len(item_seconds),
+            "images_written": images_written,
+            "elapsed_s": elapsed,
+            "images_per_min": 60 * images_written / elapsed if elapsed > 0 else None,
+            "s_per_row_median": statistics.median(item_seconds) if item_seconds else None,
+            "s_per_row_mean": statistics.mean(item_seconds) if item_seconds else None,
+        },
+        "by_op": by_op,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch manifest (JSONL or CSV) with checkpointing and resume.")
+    parser.add_argument("manifest")
+    parser.add_argument("--output-dir", help=f"Run directory (default: {BATCH_RUNS_DIR}/<manifest name>)")
+    parser.add_argument("--op", help="Default op for rows without one: inpaint, text2img or enhance")
+    parser.add_argument("--model-id", help="Model for text2img/enhance rows")
+    parser.add_argument("--inpaint-model-id", help="Model for inpaint rows")
+    parser.add_argument("--negative-prompt", default="")
+    parser.add_argument("--seed", type=int, default=42, help="Base seed; row i uses seed + i (-1 = random, fixed per run)")
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--scheduler", choices=scheduler_names(), default=DEFAULT_SCHEDULER, help="Sampler preset (see SCHEDULER_PRESETS)")
+    parser.add_argument("--strength", type=float, default=0.75)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=0, help="CPU intra-op threads (0 = torch default); with --workers, the total budget")
+    parser.add_argument("--workers", default="1", help='Worker processes, each with its own pipeline; "auto" uses the worker_pool.py tuning')
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="Default: --threads (or CPU count) / --workers")
+    parser.add_argument("--force", action="store_true", help="Resume even if the manifest or the default settings changed")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    manifest_path = Path(args.manifest)
+    rows = read_manifest(manifest_path)
+    output_dir = Path(args.output_dir) if args.output_dir else BATCH_RUNS_DIR / manifest_path.stem
+    run = init_run(output_dir, manifest_path, args)
+    progress_path = output_dir / "progress.jsonl"
+    progress = load_progress(progress_path)
+    pending = [i for i in range(len(rows)) if progress.get(i, {}).get("status") != "ok"]
+    logger.info("%d rows, %d already done, %d to run -> %s", len(rows), len(rows) - len(pending), len(pending), output_dir)
+
+    jobs, failed = [], []
+    for index in pending:
+        try:
+            jobs.append((index, resolve_job(rows[index], index, args, run["base_seed"], manifest_path.parent)))
+        except (ValueError, KeyError) as e:
+            failed.append((index, e))
+
+    item_seconds, images_written = [], 0
+    interrupted = False
+    start = time.perf_counter()
+    try:
+        for index, e in failed:
+            entry = {"index": index, "id": str(rows[index].get("id", index)), "op": rows[index].get("op", args.op),
+                     "status": "failed", "error": str(e), "seconds": 0.0, "time": datetime.datetime.now().isoformat()}
+            logger.warning("Row %d failed: %s", index, e)
+            _append_progress(progress_path, entry)
+            progress[index] = entry
+
+        execute = _execute_parallel if _resolve_workers(args, jobs) else _execute_sequential
+        for n, (index, job, images, error, seconds) in enumerate(execute(jobs, args), 1):
+            entry = {"index": index, "id": job["id"], "op": job["op"], "seed": job["seed"]}
+            try:
+                if error is not None:
+                    raise EngineError(error)
+                paths = []
+                for k, image in enumerate(images):
+                    suffix = f"_{k}" if len(images) > 1 else ""
+                    path = output_dir / "images" / f"{index:05d}_{job['id']}{suffix}.png"
+                    _save_png(image, path)
+                    paths.append(str(path.relative_to(output_dir)))
+                entry.update(status="ok", paths=paths)
+                images_written += len(paths)
+            except (EngineError, OSError) as e:
+                entry.update(status="failed", error=str(e))
+                logger.warning("Row %d failed: %s", index, e)
+            except Exception as e:
+                entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+                logger.exception("Row %d failed while saving", index)
+            entry["seconds"] = seconds
+            entry["time"] = datetime.datetime.now().isoformat()
+            _append_progress(progress_path, entry)
+            progress[index] = entry
+            item_seconds.append(seconds)
+            logger.info("[%d/%d] row %d %s in %.1f s", n, len(jobs), index, entry["status"], seconds)
+    except KeyboardInterrupt:
+        interrupted = True
+        logger.warning("Interrupted; rerun the same command to resume.")
+
+    summary = summarize_run(rows, progress, item_seconds, images_written, time.perf_counter() - start, interrupted)
+    (output_dir / "summary.json").write_text(json.dumps(summary, indent=2))
+    print(json.dumps(summary, indent=2))
+    if interrupted:
+        return 130
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
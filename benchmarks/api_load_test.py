@@ -0,0 +1,140 @@
+import argparse
+import base64
+import io
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import host_info, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Load test for api_server.py: concurrent clients against an in-process server
+# backed by tiny random-weight pipelines, with dynamic batching off (batch 1)
+# and on, so the gain from merging requests is measured on the same box.
+#
+#   python -m benchmarks.api_load_test --clients 8 --requests 4 --max-batch-size 4
+
+
+def _image_b64(size, seed=0):
+    rng = np.random.default_rng(seed)
+    buffered = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def _request_body(args, client, n):
+    body = {"prompt": f"load test {client}-{n}", "seed": client * 1000 + n, "steps": args.steps}
+    if args.op == "text2img":
+        body.update(width=args.size, height=args.size)
+    else:
+        body["image"] = _image_b64(args.size, client)
+        if args.op == "inpaint":
+            mask = Image.new("L", (args.size, args.size), 0)
+            mask.paste(255, (args.size // 4, args.size // 4, 3 * args.size // 4, 3 * args.size // 4))
+            buffered = io.BytesIO()
+            mask.save(buffered, format="PNG")
+            body["mask"] = base64.b64encode(buffered.getvalue()).decode()
+    return json.dumps(body).encode()
+
+
+def run_load(args, max_batch_size):
+    from api_server import DynamicBatcher, PipelineRunner, make_server
+
+    pipes = {}
+    def loader(kind, model_id):
+        if kind not in pipes:
+            pipes[kind] = build_tiny_pipeline(kind)
+        return pipes[kind]
+
+    batcher = DynamicBatcher(PipelineRunner(pipeline_loader=loader), max_batch_size=max_batch_size,
+                             max_wait_ms=args.max_wait_ms, max_queue=args.clients * args.requests)
+    server = make_server("127.0.0.1", 0, batcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/{args.op}"
+    bodies = {(c, n): _request_body(args, c, n) for c in range(args.clients) for n in range(args.requests)}
+
+    def post(body):
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            return json.loads(resp.read())
+
+    try:
+        post(bodies[(0, 0)]) # Warm-up: loads the pipeline
+        latencies, batch_sizes, errors = [], [], []
+        lock = threading.Lock()
+
+        def client(c):
+            for n in range(args.requests):
+                start = time.perf_counter()
+                try:
+                    response = post(bodies[(c, n)])
+                except (urllib.error.URLError, OSError) as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    batch_sizes.append(response["batch_size"])
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(c,)) for c in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+    latencies.sort()
+    return {
+        "max_batch_size": max_batch_size,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else None,
+        "latency_s": summarize(latencies),
+        "latency_p95_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        "mean_batch_size": statistics.mean(batch_sizes) if batch_sizes else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of api_server.py with and without dynamic batching.")
+    parser.add_argument("--op", choices=["text2img", "img2img", "inpaint"], default="text2img")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--max-wait-ms", type=float, default=50)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    runs = []
+    for max_batch_size in sorted({1, args.max_batch_size}):
+        print(f"Load test with max_batch_size={max_batch_size}...", file=sys.stderr)
+        runs.append(run_load(args, max_batch_size))
+    results = {"host": host_info(), "config": vars(args), "runs": runs}
+    if len(runs) == 2 and runs[0]["requests_per_s"]:
+        results["throughput_gain"] = runs[1]["requests_per_s"] / runs[0]["requests_per_s"]
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Quality/speed report for CFG truncation (speedups.py) at fixed seeds: total time,
+# UNet work (batch items through the UNet) and drift against full guidance, per
+# fraction of guided steps.
+#
+#   python -m benchmarks.cfg_truncation_report --model-id runwayml/stable-diffusion-v1-5 --steps 30 --fractions 1,0.6,0.5,0.35
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+class UnetWork:
+    # Counts batch items through the UNet: doubled-batch (guided) steps count twice
+    def __init__(self, unet):
+        self.items = 0
+        self._handle = unet.register_forward_pre_hook(self._pre)
+
+    def _pre(self, module, args):
+        self.items += args[0].shape[0]
+
+    def remove(self):
+        self._handle.remove()
+
+
+def run(pipe, args, seeds, fraction):
+    import engine
+    speedups = {"cfg_truncation": fraction}
+    engine.text2img(pipe, args.prompt, "", seeds[0], args.guidance_scale, args.steps, args.size, args.size, speedups=speedups) # warm-up
+    images, totals, work = {}, [], []
+    for seed in seeds:
+        counter = UnetWork(pipe.unet)
+        start = time.perf_counter()
+        try:
+            result = engine.text2img(pipe, args.prompt, "", seed, args.guidance_scale, args.steps, args.size, args.size, speedups=speedups)
+        finally:
+            counter.remove()
+        totals.append(time.perf_counter() - start)
+        work.append(counter.items)
+        images[seed] = result.image
+        if args.image_dir:
+            result.image.save(Path(args.image_dir) / f"cfg{fraction}_seed{seed}.png")
+    return images, {"total_s": summarize(totals), "unet_items": summarize(work)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quality vs speed of classifier-free-guidance truncation at fixed seeds.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--seeds", default="0,1,2")
+    parser.add_argument("--fractions", default="1,0.75,0.5,0.35", help="Fractions of steps that keep guidance (1 = baseline)")
+    parser.add_argument("--image-dir", help="Also save every image here")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    fractions = sorted({float(f) for f in args.fractions.split(",")} | {1.0}, reverse=True)
+    if args.image_dir:
+        Path(args.image_dir).mkdir(parents=True, exist_ok=True)
+
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    pipe = load_benchmark_pipeline(args)
+    results = {"host": host_info(), "config": vars(args), "fractions": {}}
+    baseline_images = baseline = None
+    for fraction in fractions:
+        print(f"Guidance for {fraction:.0%} of steps...", file=sys.stderr)
+        images, stats = run(pipe, args, seeds, fraction)
+        if fraction == 1.0:
+            baseline_images, baseline = images, stats
+        else:
+            drift = {seed: image_drift(baseline_images[seed], images[seed]) for seed in seeds}
+            stats.update(
+                speedup=baseline["total_s"]["median"] / stats["total_s"]["median"],
+                unet_work_saved=1 - stats["unet_items"]["median"] / baseline["unet_items"]["median"],
+                drift=drift,
+                mean_psnr=sum(d["psnr"] for d in drift.values()) / len(drift),
+            )
+        results["fractions"][str(fraction)] = stats
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import torch
+
+# Shared helpers for the benchmark scripts (run from the repo root: python -m benchmarks.<name>)
+
+
+def host_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+
+class StepTimer:
+    # Pass as callback_on_step_end; records a timestamp per denoising step
+    def __init__(self):
+        self.marks = []
+
+    def reset(self):
+        self.marks = [time.perf_counter()]
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        self.marks.append(time.perf_counter())
+        return callback_kwargs
+
+    def step_times(self):
+        return [b - a for a, b in zip(self.marks, self.marks[1:])]
+
+    def seconds_per_step(self):
+        # Median ignores the first step, which also pays for text encoding / setup
+        times = self.step_times()[1:] or self.step_times()
+        return statistics.median(times) if times else None
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+        "n": len(values),
+    }
+
+
+def image_drift(reference, candidate):
+    # Pixel drift between two PIL images of the same size: mean abs error (0-255) and PSNR (dB)
+    import numpy as np
+    a = np.asarray(reference.convert("RGB"), dtype=np.float32)
+    b = np.asarray(candidate.convert("RGB"), dtype=np.float32)
+    mse = float(np.mean((a - b) ** 2))
+    return {
+        "mae": float(np.mean(np.abs(a - b))),
+        "psnr": float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse)),
+    }
+
+
+def write_results(results, output=None):
+    text = json.dumps(results, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,39 @@
+import argparse
+import json
+
+# Diff two benchmarks.suite JSON files: median time per case and the after/before ratio.
+#
+#   python -m benchmarks.compare bench_before.json bench_after.json
+
+
+def _key(result):
+    return (result["name"], result.get("size"), result.get("batch"), result.get("count"))
+
+
+def _load(path):
+    with open(path) as f:
+        return {_key(r): r for r in json.load(f)["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark suite result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=1.10, help="Flag cases slower than this ratio")
+    args = parser.parse_args()
+
+    before, after = _load(args.before), _load(args.after)
+    print(f"{'case':<48} {'before':>10} {'after':>10} {'ratio':>7}")
+    for key in sorted(set(before) | set(after), key=lambda k: tuple(str(v) for v in k)):
+        label = " ".join(str(v) for v in key if v is not None)
+        if key not in before or key not in after:
+            print(f"{label:<48} {'(only in ' + ('after' if key in after else 'before') + ')':>29}")
+            continue
+        b, a = before[key]["time_s"]["median"], after[key]["time_s"]["median"]
+        ratio = a / b if b else float("inf")
+        flag = "  <-- slower" if ratio > args.threshold else ""
+        print(f"{label:<48} {b * 1000:>8.1f}ms {a * 1000:>8.1f}ms {ratio:>6.2f}x{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import subprocess
+import sys
+
+import torch
+
+from benchmarks.common import StepTimer, host_info, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+from performance import (
+    apply_cpu_perf, configure_cpu_threads, cpu_perf_options, default_thread_count,
+    inference_context, set_runtime_flags,
+)
+
+# CPU performance-mode benchmark: seconds per denoising step for each knob.
+# Every variant runs in a fresh subprocess so thread settings (inter-op threads
+# can only be set once per process) and compiled graphs never leak between runs.
+#
+#   python -m benchmarks.cpu_perf --model-id runwayml/stable-diffusion-v1-5 --steps 10 --size 512
+
+
+def build_variants(thread_counts):
+    base = {"num_threads": 0, "num_interop_threads": 0, "channels_last": False, "bf16_autocast": False, "compile_unet": False}
+    variants = [("baseline", base)]
+    for threads in thread_counts:
+        variants.append((f"threads={threads}", {**base, "num_threads": threads}))
+    variants += [
+        ("channels_last", {**base, "channels_last": True}),
+        ("bf16_autocast", {**base, "bf16_autocast": True}),
+        ("compile_unet", {**base, "compile_unet": True}),
+        ("all", {**base, "channels_last": True, "bf16_autocast": True, "compile_unet": True}),
+    ]
+    return variants
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    return StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+
+
+def run_variant(args, options):
+    options = cpu_perf_options(options)
+    threads = configure_cpu_threads(options["num_threads"], options["num_interop_threads"])
+    pipe = load_benchmark_pipeline(args).to("cpu")
+    pipe.set_progress_bar_config(disable=True)
+    apply_cpu_perf(pipe, options) # includes the warm-up run when compiling
+    set_runtime_flags(pipe, bf16_autocast=options["bf16_autocast"])
+
+    timer = StepTimer()
+    s_per_step, totals = [], []
+    for i in range(args.repeats + 1): # first run is an untimed warm-up
+        timer.reset()
+        with inference_context(pipe):
+            pipe(
+                prompt=args.prompt,
+                num_inference_steps=args.steps,
+                width=args.size, height=args.size,
+                generator=torch.Generator("cpu").manual_seed(args.seed),
+                output_type="latent",
+                callback_on_step_end=timer,
+            )
+        if i:
+            s_per_step.append(timer.seconds_per_step())
+            totals.append(timer.marks[-1] - timer.marks[0])
+    return {
+        "options": options,
+        "threads": {"intra_op": threads[0], "inter_op": threads[1]},
+        "s_per_step": summarize(s_per_step),
+        "denoise_s": summarize(totals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU performance-mode knobs (s/step).")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", default="", help="Comma-separated intra-op thread counts to try (default: all cores and half)")
+    parser.add_argument("--variants", default="", help="Comma-separated subset of variant names to run")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--run-variant", help=argparse.SUPPRESS) # internal: JSON options for one subprocess run
+    args = parser.parse_args()
+
+    if args.run_variant:
+        print(json.dumps(run_variant(args, json.loads(args.run_variant))))
+        return
+
+    cores = default_thread_count()
+    thread_counts = [int(t) for t in args.threads.split(",") if t.strip()] or sorted({cores, max(1, cores // 2)})
+    selected = {v.strip() for v in args.variants.split(",") if v.strip()}
+
+    passthrough = [
+        "--model-id", args.model_id, "--prompt", args.prompt, "--steps", str(args.steps),
+        "--size", str(args.size), "--seed", str(args.seed), "--repeats", str(args.repeats),
+    ]
+    results = {"host": host_info(), "config": vars(args), "variants": {}}
+    for name, options in build_variants(thread_counts):
+        if selected and name not in selected:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.cpu_perf", *passthrough, "--run-variant", json.dumps(options)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            results["variants"][name] = {"options": options, "error": proc.stderr.strip().splitlines()[-1:]}
+            continue
+        results["variants"][name] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from normalize import normalize_image, open_normalized
+
+# Upload decode benchmark: full-resolution decode + normalize_image (the old path)
+# against normalize.open_normalized (JPEG draft-mode decode + one LANCZOS resample).
+# Each (file, method) pair runs in a fresh subprocess so peak RSS is not masked
+# by an earlier run's high-water mark.
+#
+#   python -m benchmarks.decode --max-size 512 1024                # synthetic 12 MP / 24 MP JPEGs
+#   python -m benchmarks.decode --images ~/DCIM/IMG_0001.JPG ...   # real camera files
+
+SYNTHETIC_SIZES = [(4032, 3024), (6000, 4000)]
+METHODS = {
+    "full_decode": lambda path, max_size: normalize_image(Image.open(path).convert("RGB"), max_size),
+    "draft_decode": lambda path, max_size: open_normalized(path, max_size),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_synthetic_jpeg(size, directory, seed=0):
+    # Smooth gradients plus noise: decodes like a photo, not like a flat test card
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    path = Path(directory) / f"synthetic_{width}x{height}.jpg"
+    Image.fromarray(pixels).save(path, format="JPEG", quality=92)
+    return path
+
+
+def run_method(path, method, max_size, repeats):
+    decode = METHODS[method]
+    rss_before = _peak_rss_mb()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        image = decode(path, max_size)
+        times.append(time.perf_counter() - start)
+    return {"decode_s": summarize(times), "peak_rss_delta_mb": _peak_rss_mb() - rss_before, "size": image.size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode time and peak memory of full vs draft-mode upload decoding.")
+    parser.add_argument("--images", nargs="*", help="JPEG files to test (default: synthetic 12 MP and 24 MP JPEGs)")
+    parser.add_argument("--max-size", type=int, nargs="+", default=[512, 1024])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--run-method", nargs=3, help=argparse.SUPPRESS) # internal: path method max_size
+    args = parser.parse_args()
+
+    if args.run_method:
+        path, method, max_size = args.run_method
+        print(json.dumps(run_method(path, method, int(max_size), args.repeats)))
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_decode_")
+    paths = [Path(p) for p in args.images] if args.images else [make_synthetic_jpeg(s, tmp_dir) for s in SYNTHETIC_SIZES]
+    results = {"host": host_info(), "config": vars(args), "files": []}
+    for path in paths:
+        with Image.open(path) as probe:
+            entry = {"file": str(path), "format": probe.format, "size": probe.size, "runs": []}
+        for max_size in args.max_size:
+            run = {"max_size": max_size}
+            for method in METHODS:
+                print(f"{path.name} @ {max_size}: {method}...", file=sys.stderr)
+                proc = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.decode", "--repeats", str(args.repeats),
+                     "--run-method", str(path), method, str(max_size)],
+                    capture_output=True, text=True,
+                )
+                if proc.returncode != 0:
+                    run[method] = {"error": proc.stderr.strip().splitlines()[-1:]}
+                    continue
+                run[method] = json.loads(proc.stdout.strip().splitlines()[-1])
+            if "decode_s" in run["full_decode"] and "decode_s" in run["draft_decode"]:
+                run["speedup"] = run["full_decode"]["decode_s"]["median"] / run["draft_decode"]["decode_s"]["median"]
+                # Output drift of the fast path against the full-resolution reference
+                run["drift"] = image_drift(METHODS["full_decode"](path, max_size), METHODS["draft_decode"](path, max_size))
+            entry["runs"].append(run)
+        results["files"].append(entry)
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
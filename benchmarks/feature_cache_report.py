@@ -0,0 +1,87 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Quality/speed report for the feature cache (feature_cache.py) at fixed seeds:
+# total time, UNet calls that reused cached deep features, and drift against the
+# uncached run, per full-UNet interval. Interval 1 is the baseline (cache off).
+#
+#   python -m benchmarks.feature_cache_report --model-id runwayml/stable-diffusion-v1-5 --steps 30 --intervals 2,3,5
+#   python -m benchmarks.feature_cache_report --model-id tiny --size 64 # offline smoke run
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def run(pipe, args, seeds, interval):
+    import engine
+    speedups = {"feature_cache": interval > 1, "feature_cache_interval": interval if interval > 1 else 0}
+    engine.text2img(pipe, args.prompt, "", seeds[0], args.guidance_scale, args.steps, args.size, args.size, speedups=speedups) # warm-up
+    images, totals, reused = {}, [], []
+    for seed in seeds:
+        start = time.perf_counter()
+        result = engine.text2img(pipe, args.prompt, "", seed, args.guidance_scale, args.steps, args.size, args.size, speedups=speedups)
+        totals.append(time.perf_counter() - start)
+        reused.append(result.metrics.get("feature_cache", {}).get("reused_steps", 0))
+        images[seed] = result.image
+        if args.image_dir:
+            result.image.save(Path(args.image_dir) / f"interval{interval}_seed{seed}.png")
+    return images, {"total_s": summarize(totals), "reused_unet_calls": summarize(reused)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quality vs speed of reusing deep UNet features across steps at fixed seeds.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--seeds", default="0,1,2")
+    parser.add_argument("--intervals", default="2,3,5", help="Full-UNet intervals to compare against the uncached baseline")
+    parser.add_argument("--image-dir", help="Also save every image here")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    intervals = sorted({int(i) for i in args.intervals.split(",")} | {1})
+    if args.image_dir:
+        Path(args.image_dir).mkdir(parents=True, exist_ok=True)
+
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    pipe = load_benchmark_pipeline(args)
+    results = {"host": host_info(), "config": vars(args), "intervals": {}}
+    baseline_images = baseline = None
+    for interval in intervals:
+        print(f"Full UNet every {interval} step(s)...", file=sys.stderr)
+        images, stats = run(pipe, args, seeds, interval)
+        if interval == 1:
+            baseline_images, baseline = images, stats
+        else:
+            drift = {seed: image_drift(baseline_images[seed], images[seed]) for seed in seeds}
+            stats.update(
+                speedup=baseline["total_s"]["median"] / stats["total_s"]["median"],
+                drift=drift,
+                mean_psnr=sum(d["psnr"] for d in drift.values()) / len(drift),
+            )
+        results["intervals"][str(interval)] = stats
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
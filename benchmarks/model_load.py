@@ -0,0 +1,89 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import host_info, summarize, write_results
+
+# Model load benchmark: from_pretrained time per model, cold (no manifest entry,
+# so the safetensors/variant format search runs) vs warm (manifest hit), with
+# parallel component loading off and on. Every load runs in a fresh subprocess
+# against a throwaway manifest; one untimed load first warms the OS page cache,
+# so the numbers compare load paths rather than disk reads.
+#
+#   python -m benchmarks.model_load                                       # tiny local models (.safetensors and .bin-only)
+#   python -m benchmarks.model_load --model-id runwayml/stable-diffusion-v1-5 --kind text2img
+
+
+def run_load(model_id, kind, manifest_path, parallel, forget):
+    import model_loader
+    from engine import pipeline_class_for
+    from lazy_imports import cuda_available, torch
+
+    model_loader.MODEL_MANIFEST_PATH = Path(manifest_path)
+    if forget:
+        model_loader.forget_model(model_id)
+    torch_dtype = torch.float16 if cuda_available() else torch.float32
+    _pipe, info = model_loader.load_from_pretrained(pipeline_class_for(kind), model_id, torch_dtype, parallel=parallel)
+    return info
+
+
+def _subprocess_load(model_id, kind, manifest_path, parallel, forget):
+    spec = json.dumps({"model_id": model_id, "kind": kind, "manifest_path": str(manifest_path), "parallel": parallel, "forget": forget})
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.model_load", "--run-load", spec], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_model(model_id, kind, repeats):
+    manifest_path = Path(tempfile.mkdtemp(prefix="bench_manifest_")) / "model_manifest.json"
+    _subprocess_load(model_id, kind, manifest_path, parallel=False, forget=True) # Page-cache warm-up
+    result = {"model_id": model_id, "kind": kind}
+    for parallel in (False, True):
+        for label, forget in (("cold", True), ("warm", False)):
+            runs = [_subprocess_load(model_id, kind, manifest_path, parallel, forget) for _ in range(repeats)]
+            ok = [r for r in runs if "error" not in r]
+            name = f"{label}{'_parallel' if parallel else ''}"
+            result[name] = {
+                "seconds": summarize([r["seconds"] for r in ok]),
+                "format": ok[0]["format"] if ok else None,
+                "failed_attempts": len(ok[0]["failed_attempts"]) if ok else None,
+                "errors": [r["error"] for r in runs if "error" in r],
+            }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold (format search) vs warm (manifest) model load times.")
+    parser.add_argument("--model-id", nargs="*", help="Hub IDs or local paths (default: tiny local models)")
+    parser.add_argument("--kind", choices=["text2img", "img2img", "inpaint"], default="text2img")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--run-load", help=argparse.SUPPRESS) # internal: JSON spec for one subprocess load
+    args = parser.parse_args()
+
+    if args.run_load:
+        print(json.dumps(run_load(**json.loads(args.run_load))))
+        return
+
+    model_ids = args.model_id
+    if not model_ids:
+        from benchmarks.tiny_pipelines import save_tiny_pipeline
+        tmp_dir = Path(tempfile.mkdtemp(prefix="bench_models_"))
+        model_ids = [
+            str(save_tiny_pipeline(tmp_dir / "tiny-safetensors", args.kind)),
+            str(save_tiny_pipeline(tmp_dir / "tiny-bin", args.kind, safe_serialization=False)), # cold path pays failed attempts
+        ]
+
+    results = {"host": host_info(), "config": vars(args), "models": []}
+    for model_id in model_ids:
+        print(f"Loading {model_id}...", file=sys.stderr)
+        results["models"].append(measure_model(model_id, args.kind, args.repeats))
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
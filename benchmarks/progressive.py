@@ -0,0 +1,87 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Draft-then-refine benchmark (engine.draft_settings / engine.refine) at fixed
+# seeds: time to first image and total time per accepted image, against one full
+# run, for 1..--max-drafts drafts before the accepted one. Drift is the refined
+# image against the full run from the same seed.
+#
+#   python -m benchmarks.progressive --model-id runwayml/stable-diffusion-v1-5 --steps 30 --size 512
+#   python -m benchmarks.progressive --model-id tiny --size 128 # offline smoke run
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first image and per accepted image: full runs vs draft-then-refine.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--seeds", default="0,1,2")
+    parser.add_argument("--max-drafts", type=int, default=3, help="Drafts looked at before accepting one")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    import engine
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    pipe = load_benchmark_pipeline(args)
+    draft_width, draft_height, draft_steps = engine.draft_settings(args.size, args.size, args.steps)
+    common = (args.prompt, "")
+    engine.text2img(pipe, *common, seeds[0], args.guidance_scale, args.steps, args.size, args.size) # warm-up
+
+    full_s, draft_s, refine_s, drift = [], [], [], {}
+    for seed in seeds:
+        print(f"Seed {seed}...", file=sys.stderr)
+        full, seconds = timed(engine.text2img, pipe, *common, seed, args.guidance_scale, args.steps, args.size, args.size)
+        full_s.append(seconds)
+        draft, seconds = timed(engine.text2img, pipe, *common, seed, args.guidance_scale, draft_steps, draft_width, draft_height, keep_latents=True)
+        draft_s.append(seconds)
+        refined, seconds = timed(engine.refine, pipe, draft.latents, *common, seed, args.guidance_scale, args.steps, args.size, args.size)
+        refine_s.append(seconds)
+        drift[seed] = image_drift(full.image, refined.image)
+
+    full, draft, refine = (summarize(v)["median"] for v in (full_s, draft_s, refine_s))
+    results = {
+        "host": host_info(), "config": vars(args),
+        "draft": {"width": draft_width, "height": draft_height, "steps": draft_steps},
+        "full_s": summarize(full_s), "draft_s": summarize(draft_s), "refine_s": summarize(refine_s),
+        "time_to_first_image_speedup": full / draft,
+        # Looking at n candidates: n full runs, or n drafts + one refine
+        "per_accepted_image": {
+            str(n): {"full_s": n * full, "progressive_s": n * draft + refine, "speedup": n * full / (n * draft + refine)}
+            for n in range(1, args.max_drafts + 1)
+        },
+        "drift_vs_full_run": drift,
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.common import StepTimer, host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+from quantization import QUANTIZED_COMPONENTS, module_size_bytes, quantize_module
+
+# Quality/latency report: fp32 vs dynamic-int8 pipeline at fixed seeds.
+#
+#   python -m benchmarks.quantization_report --model-id runwayml/stable-diffusion-v1-5 --seeds 0,1,2 --image-dir quant_report/
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def generate(pipe, args, seed):
+    timer = StepTimer()
+    timer.reset()
+    start = time.perf_counter()
+    with torch.inference_mode():
+        image = pipe(
+            prompt=args.prompt,
+            num_inference_steps=args.steps,
+            width=args.size, height=args.size,
+            generator=torch.Generator("cpu").manual_seed(seed),
+            callback_on_step_end=timer,
+        ).images[0]
+    return image, time.perf_counter() - start, timer.seconds_per_step()
+
+
+def run(pipe, args, seeds, label):
+    generate(pipe, args, seeds[0]) # warm-up
+    images, totals, steps = {}, [], []
+    for seed in seeds:
+        image, total, s_per_step = generate(pipe, args, seed)
+        images[seed] = image
+        totals.append(total)
+        steps.append(s_per_step)
+        if args.image_dir:
+            image.save(Path(args.image_dir) / f"{label}_seed{seed}.png")
+    sizes = {name: module_size_bytes(getattr(pipe, name)) for name in QUANTIZED_COMPONENTS}
+    return images, {"total_s": summarize(totals), "s_per_step": summarize(steps), "component_bytes": sizes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32 and dynamic-int8 pipelines at fixed seeds.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--seeds", default="0,1,2")
+    parser.add_argument("--image-dir", help="Also save fp32/int8 image pairs here")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    if args.image_dir:
+        Path(args.image_dir).mkdir(parents=True, exist_ok=True)
+
+    pipe = load_benchmark_pipeline(args)
+    print("Running fp32...", file=sys.stderr)
+    fp32_images, fp32_stats = run(pipe, args, seeds, "fp32")
+
+    start = time.perf_counter()
+    for name in QUANTIZED_COMPONENTS:
+        setattr(pipe, name, quantize_module(getattr(pipe, name)))
+    quantize_s = time.perf_counter() - start
+    print("Running int8...", file=sys.stderr)
+    int8_images, int8_stats = run(pipe, args, seeds, "int8")
+
+    drift = {seed: image_drift(fp32_images[seed], int8_images[seed]) for seed in seeds}
+    results = {
+        "host": host_info(),
+        "config": vars(args),
+        "fp32": fp32_stats,
+        "int8": {**int8_stats, "quantize_s": quantize_s},
+        "speedup": fp32_stats["s_per_step"]["median"] / int8_stats["s_per_step"]["median"],
+        "drift": drift,
+        "mean_psnr": sum(d["psnr"] for d in drift.values()) / len(drift),
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+from config import SCHEDULER_PRESETS
+
+# Sampler benchmark (schedulers.py): wall time to reach a comparable image per
+# preset at fixed seeds. For each preset, a --reference-steps run is that sampler's
+# converged image. "Comparable" is the fewest steps whose mean PSNR against it
+# reaches --target-psnr. Drift against the model-default scheduler's converged image
+# is reported too, since samplers converge to slightly different images.
+# Ancestral samplers ("Euler a") add fresh noise every step, so they may never reach
+# the target.
+#
+#   python -m benchmarks.schedulers --model-id runwayml/stable-diffusion-v1-5 --steps 8,12,15,20,30
+#   python -m benchmarks.schedulers --model-id tiny --size 64 --seeds 0 # offline smoke run
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img")
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def generate(pipe, args, seed, scheduler, steps):
+    import engine
+    start = time.perf_counter()
+    result = engine.text2img(pipe, args.prompt, "", seed, args.guidance_scale, steps, args.size, args.size, scheduler=scheduler)
+    return result.image, time.perf_counter() - start
+
+
+def run_preset(pipe, args, seeds, scheduler, step_counts, default_references):
+    generate(pipe, args, seeds[0], scheduler, step_counts[0]) # warm-up
+    references = {seed: generate(pipe, args, seed, scheduler, args.reference_steps)[0] for seed in seeds}
+    entry = {"recommended_steps": SCHEDULER_PRESETS[scheduler]["steps"], "steps": {}, "steps_to_target": None, "time_to_target_s": None}
+    for steps in step_counts:
+        images, totals = {}, []
+        for seed in seeds:
+            images[seed], seconds = generate(pipe, args, seed, scheduler, steps)
+            totals.append(seconds)
+        psnr = sum(image_drift(references[s], images[s])["psnr"] for s in seeds) / len(seeds)
+        psnr_default = sum(image_drift(default_references[s], images[s])["psnr"] for s in seeds) / len(seeds)
+        entry["steps"][str(steps)] = {"total_s": summarize(totals), "psnr_vs_converged": psnr, "psnr_vs_model_default": psnr_default}
+        if entry["steps_to_target"] is None and psnr >= args.target_psnr:
+            entry["steps_to_target"] = steps
+            entry["time_to_target_s"] = summarize(totals)["median"]
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall time to a comparable image across sampler presets.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--seeds", default="0,1")
+    parser.add_argument("--steps", default="8,12,15,20,25,30", help="Step counts to try per sampler")
+    parser.add_argument("--reference-steps", type=int, default=50, help="Steps of each sampler's converged reference image")
+    parser.add_argument("--target-psnr", type=float, default=30.0, help="PSNR (dB) against the converged image that counts as comparable")
+    parser.add_argument("--presets", default="", help="Comma-separated subset of SCHEDULER_PRESETS names")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    step_counts = sorted(int(s) for s in args.steps.split(","))
+    selected = [p.strip() for p in args.presets.split(",") if p.strip()] or list(SCHEDULER_PRESETS)
+
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    pipe = load_benchmark_pipeline(args)
+    default_references = {seed: generate(pipe, args, seed, "Model default", args.reference_steps)[0] for seed in seeds}
+    results = {"host": host_info(), "config": vars(args), "presets": {}}
+    for scheduler in selected:
+        print(f"{scheduler}...", file=sys.stderr)
+        try:
+            results["presets"][scheduler] = run_preset(pipe, args, seeds, scheduler, step_counts, default_references)
+        except Exception as e: # e.g. a scheduler class this diffusers version lacks
+            results["presets"][scheduler] = {"error": str(e)}
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
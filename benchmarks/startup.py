@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import write_results
+
+# App startup benchmark: import time of each module on the app's startup path,
+# measured with `python -X importtime` in a fresh interpreter per module, plus
+# which heavy ML packages that import dragged in.
+#
+#   python -m benchmarks.startup                          # current tree
+#   python -m benchmarks.startup --baseline-ref HEAD~1    # before/after, baseline from a git worktree
+
+STARTUP_MODULES = [
+    "config", "utils", "projects", "latent_cache", "performance", "memory_planner", "instrumentation",
+    "models", "processing", "engine",
+    "modes.inpainting", "modes.text2img", "modes.editor", "modes.restore", "modes.batch", "modes.projects_display",
+]
+HEAVY_PACKAGES = ["torch", "diffusers", "transformers"]
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s?(\s*)(\S+)")
+
+
+def measure_module(module, cwd):
+    # -> cumulative import time (s) of `module` and the heavy packages it loaded
+    code = f"import json, sys; import {module}; print(json.dumps([p for p in {HEAVY_PACKAGES!r} if p in sys.modules]))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1:]}
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match and not match.group(3) and match.group(4) == module:
+            cumulative_us = int(match.group(2))
+    return {"import_s": cumulative_us / 1e6 if cumulative_us is not None else None,
+            "heavy_imports": json.loads(proc.stdout.strip().splitlines()[-1])}
+
+
+def measure_tree(cwd, modules, repeats):
+    results = {}
+    for module in modules:
+        print(f"{module}...", file=sys.stderr)
+        runs = [measure_module(module, cwd) for _ in range(repeats)]
+        errors = [r for r in runs if "error" in r]
+        if errors:
+            results[module] = errors[0]
+            continue
+        results[module] = {
+            "import_s": statistics.median(r["import_s"] for r in runs if r["import_s"] is not None),
+            "heavy_imports": runs[0]["heavy_imports"],
+        }
+    return results
+
+
+def _baseline_worktree(ref):
+    path = tempfile.mkdtemp(prefix="bench_startup_")
+    os.rmdir(path)
+    subprocess.run(["git", "worktree", "add", "--detach", path, ref], check=True, capture_output=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-module import time of the app's startup path.")
+    parser.add_argument("--modules", nargs="+", default=STARTUP_MODULES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline-ref", help="Also measure this git ref (checked out in a temporary worktree)")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parent.parent
+    results = {"python": sys.version.split()[0], "config": vars(args), "after": measure_tree(repo_root, args.modules, args.repeats)}
+    if args.baseline_ref:
+        worktree = _baseline_worktree(args.baseline_ref)
+        try:
+            results["before"] = measure_tree(worktree, args.modules, args.repeats)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+        results["speedup"] = {
+            module: results["before"][module]["import_s"] / results["after"][module]["import_s"]
+            for module in args.modules
+            if results["before"][module].get("import_s") and results["after"][module].get("import_s")
+        }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.common import host_info, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Offline performance-regression suite. Uses tiny random-weight pipelines, so it
+# needs no downloads and measures our own overhead (processing, caching, batch
+# loops, image utilities, project listing) rather than model FLOPs.
+#
+#   python -m benchmarks.suite --output bench_before.json
+#   python -m benchmarks.suite --output bench_after.json
+#   python -m benchmarks.compare bench_before.json bench_after.json
+
+
+def _produced(result):
+    # process_* report failures via st.error and return (None, seed); never time that path
+    if result[0] is None:
+        raise RuntimeError("Generation returned no image (see the error above).")
+    return result
+
+
+def _timed(fn, repeats):
+    fn() # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def _test_image(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+
+
+def _test_mask(size):
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse([size // 4, size // 4, 3 * size // 4, 3 * size // 4], fill=255)
+    return mask
+
+
+def bench_generation(args, results):
+    from processing import process_img2img, process_inpainting, process_text2img
+
+    pipes = {kind: build_tiny_pipeline(kind) for kind in ("text2img", "img2img", "inpaint")}
+    common = {"negative_prompt": "", "guidance_scale": 7.5, "num_inference_steps": args.steps}
+    for size in args.sizes:
+        image, mask = _test_image(size), _test_mask(size)
+        for batch in args.batches:
+            results.append({"name": "process_text2img", "size": size, "batch": batch, "time_s": _timed(
+                lambda: _produced(process_text2img(pipes["text2img"], args.prompt, seed=0, width=size, height=size, num_images=batch, **common)),
+                args.repeats)})
+        results.append({"name": "process_img2img", "size": size, "batch": 1, "time_s": _timed(
+            lambda: _produced(process_img2img(pipes["img2img"], image, args.prompt, seed=0, strength=0.75, **common)), args.repeats)})
+        results.append({"name": "process_inpainting", "size": size, "batch": 1, "time_s": _timed(
+            lambda: _produced(process_inpainting(pipes["inpaint"], image, mask, args.prompt, seed=0, strength=1.0, **common)), args.repeats)})
+    return pipes
+
+
+def bench_batch_paths(args, results, pipes):
+    # Same per-item work as the loops in modes/batch.py
+    from processing import process_img2img, process_inpainting, process_text2img
+
+    common = {"negative_prompt": "", "guidance_scale": 7.5, "num_inference_steps": args.steps}
+    size = args.sizes[0]
+    for count in args.batch_counts:
+        images = [_test_image(size, seed=i) for i in range(count)]
+        mask = _test_mask(size)
+
+        def batch_inpaint():
+            for i, img in enumerate(images):
+                resized_mask = mask.resize(img.size, Image.NEAREST)
+                _produced(process_inpainting(pipes["inpaint"], img, resized_mask, args.prompt, seed=i, strength=1.0, **common))
+
+        def batch_text2img():
+            for i in range(count):
+                _produced(process_text2img(pipes["text2img"], f"{args.prompt}, variation {i}", seed=i, width=size, height=size, num_images=1, **common))
+
+        def batch_enhance():
+            for i, img in enumerate(images):
+                _produced(process_img2img(pipes["img2img"], img, args.prompt, seed=i, strength=0.75, **common))
+
+        for name, fn in (("batch_inpaint", batch_inpaint), ("batch_text2img", batch_text2img), ("batch_enhance", batch_enhance)):
+            timing = _timed(fn, max(1, args.repeats // 2))
+            results.append({"name": name, "size": size, "batch": count, "time_s": timing,
+                            "images_per_min": 60 * count / timing["median"]})
+
+
+def bench_editor(args, results):
+    from utils import apply_basic_adjustments, apply_filter
+
+    filters = ["Blur", "Sharpen", "Grayscale", "Sepia", "Edge Enhance", "Emboss"]
+    for size in args.editor_sizes:
+        image = _test_image(size)
+        results.append({"name": "editor_adjustments", "size": size, "time_s": _timed(
+            lambda: apply_basic_adjustments(image, 1.2, 1.1, 1.3, 0.9), args.repeats)})
+        for filter_name in filters:
+            results.append({"name": f"editor_filter_{filter_name}", "size": size, "time_s": _timed(
+                lambda: apply_filter(image, filter_name, 2.0), args.repeats)})
+
+
+def bench_projects(args, results):
+    import projects
+
+    for count in args.project_counts:
+        tmpdir = Path(tempfile.mkdtemp(prefix="bench_projects_"))
+        try:
+            for i in range(count):
+                data = {"id": str(i), "name": f"p{i}", "type": ["inpainting", "text2img", "restoration", "batch"][i % 4],
+                        "date": "2025-01-01T00:00:00", "params": {"prompt": "x" * 200}, "paths": [f"img_{i}.png"]}
+                (tmpdir / f"p{i}.json").write_text(json.dumps(data))
+            projects.PROJECTS_DIR = tmpdir
+
+            def list_and_filter():
+                # What the Project Manager does per tab: list, then load each project to filter by type
+                names = projects.load_projects()
+                return [n for n in names if (projects.load_project(n) or {}).get("type") == "text2img"]
+
+            results.append({"name": "projects_load_list", "count": count, "time_s": _timed(projects.load_projects, args.repeats)})
+            results.append({"name": "projects_list_and_filter", "count": count, "time_s": _timed(list_and_filter, args.repeats)})
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite on tiny random-weight pipelines.")
+    parser.add_argument("--prompt", default="a tiny benchmark prompt")
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--sizes", default="64,128,256")
+    parser.add_argument("--batches", default="1,2,4", help="num_images for process_text2img")
+    parser.add_argument("--batch-counts", default="4,16", help="Items per batch-mode run")
+    parser.add_argument("--editor-sizes", default="512,1024,2048")
+    parser.add_argument("--project-counts", default="10,100,500")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", default="", help="Comma-separated groups: generation,batch,editor,projects")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+    for name in ("sizes", "batches", "batch_counts", "editor_sizes", "project_counts"):
+        setattr(args, name, [int(v) for v in getattr(args, name).split(",") if v.strip()])
+    groups = {g.strip() for g in args.only.split(",") if g.strip()} or {"generation", "batch", "editor", "projects"}
+
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    results = []
+    pipes = None
+    if "generation" in groups or "batch" in groups:
+        print("Benchmarking generation...", file=sys.stderr)
+        pipes = bench_generation(args, results) if "generation" in groups else {
+            kind: build_tiny_pipeline(kind) for kind in ("text2img", "img2img", "inpaint")}
+    if "batch" in groups:
+        print("Benchmarking batch paths...", file=sys.stderr)
+        bench_batch_paths(args, results, pipes)
+    if "editor" in groups:
+        print("Benchmarking editor filters...", file=sys.stderr)
+        bench_editor(args, results)
+    if "projects" in groups:
+        print("Benchmarking project listing...", file=sys.stderr)
+        bench_projects(args, results)
+
+    write_results({"host": host_info(), "config": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import tempfile
+from pathlib import Path
+
+import torch
+
+# Tiny random-weight Stable Diffusion pipelines built locally from configs (no network).
+# Same architecture family as SD 1.x (cross-attention at the highest-resolution
+# levels, VAE downsampling x8, CLIP text encoder), just very narrow, so shape-
+# dependent costs scale like the real models while a step takes milliseconds.
+
+TINY_MODEL_ID = "tiny-random/stable-diffusion"
+TINY_INPAINT_MODEL_ID = "tiny-random/stable-diffusion-inpainting"
+
+
+def _bytes_to_unicode():
+    # GPT-2/CLIP byte -> printable character table (a private transformers helper, gone in 5.x)
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(2**8):
+        if b not in bs:
+            bs.append(b)
+            cs.append(2**8 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+def _tiny_tokenizer():
+    from transformers import CLIPTokenizer
+
+    # Byte-level vocabulary without merges: every character is a token
+    chars = list(_bytes_to_unicode().values())
+    vocab = chars + [c + "</w>" for c in chars] + ["<|startoftext|>", "<|endoftext|>"]
+    tmpdir = Path(tempfile.mkdtemp(prefix="tiny_tokenizer_"))
+    vocab_file = tmpdir / "vocab.json"
+    merges_file = tmpdir / "merges.txt"
+    vocab_file.write_text(json.dumps({token: i for i, token in enumerate(vocab)}))
+    merges_file.write_text("#version: 0.2\n")
+    # model_max_length matches the text encoder's positions; the default (no limit) breaks padding
+    return CLIPTokenizer(str(vocab_file), str(merges_file), model_max_length=77), len(vocab)
+
+
+def tiny_components(inpaint=False, seed=0):
+    from diffusers import AutoencoderKL, PNDMScheduler, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(seed)
+    tokenizer, vocab_size = _tiny_tokenizer()
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=vocab_size, hidden_size=32, intermediate_size=64,
+        num_attention_heads=4, num_hidden_layers=2, max_position_embeddings=77,
+        bos_token_id=vocab_size - 2, eos_token_id=vocab_size - 1, pad_token_id=vocab_size - 1,
+    ))
+    unet = UNet2DConditionModel(
+        sample_size=8,
+        in_channels=9 if inpaint else 4,
+        out_channels=4,
+        layers_per_block=1,
+        block_out_channels=(32, 64, 64),
+        down_block_types=("CrossAttnDownBlock2D", "CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=32,
+        attention_head_dim=4,
+        norm_num_groups=32,
+    )
+    vae = AutoencoderKL(
+        in_channels=3, out_channels=3, latent_channels=4,
+        block_out_channels=(32, 32, 64, 64),
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        layers_per_block=1,
+        norm_num_groups=32,
+        sample_size=64,
+    )
+    scheduler = PNDMScheduler(
+        beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+        skip_prk_steps=True, set_alpha_to_one=False, steps_offset=1,
+    )
+    return {
+        "unet": unet, "vae": vae, "text_encoder": text_encoder, "tokenizer": tokenizer,
+        "scheduler": scheduler, "safety_checker": None, "feature_extractor": None,
+    }
+
+
+def build_tiny_pipeline(kind="text2img", seed=0):
+    from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionInpaintPipeline, StableDiffusionPipeline
+
+    pipeline_class = {
+        "text2img": StableDiffusionPipeline,
+        "img2img": StableDiffusionImg2ImgPipeline,
+        "inpaint": StableDiffusionInpaintPipeline,
+    }[kind]
+    pipe = pipeline_class(**tiny_components(inpaint=kind == "inpaint", seed=seed), requires_safety_checker=False)
+    pipe.register_to_config(_name_or_path=TINY_INPAINT_MODEL_ID if kind == "inpaint" else TINY_MODEL_ID)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def load_tiny_pipeline(kind, model_id=None, cpu_options=None):
+    # pipeline_factory for worker_pool (picklable, applies the worker's thread budget)
+    from performance import configure_cpu_threads, cpu_perf_options
+    options = cpu_perf_options(cpu_options)
+    configure_cpu_threads(options["num_threads"], options["num_interop_threads"])
+    return build_tiny_pipeline(kind)
+
+
+def save_tiny_pipeline(path, kind="text2img", seed=0, safe_serialization=True):
+    # A from_pretrained-loadable copy, e.g. for models.load_pipeline or --model-id
+    pipe = build_tiny_pipeline(kind, seed)
+    pipe.save_pretrained(path, safe_serialization=safe_serialization)
+    return Path(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Save a tiny random-weight pipeline to disk.")
+    parser.add_argument("path")
+    parser.add_argument("--kind", choices=["text2img", "img2img", "inpaint"], default="text2img")
+    args = parser.parse_args()
+    print(save_tiny_pipeline(args.path, args.kind))
@@ -0,0 +1,112 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+import torch
+
+from benchmarks.common import StepTimer, host_info, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Token merging benchmark (token_merging.py): seconds per denoising step and peak
+# memory per output size and merge ratio. Every (size, ratio) pair runs in a fresh
+# subprocess so peak RSS / peak CUDA memory is not masked by an earlier, larger run.
+#
+#   python -m benchmarks.token_merging --model-id runwayml/stable-diffusion-v1-5 --sizes 512,768,1024 --ratios 0,0.3,0.5
+#   python -m benchmarks.token_merging --model-id tiny --sizes 256,512 --min-tokens 0 # offline smoke run
+
+
+def load_benchmark_pipeline(args, device):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline("text2img").to(device)
+    from diffusers import StableDiffusionPipeline
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    pipe = StableDiffusionPipeline.from_pretrained(args.model_id, torch_dtype=dtype, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to(device)
+
+
+def run_case(args, size, ratio):
+    import token_merging
+    from performance import inference_context
+    if args.min_tokens is not None:
+        token_merging.TOKEN_MERGING_MIN_TOKENS = args.min_tokens
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipe = load_benchmark_pipeline(args, device)
+    merging = token_merging.set_token_merging(pipe, ratio)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+
+    timer = StepTimer()
+    s_per_step = []
+    for i in range(args.repeats + 1): # first run is an untimed warm-up
+        timer.reset()
+        with inference_context(pipe):
+            pipe(
+                prompt=args.prompt,
+                num_inference_steps=args.steps,
+                width=size, height=size,
+                generator=torch.Generator("cpu").manual_seed(args.seed),
+                output_type="latent",
+                callback_on_step_end=timer,
+            )
+        if i:
+            s_per_step.append(timer.seconds_per_step())
+    return {
+        "merging_active": merging,
+        "s_per_step": summarize(s_per_step),
+        "peak_rss_delta_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, # KB on Linux
+        "peak_cuda_mb": torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="s/step and peak memory of UNet token merging across sizes.")
+    parser.add_argument("--model-id", default="runwayml/stable-diffusion-v1-5", help='Hub ID, local path, or "tiny" for the offline random-weight pipeline')
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--sizes", default="512,768,1024")
+    parser.add_argument("--ratios", default="0,0.3,0.5", help="Merge ratios (0 = baseline)")
+    parser.add_argument("--min-tokens", type=int, help="Override TOKEN_MERGING_MIN_TOKENS (e.g. 0 to merge at any size)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--run-case", nargs=2, help=argparse.SUPPRESS) # internal: size ratio for one subprocess run
+    args = parser.parse_args()
+
+    if args.run_case:
+        size, ratio = args.run_case
+        print(json.dumps(run_case(args, int(size), float(ratio))))
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    ratios = sorted({float(r) for r in args.ratios.split(",")} | {0.0})
+    passthrough = [
+        "--model-id", args.model_id, "--prompt", args.prompt, "--steps", str(args.steps),
+        "--seed", str(args.seed), "--repeats", str(args.repeats),
+    ] + (["--min-tokens", str(args.min_tokens)] if args.min_tokens is not None else [])
+    results = {"host": host_info(), "config": vars(args), "sizes": {}}
+    for size in sizes:
+        cases = {}
+        for ratio in ratios:
+            print(f"{size}px, ratio {ratio}...", file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.token_merging", *passthrough, "--run-case", str(size), str(ratio)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                cases[str(ratio)] = {"error": proc.stderr.strip().splitlines()[-1:]}
+                continue
+            cases[str(ratio)] = json.loads(proc.stdout.strip().splitlines()[-1])
+        baseline = cases.get("0.0", {}).get("s_per_step")
+        for ratio, case in cases.items():
+            if baseline and case.get("s_per_step") and ratio != "0.0":
+                case["speedup"] = baseline["median"] / case["s_per_step"]["median"]
+        results["sizes"][str(size)] = cases
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+
+from benchmarks.common import host_info, image_drift, summarize, write_results
+from benchmarks.tiny_pipelines import build_tiny_pipeline
+
+# Variation sweep benchmark (engine.text2img_variations / inpaint_variations):
+# time per variation for K seeds in one batched call vs K separate single-seed runs
+# (one "Generate Variation" click each). Drift checks that each batched variation is
+# the image its seed gives on its own.
+#
+#   python -m benchmarks.variations --kind text2img --counts 2,4,8
+#   python -m benchmarks.variations --model-id tiny --kind inpaint --size 128 # offline smoke run
+
+
+def load_benchmark_pipeline(args):
+    if args.model_id == "tiny":
+        return build_tiny_pipeline(args.kind)
+    from diffusers import StableDiffusionInpaintPipeline, StableDiffusionPipeline
+    pipeline_class = StableDiffusionInpaintPipeline if args.kind == "inpaint" else StableDiffusionPipeline
+    pipe = pipeline_class.from_pretrained(args.model_id, torch_dtype=torch.float32, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    return pipe.to("cpu")
+
+
+def _test_inputs(size):
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8))
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse([size // 4, size // 4, 3 * size // 4, 3 * size // 4], fill=255)
+    return image, mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-variation time: batched seed sweeps vs one run per seed.")
+    parser.add_argument("--model-id", default=None, help='Hub ID, local path, or "tiny" (default: DEFAULT_MODEL_IDS for --kind)')
+    parser.add_argument("--kind", choices=["text2img", "inpaint"], default="text2img")
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--strength", type=float, default=1.0, help="Inpainting strength")
+    parser.add_argument("--counts", default="2,4", help="Sweep sizes (seeds per batched call)")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    import engine
+    from config import DEFAULT_MODEL_IDS
+    # Keep benchmark runs out of the app's metrics log
+    import instrumentation
+    instrumentation.METRICS_LOG_PATH = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.jsonl"
+
+    args.model_id = args.model_id or DEFAULT_MODEL_IDS[args.kind]
+    pipe = load_benchmark_pipeline(args)
+    image, mask = _test_inputs(args.size)
+
+    def single(seed):
+        if args.kind == "inpaint":
+            return engine.inpaint(pipe, image, mask, args.prompt, "", seed, args.guidance_scale, args.steps, args.strength).image
+        return engine.text2img(pipe, args.prompt, "", seed, args.guidance_scale, args.steps, args.size, args.size).image
+
+    def sweep(seeds):
+        if args.kind == "inpaint":
+            return engine.inpaint_variations(pipe, image, mask, args.prompt, "", seeds, args.guidance_scale, args.steps, args.strength).images
+        return engine.text2img_variations(pipe, args.prompt, "", seeds, args.guidance_scale, args.steps, args.size, args.size).images
+
+    single(0) # warm-up
+    results = {"host": host_info(), "config": vars(args), "counts": {}}
+    for count in (int(c) for c in args.counts.split(",")):
+        print(f"{count} seeds...", file=sys.stderr)
+        seeds = list(range(count))
+        separate_s, batched_s = [], []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            separate_images = [single(seed) for seed in seeds]
+            separate_s.append((time.perf_counter() - start) / count)
+            start = time.perf_counter()
+            batched_images = sweep(seeds)
+            batched_s.append((time.perf_counter() - start) / count)
+        separate, batched = summarize(separate_s), summarize(batched_s)
+        results["counts"][str(count)] = {
+            "separate_per_variation_s": separate, "batched_per_variation_s": batched,
+            "speedup": separate["median"] / batched["median"],
+            # Batched kernels reorder float sums, so expect high but finite PSNR
+            "min_psnr_vs_separate": min(image_drift(a, b)["psnr"] for a, b in zip(separate_images, batched_images)),
+        }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,145 @@
 import streamlit as st
+import logging
 from pathlib import Path
 
 # --- Directories ---
 SAVE_DIR = Path("saved_images")
 PROJECTS_DIR = Path("projects")
+QUANT_CACHE_DIR = Path("model_cache") / "quantized" # int8 text encoder / UNet modules
+METRICS_LOG_PATH = Path("logs") / "metrics.jsonl" # Per-run stage timings / peak memory (JSON lines)
+PROFILES_DIR = Path("profiles") # Chrome traces + top-N operator tables from "Profile next run"
+BATCH_RUNS_DIR = Path("batch_runs") # batch_runner.py output (images + progress.jsonl checkpoints)
+BATCH_RESULTS_DIR = Path("batch_results") # Batch Processing mode results, one sub-directory per run
+WORKER_TUNING_PATH = Path("model_cache") / "worker_tuning.json" # Best workers x threads split per model (worker_pool.py)
+DEVICE_INFO_PATH = Path("model_cache") / "device_info.json" # Cached CUDA detection, so startup need not import torch
+MODEL_MANIFEST_PATH = Path("model_cache") / "model_manifest.json" # Working weight format + load timings per model/dtype
+
+# --- Headless entry points (batch_runner.py, api_server.py) ---
+DEFAULT_MODEL_IDS = {
+    "inpaint": "runwayml/stable-diffusion-inpainting",
+    "text2img": "runwayml/stable-diffusion-v1-5",
+    "img2img": "runwayml/stable-diffusion-v1-5",
+}
+API_HOST = "127.0.0.1"
+API_PORT = 8600
+API_MAX_BATCH_SIZE = 4 # Compatible concurrent requests merged into one pipeline call
+API_MAX_WAIT_MS = 50 # Batching window, measured from the oldest queued request
+API_MAX_QUEUE = 64 # Requests waiting beyond this are rejected with 503
+API_REQUEST_TIMEOUT_S = 600
+
+# --- Input Normalization (normalize.py) ---
+INPAINT_MAX_SIZE = 512 # Max side of inpainting inputs (app, batch runner)
+ENHANCE_MAX_SIZE = 1024 # Max side of restore/enhancement/img2img inputs
+INPUT_SIZE_MULTIPLE = 8 # Input sides are floored to this; 64 gives coarser size buckets (fewer distinct shapes)
+NORMALIZE_MEMO_MAX_ENTRIES = 32 # Normalized copies of in-memory images kept for reuse
+
+# --- Batch Processing ---
+BATCH_THUMBNAIL_SIZE = (256, 256) # Only these thumbnails stay in session state; full results are read from disk
+
+# --- Model Loading ---
+PARALLEL_COMPONENT_LOAD = False # Load UNet / VAE / text encoder concurrently; not thread-safe yet (model_loader.py)
+COMPONENT_LOAD_WORKERS = 4
+
+# --- Speedups (speedups.py) ---
+# Opt-in per-generation shortcuts; overridable from the sidebar "🚀 Speedups" expander.
+SPEEDUP_DEFAULTS = {
+    "cfg_truncation": 1.0,         # fraction of steps that keep classifier-free guidance (1.0 = off, 0.5 = ~25% less UNet work)
+    "cfg_skip_unit_scale": False,  # run without guidance when guidance_scale <= CFG_UNIT_SCALE_MAX
+    "feature_cache": False,        # reuse deep UNet features between full steps (feature_cache.py)
+    "feature_cache_interval": 0,   # full UNet every N steps (0 = per-model default below)
+    "token_merging": 0.0,          # fraction of self-attention tokens merged (token_merging.py; 0 = off, 0.3-0.5 typical)
+}
+CFG_UNIT_SCALE_MAX = 1.05
+# Feature cache: interval = full UNet every N steps, depth = resolution levels always recomputed
+FEATURE_CACHE_DEFAULT = {"enabled": True, "interval": 3, "depth": 1}
+FEATURE_CACHE_MODEL_DEFAULTS = { # First substring of the model ID that matches wins
+    "inpainting": {"interval": 2}, # Masked region drifts more when features go stale
+    "turbo": {"enabled": False},   # Distilled few-step models: every step matters
+    "lcm": {"enabled": False},
+}
+FEATURE_CACHE_MIN_STEPS = 10 # Below this, skipped steps cost more quality than they save
+
+# --- Samplers (schedulers.py) ---
+# Scheduler presets built from the loaded pipeline's own scheduler config (no reload).
+# "steps" is the recommended step count the sidebar switches to when a preset is picked.
+SCHEDULER_PRESETS = {
+    "Model default": {"class": None, "config": {}, "steps": 30},
+    "DPM++ 2M Karras": {"class": "DPMSolverMultistepScheduler", "config": {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True}, "steps": 15},
+    "DPM++ 2M": {"class": "DPMSolverMultistepScheduler", "config": {"algorithm_type": "dpmsolver++", "solver_order": 2}, "steps": 20},
+    "UniPC": {"class": "UniPCMultistepScheduler", "config": {}, "steps": 12},
+    "Euler": {"class": "EulerDiscreteScheduler", "config": {}, "steps": 20},
+    "Euler a": {"class": "EulerAncestralDiscreteScheduler", "config": {}, "steps": 25}, # Ancestral: adds noise every step, never converges to one image
+}
+DEFAULT_SCHEDULER = "Model default"
+
+# --- Latency Budget (deadline.py) ---
+DEADLINE_DEFAULT_S = 20.0 # Sidebar default seconds per image
+DEADLINE_HISTORY_RUNS = 50 # Matching runs (same model/device) the per-step cost is learned from
+DEADLINE_SCAN_RECORDS = 5000 # Tail of METRICS_LOG_PATH searched for them
+DEADLINE_MIN_STEPS = 12 # Below this, CFG truncation and smaller sizes are tried before fewer steps
+DEADLINE_CFG_TRUNCATION = 0.5 # Guided fraction of steps when guidance has to give (~25% less UNet work)
+DEADLINE_SCALES = (1.0, 0.75, 0.5) # Output size factors tried, largest first
+
+# --- Draft & Refine (progressive text2img / inpainting) ---
+DRAFT_SCALE = 0.5 # Draft size as a fraction of the requested size (1/4 of the pixels)
+DRAFT_STEPS = 10 # Max denoising steps of a draft
+REFINE_STRENGTH = 0.55 # Fraction of the steps re-run at full size from the upscaled draft latents
+
+# --- Variation Sweeps ("Generate Variations" in text2img / inpainting) ---
+VARIATION_COUNT = 4 # Default seeds per sweep, generated in one batched pipeline call
+VARIATION_MAX_COUNT = 8 # Sweep size cap (memory_planner slices attention/VAE for large batches)
+
+# --- Project Latents (projects.py) ---
+# Text2img / inpainting projects can store final latents next to the JSON (float16 .npy,
+# memory-mapped on load) to re-decode or continue denoising without a full run.
+PROJECT_LATENTS_DEFAULT = True # "Include latents" default when saving a project
+PROJECT_INTERMEDIATE_LATENTS_EVERY = 0 # Also keep latents every N denoising steps (0 = final only)
+PROJECT_CONTINUE_STRENGTH = 0.3 # Fraction of the steps re-run when continuing from saved latents
+
+# --- Token Merging (token_merging.py) ---
+TOKEN_MERGING_MAX_DOWNSAMPLE = 1 # Only merge in blocks at the input latent resolution (2 = also the next level)
+TOKEN_MERGING_MIN_TOKENS = 96 * 96 # 768 px inputs and up; below that attention is not the bottleneck
+
+# --- Caches ---
+LATENT_CACHE_MAX_ENTRIES = 64 # Encoded img2img/inpainting inputs kept in memory
+LATENT_CACHE_MAX_BYTES = 256 * 1024 * 1024 # 256 MB cap (a 512x512 input is ~64 KB of float32 latents, ~32 KB in float16)
+UPLOAD_CACHE_MAX_ENTRIES = 128 # Decoded/resized uploads kept per session (upload_cache.py)
+
+# --- Memory Planner ---
+MEMORY_HEADROOM = 0.85 # Fraction of free device/host memory a single request may plan to use
+
+# --- Profiler ---
+PROFILE_FIRST_STEP = 2 # Denoising steps captured by "Profile next run" (1-based, inclusive)
+PROFILE_LAST_STEP = 5
+PROFILE_TOP_N = 30 # Rows in the operator table
+
+# --- CPU Performance Mode ---
+# Defaults for CPU hosts; overridable from the sidebar. Use benchmarks/cpu_perf.py to pick per host.
+CPU_PERF_DEFAULTS = {
+    "num_threads": 0,          # intra-op threads, 0 = torch default
+    "num_interop_threads": 0,  # inter-op threads, 0 = torch default (only settable once per process)
+    "channels_last": True,     # NHWC memory format for UNet/VAE convolutions
+    "bf16_autocast": False,    # bfloat16 autocast during generation (needs AVX512-BF16/AMX to pay off)
+    "compile_unet": False,     # torch.compile the UNet at load time (followed by a warm-up run)
+    "quantize_int8": False,    # dynamic int8 quantization of text encoder / UNet linear layers
+}
 
 # --- Create Directories ---
 def setup_directories():
     SAVE_DIR.mkdir(exist_ok=True)
     PROJECTS_DIR.mkdir(exist_ok=True)
 
+# --- Logging ---
+def setup_logging():
+    # App loggers live under "studio" (memory plans, metrics); keep third-party loggers untouched
+    logger = logging.getLogger("studio")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
 # --- Page Config ---
 def configure_page():
     st.set_page_config(
@@ -0,0 +1,130 @@
+import collections
+import functools
+import json
+import statistics
+
+import instrumentation
+from config import DEADLINE_HISTORY_RUNS, DEADLINE_SCAN_RECORDS, DEADLINE_MIN_STEPS, DEADLINE_SCALES, DEADLINE_CFG_TRUNCATION
+from normalize import normalized_size
+
+# --- Latency-budget ("deadline") planning ---
+# Cost model learned from the generation records in METRICS_LOG_PATH. Denoising
+# cost is taken as proportional to UNet work: steps x batch items (doubled while
+# classifier-free guidance is on) x pixels. One "unit" is one 512x512 batch item
+# through the UNet. The rest of a run (text encoding, VAE encode/decode, safety
+# checker) is taken as proportional to output pixels. Both rates are medians over
+# the last DEADLINE_HISTORY_RUNS matching runs.
+#
+# Matching runs are on the same device and model, preferably of the same kind.
+# Runs with the feature cache or token merging are skipped, because their
+# per-step cost is not the plain UNet cost.
+#
+# plan_deadline() then picks the least degraded settings that fit the budget:
+# fewer steps first (down to DEADLINE_MIN_STEPS), then CFG truncation, then smaller
+# output sizes (DEADLINE_SCALES).
+
+_UNIT_PIXELS = 512 * 512
+
+
+@functools.lru_cache(maxsize=4)
+def _read_runs(path, mtime, size):
+    # Keyed on mtime/size so an unchanged log is parsed once
+    runs = collections.deque(maxlen=DEADLINE_SCAN_RECORDS)
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("event") == "generation" and not record.get("error"):
+                    runs.append(record)
+    except OSError:
+        pass
+    return list(runs)
+
+def _generation_runs():
+    path = instrumentation.METRICS_LOG_PATH
+    try:
+        stat = path.stat()
+    except OSError:
+        return []
+    return _read_runs(str(path), stat.st_mtime, stat.st_size)
+
+
+def _batch_items(params):
+    return params.get("batch_size") or params.get("num_images") or len(params.get("seeds") or []) or 1
+
+def _unet_units(steps, guided_steps, batch, width, height):
+    return (steps + guided_steps) * batch * width * height / _UNIT_PIXELS
+
+def _run_rates(record):
+    # -> (seconds per UNet unit, seconds of other stages per output unit), or None
+    params = record.get("params") or {}
+    denoise_s, steps = (record.get("stages_s") or {}).get("denoising"), record.get("steps")
+    if not denoise_s or not steps or not params.get("width") or not params.get("height"):
+        return None
+    batch = _batch_items(params)
+    guided = record.get("cfg_guided_steps") or (steps if params.get("guidance_scale", 1) > 1 else 0)
+    units = _unet_units(steps, min(guided, steps), batch, params["width"], params["height"])
+    output_units = batch * params["width"] * params["height"] / _UNIT_PIXELS
+    return denoise_s / units, max(0.0, record["total_s"] - denoise_s) / output_units
+
+
+class CostModel:
+    def __init__(self, unit_s, overhead_s, samples, basis):
+        self.unit_s = unit_s
+        self.overhead_s = overhead_s
+        self.samples = samples
+        self.basis = basis
+
+    def predict(self, steps, width, height, guidance_scale, batch=1, strength=1.0, cfg_truncation=1.0):
+        executed = max(1, int(steps * strength)) if strength < 1 else steps # img2img/inpaint skip the early steps
+        guided = 0 if guidance_scale <= 1 else max(1, round(cfg_truncation * executed))
+        units = _unet_units(executed, guided, batch, width, height)
+        return units * self.unit_s + batch * width * height / _UNIT_PIXELS * self.overhead_s
+
+
+def cost_model(kind, model_id, device):
+    # -> CostModel, or None until a matching run has been measured
+    runs = [
+        r for r in _generation_runs()
+        if r.get("device") in (device, None) and not r.get("feature_cache") and not r.get("token_merging")
+    ]
+    for basis, matches in (
+        ("model+kind", lambda r: r.get("model_id") == model_id and r.get("kind") == kind),
+        ("model", lambda r: r.get("model_id") == model_id),
+    ):
+        rates = [rate for rate in map(_run_rates, (r for r in runs if matches(r))) if rate]
+        rates = rates[-DEADLINE_HISTORY_RUNS:]
+        if rates:
+            return CostModel(
+                statistics.median(r[0] for r in rates), statistics.median(r[1] for r in rates), len(rates), basis,
+            )
+    return None
+
+
+def scaled_max_size(width, height, scale):
+    # Max side for normalize.normalize_image that yields the planned size of an input
+    return int(max(width, height) * scale)
+
+def plan_deadline(model, budget_s, steps, width, height, guidance_scale, batch=1, strength=1.0):
+    # -> plan dict: steps, width, height, scale, cfg_truncation, predicted_s, fits.
+    # width/height are what normalize_image(image, scaled_max_size(...)) produces for an input.
+    min_steps = min(steps, DEADLINE_MIN_STEPS)
+    guidance_options = (1.0, DEADLINE_CFG_TRUNCATION) if guidance_scale > 1 else (1.0,)
+    for scale in DEADLINE_SCALES:
+        w, h = normalized_size((width, height), scaled_max_size(width, height, scale)) if scale < 1 else (width, height)
+        for cfg_truncation in guidance_options:
+            fitting = [
+                n for n in range(steps, min_steps - 1, -1)
+                if model.predict(n, w, h, guidance_scale, batch, strength, cfg_truncation) <= budget_s
+            ]
+            plan = {
+                "steps": fitting[0] if fitting else min_steps, "width": w, "height": h, "scale": scale,
+                "cfg_truncation": cfg_truncation, "fits": bool(fitting),
+            }
+            plan["predicted_s"] = model.predict(plan["steps"], w, h, guidance_scale, batch, strength, cfg_truncation)
+            if fitting:
+                return plan
+    return plan # Nothing fits: the cheapest candidate, flagged
@@ -0,0 +1,707 @@
+import contextlib
+import inspect
+import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from config import MEMORY_HEADROOM, DRAFT_SCALE, DRAFT_STEPS, REFINE_STRENGTH
+from lazy_imports import torch, cuda_available
+from latent_cache import get_latent_cache, image_digest
+from normalize import normalized_size, normalize_image, normalize_mask
+from performance import inference_context, apply_cpu_perf, set_runtime_flags, runtime_flags, cpu_perf_options, configure_cpu_threads
+from quantization import load_quantized_components, quantize_pipeline
+from memory_planner import plan_memory, apply_memory_plan, describe_plan, pipeline_weight_bytes, available_memory_bytes
+from instrumentation import RunRecorder, record_event
+from profiling import StepProfiler
+from model_loader import load_from_pretrained
+from speedups import speedup_options, active_speedups, effective_guidance_scale, cfg_truncation_callback
+from feature_cache import feature_cache_for
+from schedulers import use_scheduler
+from token_merging import token_merging
+from deadline import cost_model, plan_deadline
+
+logger = logging.getLogger("studio.engine")
+
+# --- Headless generation core ---
+# No Streamlit in here: failures raise EngineError, progress and side information
+# go through callbacks, so the same code runs in the app, a CLI or a worker process.
+#
+#   on_event(event, payload)  "info"/"warning" (str), "model_load", "memory_plan",
+#                             "profile", "run_metrics" (dicts / plan objects)
+#   on_progress(step, total)  after every denoising step
+
+
+class EngineError(Exception):
+    def __init__(self, message, hint=None):
+        super().__init__(message)
+        self.hint = hint
+
+
+@dataclass
+class GenerationResult:
+    images: list
+    seed: int
+    seeds: list = None
+    metrics: dict = None
+    memory_plan: object = None
+    profile: dict = None
+    latents: object = None # Final latents (CPU), when requested with keep_latents
+    intermediate_latents: list = None # (step, latents) pairs, every keep_intermediate steps
+
+    @property
+    def image(self):
+        return self.images[0]
+
+
+def _emit(on_event, event, payload):
+    if on_event is not None:
+        on_event(event, payload)
+    elif event == "warning":
+        logger.warning(payload)
+    elif event == "info":
+        logger.info(payload)
+
+
+def resolve_seed(seed):
+    if seed == -1:
+        seed = np.random.randint(0, 2**32 - 1)
+    return int(seed)
+
+
+# --- Model loading ---
+def build_pipeline(pipeline_class, model_id, channels_last=False, compile_unet=False, quantize_int8=False, on_event=None):
+    device = "cuda" if cuda_available() else "cpu"
+    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    quantize_int8 = quantize_int8 and device == "cpu" # Dynamic quantization kernels are CPU-only
+    load_start = time.perf_counter()
+    _emit(on_event, "info", f"Loading {pipeline_class.__name__} for {model_id} on {device}...")
+
+    # Previously quantized components are passed in directly, skipping their fp32 weights
+    cached_components = load_quantized_components(model_id) if quantize_int8 else {}
+    if cached_components:
+        _emit(on_event, "info", f"Using cached int8 components: {', '.join(cached_components)}.")
+
+    # Format (safetensors / variant) comes from the model manifest when this model loaded before
+    try:
+        pipe, load_info = load_from_pretrained(pipeline_class, model_id, torch_dtype, cached_components)
+    except Exception as e:
+        raise EngineError(f"Failed to load model {model_id}. Error: {e}") from e
+    for attempt in load_info["failed_attempts"]:
+        _emit(on_event, "warning", f"Could not load with {attempt}. Tried the next format.")
+
+    if quantize_int8:
+        newly_quantized = quantize_pipeline(pipe, model_id, already_quantized=cached_components)
+        if newly_quantized:
+            _emit(on_event, "info", f"Quantized {', '.join(newly_quantized)} to int8 (cached for next startup).")
+
+    if device == "cuda" and pipeline_weight_bytes(pipe) > available_memory_bytes(device) * MEMORY_HEADROOM:
+        # Weights alone do not fit: start offloaded, the per-request planner keeps it that way
+        pipe.enable_model_cpu_offload()
+        set_runtime_flags(pipe, cpu_offload=True)
+        _emit(on_event, "info", "Model weights exceed free GPU memory, enabled CPU offloading.")
+    else:
+        pipe = pipe.to(device)
+
+    if device == "cpu" and (channels_last or compile_unet):
+        if compile_unet:
+            _emit(on_event, "info", "Compiling UNet with torch.compile (one-time warm-up)...")
+        compiled = apply_cpu_perf(pipe, {"channels_last": channels_last, "compile_unet": compile_unet})
+        if compile_unet and not compiled:
+            _emit(on_event, "info", "torch.compile not available, running UNet eagerly.")
+
+    # Attention/VAE slicing, tiling and offload are chosen per request by memory_planner
+
+    _emit(on_event, "model_load", record_event(
+        "model_load", model_id=model_id, pipeline=pipeline_class.__name__, device=device,
+        seconds=time.perf_counter() - load_start,
+        options={"channels_last": channels_last, "compile_unet": compile_unet, "quantize_int8": quantize_int8},
+        format=load_info["format"], manifest_hit=load_info["manifest_hit"], parallel=load_info["parallel"],
+        from_pretrained_s=load_info["seconds"],
+    ))
+
+    if hasattr(pipe, 'safety_checker') and pipe.safety_checker is not None:
+        # It's generally recommended to keep the safety checker unless you have specific reasons.
+        # pipe.safety_checker = None
+        pass # Keep safety checker by default
+
+    return pipe, device
+
+
+def pipeline_class_for(kind):
+    from diffusers import StableDiffusionInpaintPipeline, StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
+    return {
+        "inpaint": StableDiffusionInpaintPipeline,
+        "text2img": StableDiffusionPipeline,
+        "img2img": StableDiffusionImg2ImgPipeline,
+    }[kind]
+
+
+def load_pipeline(kind, model_id, cpu_options=None, on_event=None):
+    # Headless counterpart of models._load_with_runtime_options (no caching; callers keep the pipe)
+    if cuda_available():
+        return build_pipeline(pipeline_class_for(kind), model_id, on_event=on_event)
+    options = cpu_perf_options(cpu_options)
+    configure_cpu_threads(options["num_threads"], options["num_interop_threads"])
+    pipe, device = build_pipeline(
+        pipeline_class_for(kind), model_id,
+        channels_last=options["channels_last"],
+        compile_unet=options["compile_unet"],
+        quantize_int8=options["quantize_int8"],
+        on_event=on_event,
+    )
+    set_runtime_flags(pipe, bf16_autocast=options["bf16_autocast"])
+    return pipe, device
+
+
+# --- Cached VAE encoding ---
+# Reruns on the same input only differ in seed/strength/prompt, so the encoded
+# input is cached by (model_id, image hash, size). The distribution mean is used
+# instead of a seeded sample so the latents do not depend on the seed.
+
+def _model_key(pipe):
+    return getattr(pipe, "name_or_path", None) or pipe.config.get("_name_or_path", "unknown")
+
+def _supports_cached_latents(pipe, *call_args):
+    if not hasattr(pipe, "image_processor") or getattr(pipe, "vae", None) is None:
+        return False
+    params = inspect.signature(pipe.__call__).parameters
+    return all(arg in params for arg in call_args)
+
+def _vae_encode(pipe, pixels):
+    vae = pipe.vae
+    pixels = pixels.to(device=pipe._execution_device, dtype=vae.dtype)
+    with torch.no_grad():
+        latents = vae.encode(pixels).latent_dist.mean
+    return latents * vae.config.scaling_factor
+
+def encode_image_latents(pipe, image, image_hash=None):
+    cache = get_latent_cache()
+    width, height = image.size
+    key = cache.make_key(_model_key(pipe), image_hash or image_digest(image), (width, height))
+    latents = cache.get(key)
+    if latents is None:
+        pixels = pipe.image_processor.preprocess(image, height=height, width=width)
+        latents = _vae_encode(pipe, pixels)
+        cache.put(key, latents)
+    return latents.to(device=pipe._execution_device, dtype=pipe.vae.dtype)
+
+def encode_masked_image_latents(pipe, image, mask_image, image_hash=None):
+    cache = get_latent_cache()
+    width, height = image.size
+    key = cache.make_key(_model_key(pipe), image_hash or image_digest(image), (width, height), "masked", image_digest(mask_image))
+    latents = cache.get(key)
+    if latents is None:
+        pixels = pipe.image_processor.preprocess(image, height=height, width=width)
+        mask = pipe.mask_processor.preprocess(mask_image, height=height, width=width)
+        latents = _vae_encode(pipe, pixels * (mask < 0.5))
+        cache.put(key, latents)
+    return latents.to(device=pipe._execution_device, dtype=pipe.vae.dtype)
+
+
+# --- Step callbacks ---
+def combine_step_callbacks(*callbacks):
+    callbacks = [cb for cb in callbacks if cb is not None]
+    if not callbacks:
+        return None
+    def on_step_end(pipe, step, timestep, callback_kwargs):
+        for cb in callbacks:
+            callback_kwargs = cb(pipe, step, timestep, callback_kwargs)
+        return callback_kwargs
+    # Tensors (besides latents) any of the callbacks reads or replaces
+    on_step_end.tensor_inputs = list(dict.fromkeys(t for cb in callbacks for t in getattr(cb, "tensor_inputs", ())))
+    return on_step_end
+
+def _callback_kwargs(pipe, callback):
+    if callback is None:
+        return {"callback_on_step_end": None}
+    supported = getattr(pipe, "_callback_tensor_inputs", ["latents"])
+    return {
+        "callback_on_step_end": callback,
+        "callback_on_step_end_tensor_inputs": ["latents"] + [t for t in callback.tensor_inputs if t in supported and t != "latents"],
+    }
+
+class _LatentCapture:
+    # Keeps the latents after the last step, i.e. what the VAE decodes, and
+    # optionally a CPU copy every `every` steps
+    tensor_inputs = ()
+
+    def __init__(self, every=0):
+        self.latents = None
+        self.every = every
+        self.intermediate = []
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        self.latents = callback_kwargs["latents"]
+        if self.every and (step + 1) % self.every == 0:
+            self.intermediate.append((step + 1, self.latents.detach().cpu()))
+        return callback_kwargs
+
+def _progress_callback(on_progress, num_inference_steps):
+    if on_progress is None:
+        return None
+    def on_step_end(pipe, step, timestep, callback_kwargs):
+        # img2img/inpaint run fewer steps than requested when strength < 1
+        on_progress(step + 1, getattr(pipe, "num_timesteps", None) or num_inference_steps)
+        return callback_kwargs
+    return on_step_end
+
+
+# --- Generation ---
+def _generators(pipe, seeds):
+    # One generator per batch item keeps every image identical to its single-request run
+    generators = [torch.Generator(device=pipe.device).manual_seed(int(seed)) for seed in seeds]
+    return generators[0] if len(generators) == 1 else generators
+
+_run_locks = weakref.WeakKeyDictionary()
+_run_locks_guard = threading.Lock()
+
+def _run_lock(pipe):
+    # Loaded pipelines are shared between sessions (st.cache_resource) and img2img views share
+    # their UNet: per-call pipeline state (scheduler preset, UNet patches) is only set under this
+    unet = getattr(pipe, "unet", pipe)
+    with _run_locks_guard:
+        return _run_locks.setdefault(unet, threading.RLock())
+
+def _generate(kind, pipe, params, size, batch_size, guidance_scale, build_inputs, failure, empty, hint=None,
+              on_event=None, on_progress=None, profile=False, speedups=None, scheduler=None, keep_latents=False,
+              keep_intermediate=0):
+    # build_inputs runs inside the recorder/inference context so VAE encoding is timed with the run
+    with _run_lock(pipe), contextlib.ExitStack() as call_state:
+        try:
+            params["scheduler"] = call_state.enter_context(use_scheduler(pipe, scheduler))
+        except (ValueError, AttributeError) as e: # Unknown preset / scheduler class missing from this diffusers
+            raise EngineError(str(e)) from e
+        options = speedup_options(speedups)
+        guidance_scale = effective_guidance_scale(guidance_scale, options)
+        cfg_truncation = cfg_truncation_callback(options, guidance_scale)
+        recorder = RunRecorder(kind, _model_key(pipe), params)
+        if active_speedups(options):
+            recorder.extra["speedups"] = active_speedups(options)
+        merge_ratio = call_state.enter_context(token_merging(pipe, options["token_merging"]))
+        if merge_ratio:
+            recorder.extra["token_merging"] = merge_ratio
+        feature_cache = None
+        if options["feature_cache"]:
+            feature_cache, reason = feature_cache_for(pipe, _model_key(pipe), params["steps"], options["feature_cache_interval"])
+            if feature_cache is None:
+                _emit(on_event, "info", f"Feature cache not used: {reason}.")
+        recorder.extra["device"] = pipe._execution_device.type # Cost-model key for deadline planning
+        seeds = params.get("seeds") or [params["seed"]]
+        profiler = None
+        try:
+            with recorder.run(pipe):
+                # _execution_device is the compute device even when the model is offloaded to CPU
+                plan = plan_memory(pipe, pipe._execution_device.type, size[0], size[1], batch_size, guidance_scale)
+                apply_memory_plan(pipe, plan)
+                recorder.extra["memory_plan"] = describe_plan(plan)
+                _emit(on_event, "memory_plan", plan)
+                profiler = StepProfiler(f"{kind}_{recorder.run_id}") if profile else None
+                latent_capture = _LatentCapture(keep_intermediate) if keep_latents or keep_intermediate else None
+                callback = combine_step_callbacks(cfg_truncation, profiler, latent_capture, _progress_callback(on_progress, params["steps"]))
+                with inference_context(pipe), (profiler or contextlib.nullcontext()), \
+                        (feature_cache.attach(pipe.unet) if feature_cache else contextlib.nullcontext()):
+                    result = pipe(
+                        **build_inputs(),
+                        guidance_scale=guidance_scale,
+                        generator=_generators(pipe, seeds),
+                        **_callback_kwargs(pipe, callback),
+                    )
+                if cfg_truncation is not None:
+                    recorder.extra["cfg_guided_steps"] = cfg_truncation.guided_steps
+                if feature_cache is not None:
+                    recorder.extra["feature_cache"] = feature_cache.stats()
+                if profiler is not None and profiler.paths:
+                    recorder.extra["profile"] = profiler.paths
+                    _emit(on_event, "profile", profiler.paths)
+        except Exception as e:
+            raise EngineError(f"{failure}: {str(e)}", hint=hint) from e
+        finally:
+            _emit(on_event, "run_metrics", recorder.record)
+
+        if not result.images:
+            raise EngineError(empty)
+        return GenerationResult(
+            images=list(result.images), seed=seeds[0], seeds=seeds, metrics=recorder.record,
+            memory_plan=plan, profile=profiler.paths if profiler is not None else None,
+            latents=latent_capture.latents.detach().cpu() if latent_capture is not None and latent_capture.latents is not None else None,
+            intermediate_latents=latent_capture.intermediate if latent_capture is not None and keep_intermediate else None,
+        )
+
+
+def plan_for_deadline(pipe, kind, budget_s, steps, width, height, guidance_scale, batch=1, strength=1.0):
+    # Steps / size / guidance that fit budget_s seconds, from this model's measured runs
+    # on this device (deadline.py). None until one has been measured.
+    model = cost_model(kind, _model_key(pipe), pipe._execution_device.type)
+    if model is None:
+        return None
+    plan = plan_deadline(model, budget_s, steps, width, height, guidance_scale, batch, strength)
+    plan.update(budget_s=budget_s, samples=model.samples, basis=model.basis)
+    return plan
+
+
+def prepare_mask(image, mask_image, on_event=None):
+    mask_image_l = mask_image.convert("L")
+
+    mask_array = np.array(mask_image_l)
+    if np.mean(mask_array) < 127: # If mostly black, invert (assume user painted area to keep)
+        mask_image_l = Image.fromarray(255 - mask_array)
+
+    # Ensure image and mask are same size
+    if image.size != mask_image_l.size:
+        _emit(on_event, "warning", f"Image ({image.size}) and mask ({mask_image_l.size}) sizes differ. Resizing mask to image size.")
+        mask_image_l = mask_image_l.resize(image.size)
+    return mask_image_l
+
+def _inpaint_inputs(image, mask_image, on_event=None):
+    # The pipeline rejects sides that are not multiples of 8 once height/width are passed
+    mask_image_l = prepare_mask(image, mask_image, on_event)
+    image = normalize_image(image)
+    return image, normalize_mask(mask_image_l, image.size)
+
+
+def inpaint(pipe, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+            on_event=None, on_progress=None, profile=False, speedups=None, scheduler=None, keep_latents=False, init_latents=None,
+            keep_intermediate=0):
+    # init_latents: start from these (e.g. a draft, see refine_inpaint) instead of the encoded image;
+    # they are resized to the image's latent size
+    seed = resolve_seed(seed)
+    image, mask_image_l = _inpaint_inputs(image, mask_image, on_event)
+
+    def build_inputs():
+        image_kwargs = {"image": image}
+        if _supports_cached_latents(pipe, "masked_image_latents", "height", "width"):
+            image_hash = image_digest(image)
+            image_kwargs = {
+                "image": encode_image_latents(pipe, image, image_hash) if init_latents is None
+                         else upscale_latents(init_latents, image.width, image.height, pipe.vae_scale_factor).to(
+                             device=pipe._execution_device, dtype=pipe.vae.dtype),
+                "masked_image_latents": encode_masked_image_latents(pipe, image, mask_image_l, image_hash),
+                "height": image.height,
+                "width": image.width,
+            }
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt, "mask_image": mask_image_l,
+            "num_inference_steps": num_inference_steps, "strength": strength, **image_kwargs,
+        }
+
+    params = {
+        "width": image.width, "height": image.height, "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seed": seed,
+    }
+    return _generate(
+        "inpaint", pipe, params, image.size, 1, guidance_scale, build_inputs,
+        failure="Error during inpainting",
+        empty="Inpainting failed to produce an image.",
+        hint="Try reducing image size, adjusting strength/steps, or using a different model.",
+        on_event=on_event, on_progress=on_progress, profile=profile, speedups=speedups, scheduler=scheduler,
+        keep_latents=keep_latents, keep_intermediate=keep_intermediate,
+    )
+
+
+def text2img(pipe, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, num_images=1,
+             on_event=None, on_progress=None, profile=False, speedups=None, scheduler=None, keep_latents=False,
+             keep_intermediate=0):
+    seed = resolve_seed(seed)
+
+    def build_inputs():
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt, "num_inference_steps": num_inference_steps,
+            "width": width, "height": height, "num_images_per_prompt": num_images,
+        }
+
+    params = {
+        "width": width, "height": height, "num_images": num_images, "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "seed": seed,
+    }
+    return _generate(
+        "text2img", pipe, params, (width, height), num_images, guidance_scale, build_inputs,
+        failure="Error during Text-to-Image generation",
+        empty="Text-to-Image generation failed to produce images.",
+        on_event=on_event, on_progress=on_progress, profile=profile, speedups=speedups, scheduler=scheduler,
+        keep_latents=keep_latents, keep_intermediate=keep_intermediate,
+    )
+
+
+def img2img(pipe, image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+            on_event=None, on_progress=None, profile=False, speedups=None, scheduler=None):
+    seed = resolve_seed(seed)
+    image = image.convert("RGB")
+
+    def build_inputs():
+        # 4-channel tensors are taken as already-encoded latents by the pipeline
+        init_image = encode_image_latents(pipe, image) if _supports_cached_latents(pipe) else image
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt, "image": init_image,
+            "num_inference_steps": num_inference_steps, "strength": strength,
+        }
+
+    params = {
+        "width": image.width, "height": image.height, "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seed": seed,
+    }
+    return _generate(
+        "img2img", pipe, params, image.size, 1, guidance_scale, build_inputs,
+        failure="Error during Img2Img processing",
+        empty="Img2Img processing failed to produce an image.",
+        hint="Try adjusting strength, image size, or using a different model.",
+        on_event=on_event, on_progress=on_progress, profile=profile, speedups=speedups, scheduler=scheduler,
+    )
+
+
+# --- Batched generation ---
+# One pipeline call for several independent requests that share model, size,
+# steps and guidance (see api_server.DynamicBatcher). Prompts and seeds are per item.
+
+def text2img_batch(pipe, prompts, negative_prompts, seeds, guidance_scale, num_inference_steps, width, height,
+                   on_event=None, on_progress=None, speedups=None, scheduler=None):
+    seeds = [resolve_seed(seed) for seed in seeds]
+
+    def build_inputs():
+        return {
+            "prompt": list(prompts), "negative_prompt": list(negative_prompts),
+            "num_inference_steps": num_inference_steps, "width": width, "height": height,
+        }
+
+    params = {
+        "width": width, "height": height, "batch_size": len(prompts), "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "seeds": seeds,
+    }
+    return _generate(
+        "text2img", pipe, params, (width, height), len(prompts), guidance_scale, build_inputs,
+        failure="Error during Text-to-Image generation",
+        empty="Text-to-Image generation failed to produce images.",
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler,
+    )
+
+
+def img2img_batch(pipe, images, prompts, negative_prompts, seeds, guidance_scale, num_inference_steps, strength,
+                  on_event=None, on_progress=None, speedups=None, scheduler=None):
+    seeds = [resolve_seed(seed) for seed in seeds]
+    images = [image.convert("RGB") for image in images]
+    if len({image.size for image in images}) != 1:
+        raise EngineError("Batched Img2Img needs images of the same size.")
+
+    def build_inputs():
+        if _supports_cached_latents(pipe):
+            init_images = torch.cat([encode_image_latents(pipe, image) for image in images])
+        else:
+            init_images = images
+        return {
+            "prompt": list(prompts), "negative_prompt": list(negative_prompts), "image": init_images,
+            "num_inference_steps": num_inference_steps, "strength": strength,
+        }
+
+    params = {
+        "width": images[0].width, "height": images[0].height, "batch_size": len(images), "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seeds": seeds,
+    }
+    return _generate(
+        "img2img", pipe, params, images[0].size, len(images), guidance_scale, build_inputs,
+        failure="Error during Img2Img processing",
+        empty="Img2Img processing failed to produce an image.",
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler,
+    )
+
+
+def inpaint_batch(pipe, images, mask_images, prompts, negative_prompts, seeds, guidance_scale, num_inference_steps, strength,
+                  on_event=None, on_progress=None, speedups=None, scheduler=None):
+    seeds = [resolve_seed(seed) for seed in seeds]
+    if len({image.size for image in images}) != 1:
+        raise EngineError("Batched inpainting needs images of the same size.")
+    images, masks = map(list, zip(*(_inpaint_inputs(image, mask, on_event) for image, mask in zip(images, mask_images))))
+    width, height = images[0].size
+
+    def build_inputs():
+        image_kwargs = {"image": list(images)}
+        if _supports_cached_latents(pipe, "masked_image_latents", "height", "width"):
+            hashes = [image_digest(image) for image in images]
+            image_kwargs = {
+                "image": torch.cat([encode_image_latents(pipe, image, h) for image, h in zip(images, hashes)]),
+                "masked_image_latents": torch.cat([
+                    encode_masked_image_latents(pipe, image, mask, h) for image, mask, h in zip(images, masks, hashes)]),
+                "height": height,
+                "width": width,
+            }
+        return {
+            "prompt": list(prompts), "negative_prompt": list(negative_prompts), "mask_image": masks,
+            "num_inference_steps": num_inference_steps, "strength": strength, **image_kwargs,
+        }
+
+    params = {
+        "width": width, "height": height, "batch_size": len(images), "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seeds": seeds,
+    }
+    return _generate(
+        "inpaint", pipe, params, (width, height), len(images), guidance_scale, build_inputs,
+        failure="Error during inpainting",
+        empty="Inpainting failed to produce an image.",
+        hint="Try reducing image size, adjusting strength/steps, or using a different model.",
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler,
+    )
+
+
+# --- Variation sweeps ---
+# Several seeds of one request in one pipeline call. The prompt is encoded once and
+# repeated per item (num_images_per_prompt); inpainting inputs are encoded once and
+# broadcast by the pipeline. Each item has its own generator, so variation i is the
+# image a single run with seeds[i] would give.
+
+def text2img_variations(pipe, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, width, height,
+                        on_event=None, on_progress=None, speedups=None, scheduler=None, keep_latents=False):
+    seeds = [resolve_seed(seed) for seed in seeds]
+
+    def build_inputs():
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt, "num_inference_steps": num_inference_steps,
+            "width": width, "height": height, "num_images_per_prompt": len(seeds),
+        }
+
+    params = {
+        "width": width, "height": height, "batch_size": len(seeds), "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "seeds": seeds, "variations": True,
+    }
+    return _generate(
+        "text2img", pipe, params, (width, height), len(seeds), guidance_scale, build_inputs,
+        failure="Error during Text-to-Image generation",
+        empty="Text-to-Image generation failed to produce images.",
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler, keep_latents=keep_latents,
+    )
+
+
+def inpaint_variations(pipe, image, mask_image, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, strength,
+                       on_event=None, on_progress=None, speedups=None, scheduler=None, keep_latents=False):
+    seeds = [resolve_seed(seed) for seed in seeds]
+    image, mask_image_l = _inpaint_inputs(image, mask_image, on_event)
+
+    def build_inputs():
+        image_kwargs = {"image": image}
+        if _supports_cached_latents(pipe, "masked_image_latents", "height", "width"):
+            image_hash = image_digest(image)
+            image_kwargs = {
+                "image": encode_image_latents(pipe, image, image_hash),
+                "masked_image_latents": encode_masked_image_latents(pipe, image, mask_image_l, image_hash),
+                "height": image.height,
+                "width": image.width,
+            }
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt, "mask_image": mask_image_l,
+            "num_inference_steps": num_inference_steps, "strength": strength, "num_images_per_prompt": len(seeds),
+            **image_kwargs,
+        }
+
+    params = {
+        "width": image.width, "height": image.height, "batch_size": len(seeds), "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seeds": seeds, "variations": True,
+    }
+    return _generate(
+        "inpaint", pipe, params, image.size, len(seeds), guidance_scale, build_inputs,
+        failure="Error during inpainting",
+        empty="Inpainting failed to produce an image.",
+        hint="Try fewer variations, a smaller image, or fewer steps.",
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler, keep_latents=keep_latents,
+    )
+
+
+# --- Draft & refine (progressive generation) ---
+# A draft is a normal run at DRAFT_SCALE of the size with at most DRAFT_STEPS
+# steps, keeping its final latents. Refining upscales those latents to the full
+# size and runs a short img2img / inpainting pass (REFINE_STRENGTH) from the same
+# seed. The draft's composition is kept, and only the remaining denoising is paid for
+# instead of a full run from noise.
+
+def draft_settings(width, height, num_inference_steps):
+    # -> (width, height, steps) of the draft for a full-size request
+    width, height = normalized_size((width, height), int(max(width, height) * DRAFT_SCALE))
+    return width, height, min(num_inference_steps, DRAFT_STEPS)
+
+def _latents_tensor(latents):
+    # Saved project latents come back as (memory-mapped) float16 arrays
+    if isinstance(latents, np.ndarray):
+        return torch.from_numpy(np.asarray(latents, dtype=np.float32))
+    return latents
+
+def upscale_latents(latents, width, height, vae_scale_factor=8):
+    latents = _latents_tensor(latents)
+    if latents.shape[-2:] == (height // vae_scale_factor, width // vae_scale_factor):
+        return latents # Same size (continuing a saved image)
+    return torch.nn.functional.interpolate(
+        latents, size=(height // vae_scale_factor, width // vae_scale_factor), mode="bicubic", align_corners=False)
+
+def img2img_view(pipe):
+    # img2img pipeline over a loaded pipeline's modules: no weights are loaded or copied
+    view = getattr(pipe, "_studio_img2img_view", None)
+    if view is None:
+        view_class = pipeline_class_for("img2img")
+        view = view_class.from_pipe(pipe) if hasattr(view_class, "from_pipe") else view_class(**pipe.components)
+        view.register_to_config(_name_or_path=_model_key(pipe))
+        pipe._studio_img2img_view = view
+    view._studio_runtime = dict(runtime_flags(pipe)) # Same offload / autocast / scheduler state as the parent
+    return view
+
+
+def refine(pipe, draft_latents, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height,
+           strength=REFINE_STRENGTH, on_event=None, on_progress=None, speedups=None, scheduler=None, keep_latents=False):
+    # pipe: the text2img pipeline that made the draft; draft_latents: one item of GenerationResult.latents
+    # (or of saved project latents)
+    seed = resolve_seed(seed)
+    view = img2img_view(pipe)
+
+    def build_inputs():
+        latents = upscale_latents(draft_latents, width, height, view.vae_scale_factor)
+        return {
+            "prompt": prompt, "negative_prompt": negative_prompt,
+            "image": latents.to(device=view._execution_device, dtype=view.vae.dtype), # 4 channels: taken as latents
+            "num_inference_steps": num_inference_steps, "strength": strength,
+        }
+
+    params = {
+        "width": width, "height": height, "steps": num_inference_steps,
+        "guidance_scale": guidance_scale, "strength": strength, "seed": seed, "refine": True,
+    }
+    try:
+        return _generate(
+            "img2img", view, params, (width, height), 1, guidance_scale, build_inputs,
+            failure="Error while refining the draft",
+            empty="Refining failed to produce an image.",
+            on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler, keep_latents=keep_latents,
+        )
+    finally:
+        set_runtime_flags(pipe, **runtime_flags(view)) # e.g. CPU offload switched on for this run
+
+def refine_inpaint(pipe, draft_latents, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps,
+                   strength=REFINE_STRENGTH, on_event=None, on_progress=None, speedups=None, scheduler=None, keep_latents=False):
+    # The unmasked area still comes from the full-size image (masked_image_latents)
+    if not _supports_cached_latents(pipe, "masked_image_latents", "height", "width"):
+        raise EngineError(
+            "Refining a draft needs an inpainting pipeline that accepts latents.",
+            hint="Upgrade diffusers, or generate at full size without a draft.")
+    return inpaint(
+        pipe, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+        on_event=on_event, on_progress=on_progress, speedups=speedups, scheduler=scheduler, keep_latents=keep_latents,
+        init_latents=draft_latents,
+    )
+
+
+# --- Decoding saved latents ---
+# Final latents are what the VAE decodes, so a saved image is rebuilt with one VAE
+# pass and no denoising. Intermediate latents decode to the partially denoised image
+# at that step. The safety checker runs as it does at the end of a pipeline call.
+
+def decode_latents(pipe, latents):
+    vae = pipe.vae
+    latents = _latents_tensor(latents).to(device=pipe._execution_device, dtype=vae.dtype)
+    try:
+        with inference_context(pipe):
+            pixels = vae.decode(latents / vae.config.scaling_factor).sample
+            flagged = None
+            if getattr(pipe, "safety_checker", None) is not None:
+                pixels, flagged = pipe.run_safety_checker(pixels, pipe._execution_device, latents.dtype)
+            do_denormalize = [True] * pixels.shape[0] if flagged is None else [not f for f in flagged]
+            return pipe.image_processor.postprocess(pixels, output_type="pil", do_denormalize=do_denormalize)
+    except Exception as e:
+        raise EngineError(f"Error decoding latents: {str(e)}", hint="Latents must come from a model with the same VAE.") from e
@@ -0,0 +1,102 @@
+import contextlib
+
+from config import FEATURE_CACHE_DEFAULT, FEATURE_CACHE_MODEL_DEFAULTS, FEATURE_CACHE_MIN_STEPS
+
+# --- Step-feature reuse across denoising steps (DeepCache-style) ---
+# The deep UNet blocks (everything below the first `depth` resolution levels) produce
+# high-level features that change slowly between adjacent steps. On every
+# `interval`-th UNet call the whole network runs and the outputs of the deep blocks
+# are kept. On the calls in between, those blocks return their cached outputs
+# without computing anything, and only the shallow path runs: conv_in, the first
+# down block(s), the last up block(s) and conv_out.
+#
+# Implemented by temporarily replacing the blocks' forward on the instance (like
+# instrumentation.RunRecorder does), so the UNet's own forward and diffusers'
+# block wiring stay untouched. attach() restores everything on exit.
+
+
+def feature_cache_settings(model_id, interval=0):
+    # Per-model safe defaults; interval > 0 overrides the model's interval
+    settings = dict(FEATURE_CACHE_DEFAULT)
+    model_id = (model_id or "").lower()
+    for pattern, overrides in FEATURE_CACHE_MODEL_DEFAULTS.items():
+        if pattern in model_id:
+            settings.update(overrides)
+            break
+    if interval:
+        settings["interval"] = int(interval)
+    return settings
+
+
+class FeatureCache:
+    def __init__(self, interval=3, depth=1):
+        self.interval = max(1, interval)
+        self.depth = max(1, depth)
+        self.full_steps = 0
+        self.reused_steps = 0
+        self._outputs = {}
+        self._shape = None
+        self._calls = 0
+        self._reuse = False
+
+    def stats(self):
+        return {"interval": self.interval, "depth": self.depth, "full_steps": self.full_steps, "reused_steps": self.reused_steps}
+
+    def _deep_blocks(self, unet):
+        return list(unet.down_blocks)[self.depth:] + [unet.mid_block] + list(unet.up_blocks)[:-self.depth]
+
+    def _unet_pre(self, module, args, kwargs):
+        sample = args[0] if args else kwargs["sample"]
+        # Full run on schedule, and whenever the batch changes shape (e.g. CFG truncation halves it)
+        self._reuse = bool(self._outputs) and self._calls % self.interval != 0 and tuple(sample.shape) == self._shape
+        self._shape = tuple(sample.shape)
+        self._calls += 1
+        if self._reuse:
+            self.reused_steps += 1
+        else:
+            self.full_steps += 1
+
+    def _cached_forward(self, key, original):
+        def forward(*args, **kwargs):
+            if self._reuse:
+                return self._outputs[key]
+            output = original(*args, **kwargs)
+            self._outputs[key] = output
+            return output
+        return forward
+
+    @contextlib.contextmanager
+    def attach(self, unet):
+        patched = []
+        handle = unet.register_forward_pre_hook(self._unet_pre, with_kwargs=True)
+        try:
+            for key, block in enumerate(self._deep_blocks(unet)):
+                previous = block.__dict__.get("forward") # e.g. an accelerate offload hook
+                block.forward = self._cached_forward(key, block.forward)
+                patched.append((block, previous))
+            yield self
+        finally:
+            handle.remove()
+            for block, previous in patched:
+                if previous is None:
+                    del block.forward # Back to the class method
+                else:
+                    block.forward = previous
+            self._outputs.clear()
+
+
+def feature_cache_for(pipe, model_id, num_inference_steps, interval=0):
+    # -> (FeatureCache or None, reason it is off)
+    unet = getattr(pipe, "unet", None)
+    if unet is None or not hasattr(unet, "down_blocks"):
+        return None, "pipeline has no UNet with down/up blocks"
+    if getattr(unet, "_orig_mod", None) is not None:
+        return None, "not combined with torch.compile (the compiled graph would be invalidated)"
+    settings = feature_cache_settings(model_id, interval)
+    if not settings["enabled"]:
+        return None, f"disabled by default for {model_id}"
+    if num_inference_steps < FEATURE_CACHE_MIN_STEPS:
+        return None, f"only used from {FEATURE_CACHE_MIN_STEPS} steps"
+    if settings["depth"] >= len(unet.up_blocks):
+        return None, "depth leaves no deep blocks to cache"
+    return FeatureCache(settings["interval"], settings["depth"]), None
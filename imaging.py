@@ -0,0 +1,90 @@
+from PIL import Image, ImageFilter, ImageEnhance
+import numpy as np
+
+# Streamlit-free image helpers, shared by the app (via utils) and headless callers.
+# Errors propagate; utils.py wraps these with st.error for the UI.
+
+def fit_size(size, max_size=512):
+    # Size resize_image() produces for an image of `size`
+    width, height = size
+    if width > max_size or height > max_size:
+        if width > height:
+            new_width = max_size
+            new_height = int(height * (max_size / width))
+        else:
+            new_height = max_size
+            new_width = int(width * (max_size / height))
+        # Ensure dimensions are divisible by 8 for some models
+        new_width = (new_width // 8) * 8
+        new_height = (new_height // 8) * 8
+        if new_width == 0: new_width = 8
+        if new_height == 0: new_height = 8
+        return new_width, new_height
+    return width, height
+
+def resize_image(image, max_size=512):
+    new_size = fit_size(image.size, max_size)
+    if new_size != image.size:
+        return image.resize(new_size, Image.LANCZOS)
+    return image
+
+def open_image(source, mode="RGB", target_size=None):
+    # Decode `source` (path or file object), resized to target_size: a (w, h) or a
+    # function of the original size. JPEGs are decoded with DCT scaling (draft mode,
+    # 1/2 to 1/8) to the smallest scale still covering the target, so a 24 MP photo
+    # headed for 512 px never exists at full resolution; one LANCZOS resample finishes.
+    image = Image.open(source)
+    if target_size is None:
+        return image.convert(mode)
+    if callable(target_size):
+        target_size = target_size(image.size)
+    target_size = (int(target_size[0]), int(target_size[1]))
+    if image.format == "JPEG" and target_size[0] < image.width and target_size[1] < image.height:
+        image.draft(mode, target_size)
+    image = image.convert(mode)
+    if image.size != target_size:
+        image = image.resize(target_size, Image.LANCZOS)
+    return image
+
+def apply_basic_adjustments(image, brightness, contrast, sharpness, saturation):
+    edited_img = image.copy()
+    if brightness != 1.0:
+        enhancer = ImageEnhance.Brightness(edited_img)
+        edited_img = enhancer.enhance(brightness)
+    if contrast != 1.0:
+        enhancer = ImageEnhance.Contrast(edited_img)
+        edited_img = enhancer.enhance(contrast)
+    if sharpness != 1.0:
+        enhancer = ImageEnhance.Sharpness(edited_img)
+        edited_img = enhancer.enhance(sharpness)
+    if saturation != 1.0:
+        enhancer = ImageEnhance.Color(edited_img)
+        edited_img = enhancer.enhance(saturation)
+    return edited_img
+
+def apply_filter(image, filter_name, intensity=1.0):
+    edited_img = image.copy()
+    if filter_name == "Blur":
+        edited_img = edited_img.filter(ImageFilter.GaussianBlur(radius=intensity))
+    elif filter_name == "Sharpen":
+        edited_img = edited_img.filter(ImageFilter.UnsharpMask(radius=intensity, percent=150))
+    elif filter_name == "Grayscale":
+        edited_img = edited_img.convert("L").convert("RGB")
+    elif filter_name == "Sepia":
+        grayscale = edited_img.convert("L")
+        sepia_img = Image.new("RGB", edited_img.size)
+        r_tint, g_tint, b_tint = (255 * 0.393 + 255 * 0.769 + 255 * 0.189,
+                                  255 * 0.349 + 255 * 0.686 + 255 * 0.168,
+                                  255 * 0.272 + 255 * 0.534 + 255 * 0.131)
+        scale = intensity / 1.0 # Simple intensity scaling
+
+        sepia_pixels = np.array(grayscale).astype(float)
+        sepia_pixels = np.dot(sepia_pixels[...,None], [[r_tint/255, g_tint/255, b_tint/255]]) * scale
+        sepia_pixels = np.clip(sepia_pixels, 0, 255).astype(np.uint8)
+        edited_img = Image.fromarray(sepia_pixels)
+
+    elif filter_name == "Edge Enhance":
+        edited_img = edited_img.filter(ImageFilter.EDGE_ENHANCE_MORE)
+    elif filter_name == "Emboss":
+        edited_img = edited_img.filter(ImageFilter.EMBOSS)
+    return edited_img
@@ -0,0 +1,211 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import uuid
+
+from config import METRICS_LOG_PATH
+from latent_cache import get_latent_cache
+from lazy_imports import torch
+
+logger = logging.getLogger("studio.metrics")
+
+# --- Per-stage latency / peak-memory instrumentation ---
+# A RunRecorder wraps one generation. While active it temporarily wraps the
+# pipeline's prompt encoding, VAE and safety-checker methods and hooks the UNet,
+# so a single pipe(...) call is split into stages without touching diffusers.
+# Finished records are appended to METRICS_LOG_PATH as JSON lines.
+
+RSS_SAMPLE_INTERVAL_S = 0.02
+_log_lock = threading.Lock()
+
+
+def _read_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # Lifetime peak only (KB on Linux); better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _RssSampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = _read_rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLE_INTERVAL_S):
+            self.peak = max(self.peak, _read_rss_bytes())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, _read_rss_bytes())
+        return self.peak
+
+
+def append_metrics(record):
+    METRICS_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        with open(METRICS_LOG_PATH, "a") as f:
+            f.write(line + "\n")
+
+
+def record_event(event, **fields):
+    # Stand-alone measurements (model load, PNG encode, ...), joinable to runs via run_id
+    record = {"event": event, "time": datetime.datetime.now().isoformat(), **fields}
+    try:
+        append_metrics(record)
+    except OSError as e:
+        logger.warning("Could not write metrics: %s", e)
+    return record
+
+
+class RunRecorder:
+    def __init__(self, kind, model_id=None, params=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.model_id = model_id
+        self.params = params or {}
+        self.stages = {}
+        self.steps = 0
+        self.extra = {}
+        self.total_s = None
+        self.peak_rss = None
+        self.peak_device = None
+        self.error = None
+        self.record = None
+        self._denoise_start = None
+        self._denoise_end = None
+        self._cuda = False
+
+    # -- stages --
+    def _sync(self):
+        if self._cuda:
+            torch.cuda.synchronize()
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            self.add_stage(name, time.perf_counter() - start)
+
+    def _wrap_method(self, obj, method_name, stage_name, patched):
+        original = getattr(obj, method_name, None)
+        if original is None or method_name in vars(obj):
+            return
+        def timed(*args, **kwargs):
+            with self.stage(stage_name):
+                return original(*args, **kwargs)
+        setattr(obj, method_name, timed)
+        patched.append((obj, method_name))
+
+    # -- UNet hooks: denoising = first UNet call -> last UNet call --
+    def _unet_pre(self, module, args):
+        if self._denoise_start is None:
+            self._sync()
+            self._denoise_start = time.perf_counter()
+
+    def _unet_post(self, module, args, output):
+        self.steps += 1
+        self._sync()
+        self._denoise_end = time.perf_counter()
+
+    @contextlib.contextmanager
+    def attach(self, pipe):
+        self._cuda = pipe._execution_device.type == "cuda"
+        patched, handles = [], []
+        encode_prompt = "encode_prompt" if hasattr(pipe, "encode_prompt") else "_encode_prompt"
+        self._wrap_method(pipe, encode_prompt, "text_encoding", patched)
+        self._wrap_method(pipe, "run_safety_checker", "safety_checker", patched)
+        vae = getattr(pipe, "vae", None)
+        if vae is not None:
+            self._wrap_method(vae, "decode", "vae_decode", patched)
+            self._wrap_method(vae, "encode", "vae_encode", patched)
+        unet = getattr(pipe, "unet", None)
+        if unet is not None:
+            handles.append(unet.register_forward_pre_hook(self._unet_pre))
+            handles.append(unet.register_forward_hook(self._unet_post))
+        try:
+            yield self
+        finally:
+            for obj, method_name in patched:
+                delattr(obj, method_name) # Back to the class method
+            for handle in handles:
+                handle.remove()
+
+    # -- whole run --
+    @contextlib.contextmanager
+    def run(self, pipe=None):
+        cache_before = get_latent_cache().stats()
+        if pipe is not None and pipe._execution_device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        sampler = _RssSampler()
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            if pipe is not None:
+                with self.attach(pipe):
+                    yield self
+            else:
+                yield self
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            self.total_s = time.perf_counter() - start
+            self.peak_rss = sampler.stop()
+            self.peak_device = torch.cuda.max_memory_allocated() if self._cuda else None
+            cache_after = get_latent_cache().stats()
+            self.extra["latent_cache"] = {
+                "hits": cache_after["hits"] - cache_before["hits"],
+                "misses": cache_after["misses"] - cache_before["misses"],
+                "hit_rate": cache_after["hit_rate"],
+                "bytes": cache_after["bytes"],
+            }
+            self.record = self.to_dict()
+            try:
+                append_metrics(self.record)
+            except OSError as e:
+                logger.warning("Could not write metrics: %s", e)
+
+    def to_dict(self):
+        stages = dict(self.stages)
+        if self._denoise_start is not None and self._denoise_end is not None:
+            stages["denoising"] = self._denoise_end - self._denoise_start
+        denoise_s = stages.get("denoising")
+        return {
+            "event": "generation",
+            "run_id": self.run_id,
+            "time": datetime.datetime.now().isoformat(),
+            "kind": self.kind,
+            "model_id": self.model_id,
+            "params": self.params,
+            "stages_s": stages,
+            "total_s": self.total_s,
+            "steps": self.steps,
+            "steps_per_s": (self.steps / denoise_s) if denoise_s else None,
+            "peak_rss_bytes": self.peak_rss,
+            "peak_device_bytes": self.peak_device,
+            "error": self.error,
+            **self.extra,
+        }
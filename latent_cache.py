@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import LATENT_CACHE_MAX_ENTRIES, LATENT_CACHE_MAX_BYTES
+
+# In-process LRU cache for VAE-encoded input latents.
+# Img2Img / inpainting reruns on the same input (new seed, strength or prompt)
+# reuse the encoded latents instead of running the VAE encoder again.
+# Latents are moved to CPU in the VAE's dtype (float16 on CUDA), and the byte cap
+# counts them in that dtype, so it reflects host memory.
+
+
+def image_digest(image):
+    # Content hash of a PIL image (pixels + mode + size)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class LatentCache:
+    def __init__(self, max_entries=LATENT_CACHE_MAX_ENTRIES, max_bytes=LATENT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_id, image_hash, size, *extra):
+        return (model_id, image_hash, tuple(size)) + tuple(extra)
+
+    def get(self, key):
+        with self._lock:
+            latents = self._entries.get(key)
+            if latents is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return latents
+
+    def put(self, key, latents):
+        latents = latents.detach().to("cpu")
+        nbytes = latents.element_size() * latents.nelement()
+        if nbytes > self.max_bytes:
+            return # Never cache something that would evict everything else
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.element_size() * old.nelement()
+            self._entries[key] = latents
+            self._bytes += nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_latent_cache = None
+_latent_cache_lock = threading.Lock()
+
+def get_latent_cache():
+    # Process-wide singleton: survives Streamlit reruns and is shared across sessions
+    global _latent_cache
+    with _latent_cache_lock:
+        if _latent_cache is None:
+            _latent_cache = LatentCache()
+        return _latent_cache
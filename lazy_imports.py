@@ -0,0 +1,85 @@
+import functools
+import importlib
+import importlib.metadata
+import json
+import os
+import shutil
+import sys
+
+from config import DEVICE_INFO_PATH
+
+# --- Deferred heavy imports ---
+# torch / diffusers cost seconds to import. Modules on the app's startup path use
+# `from lazy_imports import torch`. The real module is imported on first attribute
+# access, i.e. when a model is loaded or a generation runs. Opening the app, the
+# Project Manager or the editor filters therefore never pays for it.
+#
+# CUDA detection is cached too: in-process, and on disk (DEVICE_INFO_PATH) keyed by
+# the installed torch version and visible NVIDIA driver. The sidebar's device
+# status then does not import torch either.
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+torch = LazyModule("torch")
+
+
+def _device_cache_key():
+    try:
+        torch_version = importlib.metadata.version("torch")
+    except importlib.metadata.PackageNotFoundError:
+        torch_version = None
+    return {
+        "torch": torch_version,
+        "nvidia_driver": os.path.exists("/proc/driver/nvidia/version") or shutil.which("nvidia-smi") is not None,
+        "cuda_visible_devices": os.environ.get("CUDA_VISIBLE_DEVICES"),
+    }
+
+
+def _detect_devices():
+    available = torch.cuda.is_available()
+    return {"cuda": available, "device_name": torch.cuda.get_device_name(0) if available else None}
+
+
+@functools.lru_cache(maxsize=None)
+def device_info():
+    if "torch" in sys.modules: # Already paid for; ask it directly
+        return _detect_devices()
+    key = _device_cache_key()
+    try:
+        cached = json.loads(DEVICE_INFO_PATH.read_text())
+        if cached.get("key") == key:
+            return cached["info"]
+    except (OSError, ValueError, KeyError):
+        pass
+    info = _detect_devices()
+    try:
+        DEVICE_INFO_PATH.parent.mkdir(parents=True, exist_ok=True)
+        DEVICE_INFO_PATH.write_text(json.dumps({"key": key, "info": info}))
+    except OSError:
+        pass
+    return info
+
+
+def cuda_available():
+    return device_info()["cuda"]
+
+
+def cuda_device_name():
+    return device_info()["device_name"]
@@ -0,0 +1,196 @@
+import logging
+
+from config import MEMORY_HEADROOM
+from performance import runtime_flags, set_runtime_flags
+from lazy_imports import torch
+
+logger = logging.getLogger("studio.memory")
+
+# --- Per-request memory planner ---
+# Estimates peak activation memory for a request from its size, batch and the
+# loaded UNet/VAE configs, then turns on the cheapest memory savers that make it
+# fit the available budget: VAE slicing -> VAE tiling -> attention slicing ->
+# model CPU offload (CUDA only). Small requests run with none of them.
+#
+# The estimates are deliberately coarse (order-of-magnitude, conservative):
+#   UNet attention  : scores of the first (largest) transformer level, batch*heads*T^2
+#   UNet other      : skip connections + feed-forward working set, ~16 * C0 * T per sample
+#   VAE decode      : ~3 full-resolution 256-channel buffers + mid-block attention per image
+
+UNET_ACTIVATION_FACTOR = 16
+VAE_FULLRES_CHANNELS = 256
+VAE_FULLRES_BUFFERS = 3
+VAE_TILE_SIZE = 512 # diffusers default tile_sample_min_size
+
+
+def _dtype_bytes(pipe):
+    return torch.finfo(pipe.unet.dtype).bits // 8 if pipe.unet.dtype.is_floating_point else 4
+
+
+def pipeline_weight_bytes(pipe):
+    cached = runtime_flags(pipe).get("weight_bytes")
+    if cached is None:
+        cached = 0
+        for name in ("unet", "vae", "text_encoder", "text_encoder_2", "safety_checker"):
+            module = getattr(pipe, name, None)
+            if isinstance(module, torch.nn.Module):
+                cached += sum(p.numel() * p.element_size() for p in module.parameters())
+        set_runtime_flags(pipe, weight_bytes=cached)
+    return cached
+
+
+def _largest_module_bytes(pipe):
+    unet = getattr(pipe, "unet", None)
+    return sum(p.numel() * p.element_size() for p in unet.parameters()) if unet is not None else 0
+
+
+def available_memory_bytes(device):
+    if device == "cuda":
+        free, _total = torch.cuda.mem_get_info()
+        # Blocks cached by the allocator but unused are also available to us
+        return free + torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return None # Unknown budget: planner leaves everything off
+
+
+def estimate_activation_bytes(pipe, width, height, batch_size, guidance_scale, attention_slicing=False, vae_slicing=False, vae_tiling=False):
+    b = _dtype_bytes(pipe)
+    unet_config = pipe.unet.config
+    scale = 2 ** (len(pipe.vae.config.block_out_channels) - 1)
+    tokens = (height // scale) * (width // scale)
+    cfg_batch = batch_size * (2 if guidance_scale > 1.0 else 1)
+
+    channels = unet_config.block_out_channels[0]
+    # SD UNet configs store the head *count* in attention_head_dim (a long-standing diffusers misnomer)
+    heads = getattr(unet_config, "num_attention_heads", None) or unet_config.attention_head_dim
+    heads = heads[0] if isinstance(heads, (list, tuple)) else heads
+
+    attention_rows = 1 if attention_slicing else cfg_batch * heads
+    unet_attention = attention_rows * tokens * tokens * b
+    unet_other = UNET_ACTIVATION_FACTOR * cfg_batch * channels * tokens * b
+
+    vae_images = 1 if vae_slicing else batch_size
+    vae_pixels = min(height * width, VAE_TILE_SIZE * VAE_TILE_SIZE) if vae_tiling else height * width
+    vae_tokens = vae_pixels // (scale * scale)
+    vae_decode = vae_images * (VAE_FULLRES_BUFFERS * VAE_FULLRES_CHANNELS * vae_pixels + vae_tokens * vae_tokens) * b
+
+    return {
+        "unet_attention": unet_attention,
+        "unet_other": unet_other,
+        "vae_decode": vae_decode,
+        "peak": max(unet_attention + unet_other, vae_decode), # UNet and VAE run one after the other
+    }
+
+
+def plan_memory(pipe, device, width, height, batch_size=1, guidance_scale=7.5, budget_bytes=None):
+    budget = available_memory_bytes(device) if budget_bytes is None else budget_bytes
+    weights = pipeline_weight_bytes(pipe)
+    offloaded_now = runtime_flags(pipe).get("cpu_offload", False)
+
+    plan = {
+        "width": width, "height": height, "batch_size": batch_size, "device": device,
+        "attention_slicing": False, "vae_slicing": False, "vae_tiling": False, "cpu_offload": False,
+        "budget_bytes": budget, "weight_bytes": weights, "reasons": [],
+    }
+
+    def resident_weights(offload):
+        # On CUDA the weights share the pool with activations; on CPU they are already in RSS
+        if device != "cuda":
+            return 0
+        return _largest_module_bytes(pipe) if offload else weights
+
+    def required():
+        est = estimate_activation_bytes(
+            pipe, width, height, batch_size, guidance_scale,
+            plan["attention_slicing"], plan["vae_slicing"], plan["vae_tiling"],
+        )
+        plan["estimate"] = est
+        return est["peak"] + resident_weights(plan["cpu_offload"])
+
+    if budget is None:
+        required()
+        plan["reasons"].append("memory budget unknown, no savers enabled")
+        return plan
+
+    if device == "cuda":
+        # Weights already resident on the GPU are part of what we can use
+        budget += resident_weights(offloaded_now)
+        plan["budget_bytes"] = budget
+    limit = budget * MEMORY_HEADROOM
+
+    steps = [("vae_slicing", batch_size > 1), ("vae_tiling", True), ("attention_slicing", True), ("cpu_offload", device == "cuda")]
+    for saver, applicable in steps:
+        need = required()
+        if need <= limit:
+            break
+        if not applicable:
+            continue
+        plan[saver] = True
+        plan["reasons"].append(f"{saver}: need {need / 2**20:.0f} MB > limit {limit / 2**20:.0f} MB")
+    need = required()
+    plan["required_bytes"] = need
+    if need > limit:
+        plan["reasons"].append(f"still over budget after all savers ({need / 2**20:.0f} MB > {limit / 2**20:.0f} MB)")
+    return plan
+
+
+def apply_memory_plan(pipe, plan):
+    # Only touch settings that change, so repeated requests of the same size are free
+    state = runtime_flags(pipe)
+    if state.get("attention_slicing", False) != plan["attention_slicing"]:
+        if plan["attention_slicing"]:
+            pipe.enable_attention_slicing("max")
+        else:
+            pipe.disable_attention_slicing()
+    if state.get("vae_slicing", False) != plan["vae_slicing"]:
+        if plan["vae_slicing"]:
+            pipe.enable_vae_slicing()
+        else:
+            pipe.disable_vae_slicing()
+    if state.get("vae_tiling", False) != plan["vae_tiling"]:
+        if plan["vae_tiling"]:
+            pipe.enable_vae_tiling()
+        else:
+            pipe.disable_vae_tiling()
+    if plan["device"] == "cuda" and state.get("cpu_offload", False) != plan["cpu_offload"]:
+        if plan["cpu_offload"]:
+            pipe.enable_model_cpu_offload()
+        elif hasattr(pipe, "remove_all_hooks"):
+            pipe.remove_all_hooks()
+            pipe.to("cuda")
+        else:
+            plan["cpu_offload"] = True # Older diffusers cannot undo offload; keep it on
+            plan["reasons"].append("cpu_offload kept: this diffusers version cannot remove offload hooks")
+    set_runtime_flags(
+        pipe,
+        attention_slicing=plan["attention_slicing"], vae_slicing=plan["vae_slicing"],
+        vae_tiling=plan["vae_tiling"], cpu_offload=plan["cpu_offload"],
+    )
+    log_memory_plan(plan)
+
+
+def describe_plan(plan):
+    enabled = [name for name in ("vae_slicing", "vae_tiling", "attention_slicing", "cpu_offload") if plan[name]]
+    est = plan.get("estimate", {})
+    return (
+        f"{plan['width']}x{plan['height']} x{plan['batch_size']} on {plan['device']}: "
+        f"est. peak {est.get('peak', 0) / 2**20:.0f} MB, "
+        f"budget {(plan['budget_bytes'] or 0) / 2**20:.0f} MB -> "
+        f"{', '.join(enabled) if enabled else 'fast path (no memory savers)'}"
+    )
+
+
+def log_memory_plan(plan):
+    logger.info("Memory plan: %s", describe_plan(plan))
+    for reason in plan["reasons"]:
+        logger.info("  %s", reason)
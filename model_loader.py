@@ -0,0 +1,188 @@
+import concurrent.futures
+import datetime
+import importlib
+import importlib.util
+import json
+import logging
+import threading
+import time
+
+from config import MODEL_MANIFEST_PATH, PARALLEL_COMPONENT_LOAD, COMPONENT_LOAD_WORKERS
+from lazy_imports import torch
+
+logger = logging.getLogger("studio.models")
+
+# --- Model load fast path ---
+# from_pretrained is tried with safetensors + fp16 variant first and falls back to
+# other formats. For a model without those files, every cold load used to pay for a
+# failed attempt. The format that worked is recorded per (model ID, dtype) in
+# MODEL_MANIFEST_PATH, and later loads go straight to it. A stale entry (files
+# changed) falls back to the full search.
+#
+# Weights are loaded with low_cpu_mem_usage (memory-mapped safetensors, no random
+# init) when accelerate is installed. Loading the pipeline's torch components (UNet,
+# VAE, text encoder, ...) concurrently is opt-in (PARALLEL_COMPONENT_LOAD): diffusers'
+# from_pretrained is not thread-safe, and concurrent loads of a saved SD pipeline left
+# UNet/VAE parameters on the meta device, so pipe.to(device) failed. Keep it off until
+# no meta parameters remain after a parallel load and benchmarks/model_load.py shows
+# it is faster.
+# The manifest also keeps the last cold (format search) and warm (manifest hit)
+# load time of each model.
+
+_manifest_lock = threading.Lock()
+
+
+def _dtype_name(torch_dtype):
+    return str(torch_dtype).replace("torch.", "")
+
+def _manifest_key(model_id, torch_dtype):
+    return f"{model_id}|{_dtype_name(torch_dtype)}"
+
+def read_manifest():
+    try:
+        return json.loads(MODEL_MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(manifest):
+    MODEL_MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MODEL_MANIFEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    tmp_path.replace(MODEL_MANIFEST_PATH)
+
+def _update_manifest(key, **fields):
+    with _manifest_lock:
+        manifest = read_manifest()
+        manifest.setdefault(key, {}).update(fields)
+        try:
+            _write_manifest(manifest)
+        except OSError as e:
+            logger.warning("Could not write model manifest: %s", e)
+
+def forget_model(model_id):
+    # Drops every recorded format for model_id, so the next load searches again
+    with _manifest_lock:
+        manifest = read_manifest()
+        kept = {k: v for k, v in manifest.items() if k.rsplit("|", 1)[0] != model_id}
+        if len(kept) != len(manifest):
+            _write_manifest(kept)
+
+
+def format_candidates(torch_dtype):
+    candidates = [{"use_safetensors": True, "variant": None}, {"use_safetensors": False, "variant": None}]
+    if torch_dtype == torch.float16:
+        candidates.insert(0, {"use_safetensors": True, "variant": "fp16"}) # Common variant for fp16 models
+    return candidates
+
+def describe_format(fmt):
+    return ("safetensors" if fmt["use_safetensors"] else ".bin") + (f"/{fmt['variant']} variant" if fmt["variant"] else "")
+
+
+def _weight_kwargs(torch_dtype, fmt):
+    kwargs = {"torch_dtype": torch_dtype, "use_safetensors": fmt["use_safetensors"]}
+    if fmt["variant"]:
+        kwargs["variant"] = fmt["variant"]
+    if importlib.util.find_spec("accelerate") is not None:
+        kwargs["low_cpu_mem_usage"] = True # Memory-mapped safetensors, no random init before loading
+    return kwargs
+
+def _component_classes(pipeline_class, model_id):
+    # model_index.json: {"unet": ["diffusers", "UNet2DConditionModel"], ...}; only torch modules carry weights
+    classes = {}
+    for name, value in pipeline_class.load_config(model_id).items():
+        if name.startswith("_") or not isinstance(value, (list, tuple)) or len(value) != 2 or None in value:
+            continue
+        try:
+            cls = getattr(importlib.import_module(value[0]), value[1])
+        except (ImportError, AttributeError):
+            continue # from_pretrained resolves it itself
+        if isinstance(cls, type) and issubclass(cls, torch.nn.Module):
+            classes[name] = cls
+    return classes
+
+def _module_registration():
+    return torch.nn.Module.register_parameter, torch.nn.Module.register_buffer
+
+def _restore_module_registration(saved):
+    # Guard against a loader that patched module registration and did not put it back
+    if _module_registration() != saved:
+        logger.warning("torch.nn.Module registration was left patched after loading; restoring it")
+        torch.nn.Module.register_parameter, torch.nn.Module.register_buffer = saved
+
+def _load_components_parallel(pipeline_class, model_id, weight_kwargs, skip=()):
+    # Failures are dropped, not raised: from_pretrained then loads that component itself
+    # and reports the real error if the format is wrong
+    try:
+        classes = {name: cls for name, cls in _component_classes(pipeline_class, model_id).items() if name not in skip}
+    except (OSError, ValueError) as e:
+        logger.info("Parallel component load skipped for %s: %s", model_id, e)
+        return {}
+    if len(classes) < 2:
+        return {}
+    components = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(COMPONENT_LOAD_WORKERS, len(classes))) as executor:
+        futures = {
+            executor.submit(cls.from_pretrained, model_id, subfolder=name, **weight_kwargs): name
+            for name, cls in classes.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                components[futures[future]] = future.result()
+            except Exception as e:
+                logger.info("Parallel load of %s/%s failed (%s); leaving it to from_pretrained", model_id, futures[future], e)
+    return components
+
+
+def load_from_pretrained(pipeline_class, model_id, torch_dtype, components=None, parallel=PARALLEL_COMPONENT_LOAD):
+    # -> (pipe, info). info: format, manifest_hit, failed_attempts, parallel, seconds.
+    # Raises the last loading error when no format works.
+    components = dict(components or {})
+    key = _manifest_key(model_id, torch_dtype)
+    recorded = read_manifest().get(key, {}).get("format")
+    candidates = format_candidates(torch_dtype)
+    if recorded:
+        candidates = [recorded] + [c for c in candidates if c != recorded]
+
+    start = time.perf_counter()
+    failed_attempts = []
+    registration = _module_registration()
+    for fmt in candidates:
+        weight_kwargs = _weight_kwargs(torch_dtype, fmt)
+        try:
+            loaded = _load_components_parallel(pipeline_class, model_id, weight_kwargs, skip=components) if parallel else {}
+            pipe = pipeline_class.from_pretrained(model_id, **weight_kwargs, **components, **loaded)
+        except (OSError, ValueError, EnvironmentError) as e:
+            failed_attempts.append(f"{describe_format(fmt)} ({e})")
+            last_error = e
+            continue
+        finally:
+            _restore_module_registration(registration)
+        break
+    else:
+        raise last_error
+
+    seconds = time.perf_counter() - start
+    manifest_hit = fmt == recorded and not failed_attempts
+    timing = {"warm_load_s": seconds} if manifest_hit else {"cold_load_s": seconds}
+    _update_manifest(key, format=fmt, updated=datetime.datetime.now().isoformat(), **timing)
+    return pipe, {
+        "format": describe_format(fmt), "manifest_hit": manifest_hit, "failed_attempts": failed_attempts,
+        "parallel": parallel, "seconds": seconds,
+    }
+
+
+def main():
+    # Per-model load timings recorded in the manifest
+    manifest = read_manifest()
+    if not manifest:
+        print(f"No models recorded in {MODEL_MANIFEST_PATH} yet.")
+        return
+    print(f"{'model|dtype':<60} {'format':<24} {'cold':>8} {'warm':>8}")
+    for key, entry in sorted(manifest.items()):
+        cold, warm = entry.get("cold_load_s"), entry.get("warm_load_s")
+        print(f"{key:<60} {describe_format(entry['format']):<24} "
+              f"{f'{cold:.1f}s' if cold is not None else '-':>8} {f'{warm:.1f}s' if warm is not None else '-':>8}")
+
+
+if __name__ == "__main__":
+    main()
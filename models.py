@@ -1,60 +1,52 @@
 import streamlit as st
-import torch
-from diffusers import StableDiffusionInpaintPipeline, StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
+from lazy_imports import cuda_available
+from performance import cpu_perf_options, configure_cpu_threads, set_runtime_flags
+from engine import build_pipeline, pipeline_class_for, EngineError
+
+def _on_load_event(event, payload):
+    if event == "info":
+        st.write(payload)
+    elif event == "warning":
+        st.warning(payload)
+    elif event == "model_load":
+        # Only cache misses reach the loader, so this is the real (cold) load time
+        st.session_state.last_model_load = payload
 
 @st.cache_resource
-def load_pipeline(pipeline_class, model_id):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if device == "cuda" else torch.float32
-    st.write(f"Loading {pipeline_class.__name__} for {model_id} on {device}...")
-
+def load_pipeline(pipeline_class, model_id, channels_last=False, compile_unet=False, quantize_int8=False):
     try:
-        pipe = pipeline_class.from_pretrained(
-            model_id,
-            torch_dtype=torch_dtype,
-            use_safetensors=True,
-            variant="fp16" if torch_dtype == torch.float16 else None # Common variant for fp16 models
+        return build_pipeline(
+            pipeline_class, model_id,
+            channels_last=channels_last, compile_unet=compile_unet, quantize_int8=quantize_int8,
+            on_event=_on_load_event,
         )
-    except (OSError, ValueError, EnvironmentError) as e1:
-        st.warning(f"Could not load with safetensors/fp16 variant ({e1}). Trying without.")
-        try:
-            pipe = pipeline_class.from_pretrained(
-                model_id,
-                torch_dtype=torch_dtype,
-                use_safetensors=False
-            )
-        except Exception as e2:
-            st.error(f"Failed to load model {model_id}. Error: {e2}")
-            st.stop() # Stop execution if model fails to load
-
-
-    pipe = pipe.to(device)
-
-    # Optional: Enable memory optimizations if on CUDA
-    if device == "cuda":
-        try:
-            pipe.enable_model_cpu_offload() # Reduces VRAM usage significantly
-            # pipe.enable_xformers_memory_efficient_attention() # Can speed up but needs xformers installed
-            st.write("Enabled CPU offloading for model.")
-        except AttributeError:
-            st.write("CPU offloading not available for this pipeline.")
-        except ImportError:
-            st.write("xformers not installed, memory efficient attention disabled.")
-
-
-    if hasattr(pipe, 'safety_checker') and pipe.safety_checker is not None:
-        # It's generally recommended to keep the safety checker unless you have specific reasons.
-        # pipe.safety_checker = None
-        # st.warning("Safety checker disabled for this model.")
-        pass # Keep safety checker by default
-
+    except EngineError as e:
+        st.error(str(e))
+        st.stop() # Stop execution if model fails to load
+
+def _load_with_runtime_options(pipeline_class, model_id):
+    if cuda_available():
+        return load_pipeline(pipeline_class, model_id)
+
+    # CPU performance mode: threads are process-wide and autocast is per call,
+    # so only the module-level knobs go into the cache key.
+    options = cpu_perf_options(st.session_state.get("cpu_perf_options"))
+    configure_cpu_threads(options["num_threads"], options["num_interop_threads"])
+    pipe, device = load_pipeline(
+        pipeline_class, model_id,
+        channels_last=options["channels_last"],
+        compile_unet=options["compile_unet"],
+        quantize_int8=options["quantize_int8"],
+    )
+    set_runtime_flags(pipe, bf16_autocast=options["bf16_autocast"])
     return pipe, device
 
+# Pipeline classes are resolved here, not at import time: diffusers is only imported once a model is needed
 def load_inpainting_model(model_id):
-    return load_pipeline(StableDiffusionInpaintPipeline, model_id)
+    return _load_with_runtime_options(pipeline_class_for("inpaint"), model_id)
 
 def load_text2img_model(model_id):
-    return load_pipeline(StableDiffusionPipeline, model_id)
+    return _load_with_runtime_options(pipeline_class_for("text2img"), model_id)
 
 def load_img2img_model(model_id):
-    return load_pipeline(StableDiffusionImg2ImgPipeline, model_id)
\ No newline at end of file
+    return _load_with_runtime_options(pipeline_class_for("img2img"), model_id)
\ No newline at end of file
@@ -2,16 +2,22 @@ import streamlit as st
 from PIL import Image, ImageDraw
 import numpy as np
 from streamlit_drawable_canvas import st_canvas
-import io
 import zipfile
-import base64
 import uuid
 import datetime
-
-from utils import resize_image, save_image_to_disk
-from models import load_inpainting_model, load_text2img_model
-from processing import process_inpainting, process_text2img
+import os
+import shutil
+import threading
+
+from normalize import normalized_size
+from lazy_imports import cuda_available
+from config import SAVE_DIR, BATCH_RESULTS_DIR, BATCH_THUMBNAIL_SIZE, INPAINT_MAX_SIZE, ENHANCE_MAX_SIZE
+from models import load_inpainting_model, load_text2img_model, load_img2img_model
+from processing import process_inpainting, process_text2img, process_img2img
+from batch_runner import item_seed, prepare_inpaint_mask, prepare_enhance_image
+from worker_pool import WorkerPool, tuned_split
 from projects import save_project, load_projects
+from upload_cache import get_upload_cache
 
 def batch_processing_app(model_id, seed, guidance_scale, num_inference_steps, strength, width, height):
     st.markdown('<div class="info-box">Process multiple images or generate variations with consistent settings.</div>', unsafe_allow_html=True)
@@ -40,6 +46,9 @@ def batch_processing_app(model_id, seed, guidance_scale, num_inference_steps, st
     )
     operation_type = st.session_state.batch_op_type
 
+    if not cuda_available():
+        _worker_settings(operation_type, model_id)
+
 
     # --- UI based on Operation Type ---
     if operation_type == "Inpainting (Uniform Mask)":
@@ -50,32 +59,20 @@ def batch_processing_app(model_id, seed, guidance_scale, num_inference_steps, st
         batch_enhancement_ui(model_id, seed, guidance_scale, num_inference_steps, strength)
 
     # --- Display Results ---
+    # Results live on disk (st.session_state.batch_run_dir); session state only holds paths + thumbnails
     if st.session_state.batch_results_output:
         st.markdown("---")
         st.markdown("### Batch Results")
-
-        cols = st.columns(min(4, len(st.session_state.batch_results_output)))
-        for i, result in enumerate(st.session_state.batch_results_output):
-            col = cols[i % len(cols)]
-            with col:
-                st.image(result, caption=f"Result {i+1}", use_column_width=True)
+        _render_results_grid(st.container(), st.session_state.batch_results_output)
 
         st.markdown("---")
         col_dl, col_save = st.columns(2)
         with col_dl:
             if st.button("📥 Download All as ZIP", key="batch_download_zip"):
-                zip_buffer = io.BytesIO()
                 try:
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        for i, img in enumerate(st.session_state.batch_results_output):
-                            img_buffer = io.BytesIO()
-                            img.save(img_buffer, format="PNG")
-                            zip_file.writestr(f"result_{i+1}.png", img_buffer.getvalue())
-
-                    zip_buffer.seek(0)
-                    b64 = base64.b64encode(zip_buffer.read()).decode()
-                    href = f'<a href="data:application/zip;base64,{b64}" download="batch_results.zip" style="background-color:#3b82f6;color:white;padding:8px 16px;text-decoration:none;border-radius:4px;font-weight:bold;">Click to Download ZIP</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                    zip_path = _write_results_zip()
+                    with open(zip_path, "rb") as f:
+                        st.download_button("Click to Download ZIP", f, file_name="batch_results.zip", mime="application/zip", key="batch_zip_file")
                 except Exception as e:
                     st.error(f"Failed to create ZIP file: {e}")
 
@@ -84,13 +81,16 @@ def batch_processing_app(model_id, seed, guidance_scale, num_inference_steps, st
             if project_name_batch and st.button("💾 Save Batch Project", key="batch_save_project"):
                 image_paths = []
                 success = True
-                for i, img in enumerate(st.session_state.batch_results_output):
-                    filepath = save_image_to_disk(img, f"{project_name_batch}_{i+1}")
-                    if filepath:
+                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                for i, result in enumerate(st.session_state.batch_results_output):
+                    # Already PNG on disk: copy instead of decoding and re-encoding
+                    filepath = SAVE_DIR / f"{project_name_batch}_{i+1}_{timestamp}.png"
+                    try:
+                        shutil.copyfile(result["path"], filepath)
                         image_paths.append(str(filepath))
-                    else:
+                    except OSError as e:
                         success = False
-                        st.error(f"Failed to save image #{i+1} for project.")
+                        st.error(f"Failed to save image #{i+1} for project: {e}")
                         break
 
                 if success and image_paths:
@@ -106,6 +106,97 @@ def batch_processing_app(model_id, seed, guidance_scale, num_inference_steps, st
                     if save_project(project_name_batch, project_data):
                         st.session_state.projects = load_projects() # Refresh list
 
+# --- Results on disk ---
+def _start_result_run():
+    run_dir = BATCH_RESULTS_DIR / f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    st.session_state.batch_run_dir = str(run_dir)
+    st.session_state.batch_results_output = []
+    # Live grid while the batch runs; emptied afterwards, the results section takes over
+    return st.empty()
+
+def _store_result(image, live_grid):
+    results = st.session_state.batch_results_output
+    path = os.path.join(st.session_state.batch_run_dir, f"result_{len(results)+1:04d}.png")
+    image.save(path)
+    thumbnail = image.copy()
+    thumbnail.thumbnail(BATCH_THUMBNAIL_SIZE)
+    results.append({"path": path, "thumbnail": thumbnail})
+    _render_results_grid(live_grid.container(), results)
+
+def _render_results_grid(container, results):
+    cols = container.columns(min(4, len(results)))
+    for i, result in enumerate(results):
+        cols[i % len(cols)].image(result["thumbnail"], caption=f"Result {i+1}", use_column_width=True)
+
+def _write_results_zip():
+    zip_path = os.path.join(st.session_state.batch_run_dir, "batch_results.zip")
+    # PNGs are already compressed; storing them avoids a second deflate pass
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zip_file:
+        for i, result in enumerate(st.session_state.batch_results_output):
+            zip_file.write(result["path"], f"result_{i+1}.png")
+    return zip_path
+
+# --- Worker processes (CPU hosts) ---
+_OP_KINDS = {
+    "Inpainting (Uniform Mask)": "inpaint",
+    "Text-to-Image Variations": "text2img",
+    "Bulk Image Enhancement (Img2Img)": "img2img",
+}
+
+def _worker_settings(operation_type, model_id):
+    cpu_count = os.cpu_count() or 1
+    tuned = tuned_split(_OP_KINDS[operation_type], model_id)
+    with st.expander("⚙️ Parallel Workers"):
+        st.number_input(
+            "Worker processes", 1, max(1, min(16, cpu_count)), tuned[0] if tuned else 1, key="batch_workers",
+            help="Each worker loads its own copy of the model and gets an equal share of the CPU threads. "
+                 "Run `python worker_pool.py --op <op> --model-id <model>` to find the best split for this host.",
+        )
+        if tuned:
+            st.caption(f"Tuned for this host: {tuned[0]} workers x {tuned[1]} threads.")
+
+@st.cache_resource
+def _worker_pool_slot():
+    # One pool per server, kept alive between runs so the workers' models stay loaded
+    return {"key": None, "pool": None, "lock": threading.Lock()}
+
+def _get_worker_pool(kind, model_id, workers):
+    slot = _worker_pool_slot()
+    key = (kind, model_id, workers)
+    with slot["lock"]:
+        if slot["key"] != key:
+            # Each worker holds a full model copy: shut the old pool down before starting another
+            if slot["pool"] is not None:
+                slot["pool"].close()
+                slot["pool"] = None
+            slot["pool"] = WorkerPool(kind, model_id, workers, max(1, (os.cpu_count() or 1) // workers))
+            slot["key"] = key
+        return slot["pool"]
+
+def _batch_job(op, seed, i, prompt, negative_prompt, guidance_scale, num_inference_steps,
+               strength=0.75, image=None, mask=None, width=512, height=512):
+    return {
+        "op": op, "id": str(i), "prompt": prompt, "negative_prompt": negative_prompt,
+        "seed": item_seed(seed, i) if seed != -1 else np.random.randint(0, 2**32 - 1),
+        "guidance_scale": guidance_scale, "steps": num_inference_steps, "strength": strength,
+        "width": width, "height": height, "num_images": 1, "image": image, "mask": mask,
+        "scheduler": st.session_state.get("scheduler_preset"),
+    }
+
+def _run_with_workers(op, model_id, jobs, status_text, progress_bar, live_grid):
+    workers = st.session_state.batch_workers
+    status_text.text(f"Starting {workers} workers (first run loads the model in each)...")
+    pool = _get_worker_pool(op, model_id, workers)
+    # Results arrive in submission order while later items are still running
+    for i, result in enumerate(pool.map(jobs)):
+        if result["images"]:
+            _store_result(result["images"][0], live_grid)
+        else:
+            st.warning(f"Failed to process item {i+1}: {result['error']}")
+        status_text.text(f"Finished {i+1}/{len(jobs)}...")
+        progress_bar.progress((i + 1) / len(jobs))
+
 # --- Specific UI and Logic Functions ---
 
 def batch_inpainting_ui(model_id, seed, guidance_scale, num_inference_steps, strength):
@@ -113,14 +204,11 @@ def batch_inpainting_ui(model_id, seed, guidance_scale, num_inference_steps, str
     uploaded_files = st.file_uploader("Upload images for batch inpainting", type=["png", "jpg", "jpeg"], accept_multiple_files=True, key="batch_inpaint_upload")
 
     if uploaded_files:
-        new_images = []
-        for uploaded_file in uploaded_files:
-            try:
-                image = Image.open(uploaded_file).convert("RGB")
-                new_images.append(resize_image(image)) # Resize for consistency
-            except Exception as e:
-                st.warning(f"Could not load {uploaded_file.name}: {e}")
-        if new_images:
+        # Decoded and resized once per file; results are only cleared by a genuinely new upload
+        new_images, changed, errors = get_upload_cache().load("batch_inpaint_upload", uploaded_files, transform_key="normalized512", target_size=lambda size: normalized_size(size, INPAINT_MAX_SIZE))
+        for name, e in errors:
+            st.warning(f"Could not load {name}: {e}")
+        if new_images and changed:
              st.session_state.batch_images_input = new_images
              st.session_state.batch_results_output = [] # Clear old results
 
@@ -157,7 +245,7 @@ def batch_inpainting_ui(model_id, seed, guidance_scale, num_inference_steps, str
             mask_file = st.file_uploader("Upload mask file (white = replace)", type=["png", "jpg", "jpeg"], key="batch_inpaint_mask_upload")
             if mask_file:
                 try:
-                     temp_mask = Image.open(mask_file).convert("L")
+                     temp_mask, _ = get_upload_cache().load_one("batch_inpaint_mask_upload", mask_file, mode="L")
                      st.image(temp_mask, caption="Uploaded Mask", width=200)
                 except Exception as e:
                      st.error(f"Error loading mask file: {e}")
@@ -174,40 +262,40 @@ def batch_inpainting_ui(model_id, seed, guidance_scale, num_inference_steps, str
                       st.warning("Please upload images and provide a mask.")
                       return
 
-                 st.session_state.batch_results_output = []
+                 live_grid = _start_result_run()
                  progress_bar = st.progress(0.0)
                  status_text = st.empty()
                  try:
-                      with st.spinner("Loading inpainting model..."):
-                           pipe, device = load_inpainting_model(model_id)
-
-                      total_images = len(st.session_state.batch_images_input)
-                      for i, img in enumerate(st.session_state.batch_images_input):
-                           status_text.text(f"Processing image {i+1}/{total_images}...")
-
-                           # Resize mask to match current image
-                           resized_mask = st.session_state.batch_mask_input.resize(img.size, Image.NEAREST)
-
-                           # Ensure mask is inverted correctly (white = inpaint)
-                           mask_array = np.array(resized_mask)
-                           if np.mean(mask_array) < 127: # Mostly black means user likely painted area to *keep*
-                                mask_to_use = Image.fromarray(255 - mask_array)
-                           else:
-                                mask_to_use = resized_mask
-
-                           # Use unique seed per image if master seed is random, else increment
-                           img_seed = (seed + i) if seed != -1 else np.random.randint(0, 2**32 - 1)
-
-                           result, _ = process_inpainting(
-                                pipe, img, mask_to_use, prompt, negative_prompt,
-                                img_seed, guidance_scale, num_inference_steps, strength
-                           )
-                           if result:
-                                st.session_state.batch_results_output.append(result)
-                           else:
-                                st.warning(f"Failed to process image {i+1}.")
-                           progress_bar.progress((i + 1) / total_images)
-
+                      if st.session_state.get("batch_workers", 1) > 1:
+                          _run_with_workers("inpaint", model_id, [
+                                _batch_job("inpaint", seed, i, prompt, negative_prompt, guidance_scale, num_inference_steps,
+                                           strength=strength, image=img, mask=st.session_state.batch_mask_input)
+                                for i, img in enumerate(st.session_state.batch_images_input)], status_text, progress_bar, live_grid)
+                      else:
+                          with st.spinner("Loading inpainting model..."):
+                               pipe, device = load_inpainting_model(model_id)
+
+                          total_images = len(st.session_state.batch_images_input)
+                          for i, img in enumerate(st.session_state.batch_images_input):
+                               status_text.text(f"Processing image {i+1}/{total_images}...")
+
+                               # Resize mask to match current image, white = inpaint
+                               mask_to_use = prepare_inpaint_mask(img, st.session_state.batch_mask_input)
+
+                               # Use unique seed per image if master seed is random, else increment
+                               img_seed = item_seed(seed, i) if seed != -1 else np.random.randint(0, 2**32 - 1)
+
+                               result, _ = process_inpainting(
+                                    pipe, img, mask_to_use, prompt, negative_prompt,
+                                    img_seed, guidance_scale, num_inference_steps, strength
+                               )
+                               if result:
+                                    _store_result(result, live_grid)
+                               else:
+                                    st.warning(f"Failed to process image {i+1}.")
+                               progress_bar.progress((i + 1) / total_images)
+
+                      live_grid.empty() # The results section below renders the final grid
                       status_text.success(f"Batch inpainting complete! Processed {len(st.session_state.batch_results_output)} images.")
                       # Store params for potential project save
                       st.session_state.batch_last_run_params = {
@@ -216,6 +304,7 @@ def batch_inpainting_ui(model_id, seed, guidance_scale, num_inference_steps, str
                            'num_images': len(st.session_state.batch_results_output)
                            }
                  except Exception as e:
+                      live_grid.empty()
                       status_text.error(f"Batch inpainting failed: {e}")
 
 def batch_text2img_ui(model_id, seed, guidance_scale, num_inference_steps, width, height):
@@ -236,30 +325,36 @@ def batch_text2img_ui(model_id, seed, guidance_scale, num_inference_steps, width
                 st.write(f"{i+1}. `{base_prompt}, {var}`")
 
     if st.button("✨ Generate Batch Variations", key="batch_t2i_process", disabled=not variation_list):
-        st.session_state.batch_results_output = []
+        live_grid = _start_result_run()
         progress_bar = st.progress(0.0)
         status_text = st.empty()
         try:
-            with st.spinner("Loading text-to-image model..."):
-                pipe, device = load_text2img_model(model_id)
-
-            total_variations = len(variation_list)
-            for i, var in enumerate(variation_list):
-                 status_text.text(f"Generating variation {i+1}/{total_variations}...")
-                 full_prompt = f"{base_prompt}, {var}"
-
-                 img_seed = (seed + i) if seed != -1 else np.random.randint(0, 2**32 - 1)
-
-                 results, _ = process_text2img(
-                      pipe, full_prompt, negative_prompt, img_seed,
-                      guidance_scale, num_inference_steps, width, height, num_images=1
-                 )
-                 if results:
-                      st.session_state.batch_results_output.append(results[0])
-                 else:
-                      st.warning(f"Failed to generate variation {i+1}.")
-                 progress_bar.progress((i + 1) / total_variations)
-
+            if st.session_state.get("batch_workers", 1) > 1:
+                _run_with_workers("text2img", model_id, [
+                    _batch_job("text2img", seed, i, f"{base_prompt}, {var}", negative_prompt, guidance_scale, num_inference_steps, width=width, height=height)
+                    for i, var in enumerate(variation_list)], status_text, progress_bar, live_grid)
+            else:
+                with st.spinner("Loading text-to-image model..."):
+                    pipe, device = load_text2img_model(model_id)
+
+                total_variations = len(variation_list)
+                for i, var in enumerate(variation_list):
+                     status_text.text(f"Generating variation {i+1}/{total_variations}...")
+                     full_prompt = f"{base_prompt}, {var}"
+
+                     img_seed = item_seed(seed, i) if seed != -1 else np.random.randint(0, 2**32 - 1)
+
+                     results, _ = process_text2img(
+                          pipe, full_prompt, negative_prompt, img_seed,
+                          guidance_scale, num_inference_steps, width, height, num_images=1
+                     )
+                     if results:
+                          _store_result(results[0], live_grid)
+                     else:
+                          st.warning(f"Failed to generate variation {i+1}.")
+                     progress_bar.progress((i + 1) / total_variations)
+
+            live_grid.empty() # The results section below renders the final grid
             status_text.success(f"Generated {len(st.session_state.batch_results_output)} variations!")
             # Store params
             st.session_state.batch_last_run_params = {
@@ -268,6 +363,7 @@ def batch_text2img_ui(model_id, seed, guidance_scale, num_inference_steps, width
                  'width': width, 'height': height, 'model_id': model_id, 'num_images': len(st.session_state.batch_results_output)
             }
         except Exception as e:
+            live_grid.empty()
             status_text.error(f"Batch generation failed: {e}")
 
 def batch_enhancement_ui(model_id, seed, guidance_scale, num_inference_steps, strength):
@@ -275,15 +371,12 @@ def batch_enhancement_ui(model_id, seed, guidance_scale, num_inference_steps, st
     uploaded_files = st.file_uploader("Upload images for enhancement", type=["png", "jpg", "jpeg"], accept_multiple_files=True, key="batch_enhance_upload")
 
     if uploaded_files:
-        new_images = []
-        for uploaded_file in uploaded_files:
-             try:
-                  image = Image.open(uploaded_file).convert("RGB")
-                  # Resize slightly if needed, maybe larger max size for enhancement
-                  new_images.append(resize_image(image, max_size=1024))
-             except Exception as e:
-                  st.warning(f"Could not load {uploaded_file.name}: {e}")
-        if new_images:
+        # Resize slightly if needed, maybe larger max size for enhancement
+        new_images, changed, errors = get_upload_cache().load(
+            "batch_enhance_upload", uploaded_files, transform_key="normalized1024", target_size=lambda size: normalized_size(size, ENHANCE_MAX_SIZE))
+        for name, e in errors:
+            st.warning(f"Could not load {name}: {e}")
+        if new_images and changed:
              st.session_state.batch_images_input = new_images
              st.session_state.batch_results_output = []
 
@@ -306,44 +399,42 @@ def batch_enhancement_ui(model_id, seed, guidance_scale, num_inference_steps, st
         st.caption("Controls how much the AI alters the original image based on the prompt.")
 
         if st.button("✨ Enhance Batch Images", key="batch_enhance_process"):
-            st.session_state.batch_results_output = []
+            live_grid = _start_result_run()
             progress_bar = st.progress(0.0)
             status_text = st.empty()
             try:
-                with st.spinner("Loading enhancement model (Img2Img)..."):
-                    # Use Img2Img model for enhancement
-                    pipe, device = load_img2img_model(model_id)
-
-                total_images = len(st.session_state.batch_images_input)
-                for i, img in enumerate(st.session_state.batch_images_input):
-                    status_text.text(f"Enhancing image {i+1}/{total_images}...")
-
-                    # Resize for model compatibility if needed
-                    width, height = img.size
-                    target_width = (width // 8) * 8
-                    target_height = (height // 8) * 8
-                    if target_width == 0: target_width = 512
-                    if target_height == 0: target_height = 512
-
-                    img_to_process = img
-                    if img.size != (target_width, target_height):
-                        img_to_process = img.resize((target_width, target_height), Image.LANCZOS)
-
-                    img_seed = (seed + i) if seed != -1 else np.random.randint(0, 2**32 - 1)
-
-                    # Call process_img2img
-                    result, _ = process_img2img(
-                        pipe, img_to_process, enhancement_prompt, negative_prompt,
-                        img_seed, guidance_scale, num_inference_steps, strength
-                    )
-                    if result:
-                        # Optionally resize back to original aspect ratio if needed?
-                        # For now, keep the processed size.
-                        st.session_state.batch_results_output.append(result)
-                    else:
-                        st.warning(f"Failed to enhance image {i+1}.")
-                    progress_bar.progress((i + 1) / total_images)
-
+                if st.session_state.get("batch_workers", 1) > 1:
+                    _run_with_workers("img2img", model_id, [
+                        _batch_job("img2img", seed, i, enhancement_prompt, negative_prompt, guidance_scale, num_inference_steps, strength=strength, image=img)
+                        for i, img in enumerate(st.session_state.batch_images_input)], status_text, progress_bar, live_grid)
+                else:
+                    with st.spinner("Loading enhancement model (Img2Img)..."):
+                        # Use Img2Img model for enhancement
+                        pipe, device = load_img2img_model(model_id)
+
+                    total_images = len(st.session_state.batch_images_input)
+                    for i, img in enumerate(st.session_state.batch_images_input):
+                        status_text.text(f"Enhancing image {i+1}/{total_images}...")
+
+                        # Resize for model compatibility if needed
+                        img_to_process = prepare_enhance_image(img)
+
+                        img_seed = item_seed(seed, i) if seed != -1 else np.random.randint(0, 2**32 - 1)
+
+                        # Call process_img2img
+                        result, _ = process_img2img(
+                            pipe, img_to_process, enhancement_prompt, negative_prompt,
+                            img_seed, guidance_scale, num_inference_steps, strength
+                        )
+                        if result:
+                            # Optionally resize back to original aspect ratio if needed?
+                            # For now, keep the processed size.
+                            _store_result(result, live_grid)
+                        else:
+                            st.warning(f"Failed to enhance image {i+1}.")
+                        progress_bar.progress((i + 1) / total_images)
+
+                live_grid.empty() # The results section below renders the final grid
                 status_text.success(f"Batch enhancement complete! Processed {len(st.session_state.batch_results_output)} images.")
                  # Store params
                 st.session_state.batch_last_run_params = {
@@ -352,4 +443,5 @@ def batch_enhancement_ui(model_id, seed, guidance_scale, num_inference_steps, st
                      'num_images': len(st.session_state.batch_results_output)
                      }
             except Exception as e:
+                 live_grid.empty()
                  status_text.error(f"Batch enhancement failed: {e}")
\ No newline at end of file
@@ -1,10 +1,11 @@
 import streamlit as st
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import ImageFilter, ImageEnhance
 import numpy as np
 
 from utils import resize_image, get_image_download_link, save_image_to_disk, apply_basic_adjustments, apply_filter
 from models import load_inpainting_model, load_img2img_model # Potentially need both
 from processing import process_inpainting, process_img2img # Potentially need both
+from upload_cache import get_upload_cache
 
 def image_editor_app(model_id, seed, guidance_scale, num_inference_steps, strength):
     st.markdown('<div class="info-box">Upload an image to apply adjustments, filters, or AI enhancements.</div>', unsafe_allow_html=True)
@@ -20,13 +21,12 @@ def image_editor_app(model_id, seed, guidance_scale, num_inference_steps, streng
 
     if uploaded_file is not None:
         try:
-            image = Image.open(uploaded_file).convert("RGB")
+            image, is_new = get_upload_cache().load_one("editor_upload", uploaded_file)
             st.session_state.edit_image_original = image
-            # Only reset current image and history if it's a *new* upload
-            if st.session_state.edit_image_current is None or uploaded_file.name != st.session_state.get('editor_last_uploaded_name'):
+            # Only reset current image and history if it's a *new* upload (by content, not filename)
+            if st.session_state.edit_image_current is None or is_new:
                 st.session_state.edit_image_current = image.copy()
                 st.session_state.edit_history = [image.copy()]
-                st.session_state.editor_last_uploaded_name = uploaded_file.name # Track filename
 
         except Exception as e:
             st.error(f"Error loading image: {e}")
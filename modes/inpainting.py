@@ -6,10 +6,22 @@ import uuid
 import datetime
 import os
 
-from utils import resize_image, get_image_download_link, save_image_to_disk, add_to_history
+from utils import get_image_download_link, save_image_to_disk, add_to_history
 from models import load_inpainting_model
-from processing import process_inpainting
+from processing import process_inpainting, process_inpainting_draft, process_inpainting_refine, process_inpainting_variations, variation_seeds, keep_variation_latents, result_latents
 from projects import save_project, load_projects
+from upload_cache import get_upload_cache
+from normalize import normalized_size, normalize_image, normalize_mask
+from config import INPAINT_MAX_SIZE, DRAFT_SCALE, DRAFT_STEPS, VARIATION_COUNT, VARIATION_MAX_COUNT, PROJECT_LATENTS_DEFAULT
+
+def _canvas_size(size):
+    # Resize to a manageable size for the canvas, divisible by 8
+    canvas_width = 512 # Or calculate based on aspect ratio
+    aspect_ratio = size[1] / size[0]
+    canvas_height = int(canvas_width * aspect_ratio)
+    canvas_height = (canvas_height // 8) * 8
+    if canvas_height == 0: canvas_height = 8
+    return canvas_width, canvas_height
 
 def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength):
     tabs = st.tabs(["✏️ Draw Mask", "📤 Upload Mask"])
@@ -22,6 +34,10 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
         st.session_state.result_image = None
     if 'last_seed_inpaint' not in st.session_state:
         st.session_state.last_seed_inpaint = seed
+    if 'inpaint_draft' not in st.session_state:
+        st.session_state.inpaint_draft = None
+    if 'inpaint_variations' not in st.session_state:
+        st.session_state.inpaint_variations = [] # (seed, image) pairs of the last sweep
 
     current_image = None
     current_mask = None
@@ -32,17 +48,14 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
 
         if uploaded_file_draw is not None:
             try:
-                image = Image.open(uploaded_file_draw).convert("RGB")
-                # Resize to a manageable size for the canvas, divisible by 8
-                canvas_width = 512 # Or calculate based on aspect ratio
-                aspect_ratio = image.height / image.width
-                canvas_height = int(canvas_width * aspect_ratio)
-                canvas_height = (canvas_height // 8) * 8
-                if canvas_height == 0: canvas_height = 8
-
-                st.session_state.uploaded_image = image.resize((canvas_width, canvas_height), Image.LANCZOS)
-                st.session_state.mask_image = None # Reset mask on new image
-                st.session_state.result_image = None # Reset result
+                # Decoded and resized once per file; reruns reuse it
+                image, is_new = get_upload_cache().load_one("inpaint_upload_draw", uploaded_file_draw, transform_key="canvas512", target_size=_canvas_size)
+                if is_new:
+                    st.session_state.uploaded_image = image
+                    st.session_state.mask_image = None # Reset mask on new image
+                    st.session_state.result_image = None # Reset result
+                    st.session_state.inpaint_draft = None
+                    st.session_state.inpaint_variations = []
 
             except Exception as e:
                 st.error(f"Error loading image: {e}")
@@ -92,11 +105,14 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
             uploaded_file_img = st.file_uploader("Upload image", type=["png", "jpg", "jpeg"], key="inpaint_upload_img_tab2")
             if uploaded_file_img is not None:
                 try:
-                    image = Image.open(uploaded_file_img).convert("RGB")
-                    st.session_state.uploaded_image = resize_image(image) # Resize if needed
-                    st.session_state.result_image = None # Reset result
-                    st.image(st.session_state.uploaded_image, caption="Image for Inpainting", use_column_width=True)
-                    current_image = st.session_state.uploaded_image
+                    image, is_new = get_upload_cache().load_one("inpaint_upload_img_tab2", uploaded_file_img, transform_key="normalized512", target_size=lambda size: normalized_size(size, INPAINT_MAX_SIZE))
+                    if is_new:
+                        st.session_state.uploaded_image = image
+                        st.session_state.result_image = None # Reset result
+                        st.session_state.inpaint_draft = None
+                        st.session_state.inpaint_variations = []
+                    st.image(image, caption="Image for Inpainting", use_column_width=True)
+                    current_image = image
                 except Exception as e:
                     st.error(f"Error loading image: {e}")
                     st.session_state.uploaded_image = None
@@ -105,11 +121,13 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
             uploaded_file_mask = st.file_uploader("Upload mask (white = replace)", type=["png", "jpg", "jpeg"], key="inpaint_upload_mask_tab2")
             if uploaded_file_mask is not None and st.session_state.uploaded_image:
                 try:
-                    mask = Image.open(uploaded_file_mask).convert("L")
-                     # Ensure mask matches image size
-                    if mask.size != st.session_state.uploaded_image.size:
+                    image_size = st.session_state.uploaded_image.size
+                    # Ensure mask matches image size
+                    mask, is_new = get_upload_cache().load_one(
+                        "inpaint_upload_mask_tab2", uploaded_file_mask, mode="L", transform_key=("fit", image_size),
+                        transform=lambda m: normalize_mask(m, image_size))
+                    if is_new and Image.open(uploaded_file_mask).size != image_size:
                          st.warning("Resizing mask to match image dimensions.")
-                         mask = mask.resize(st.session_state.uploaded_image.size, Image.NEAREST) # Use NEAREST for masks
                     st.session_state.mask_image = mask
                     st.image(st.session_state.mask_image, caption="Uploaded Mask", use_column_width=True)
                     current_mask = st.session_state.mask_image
@@ -132,14 +150,33 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
         with col2:
             negative_prompt = st.text_area("Negative Prompt", "blurry, low quality, text, watermark, deformed", height=100, key="inpaint_neg_prompt")
 
+        draft_mode = st.checkbox("📝 Draft first", key="inpaint_draft_mode", help=f"Inpaint a quick draft at {DRAFT_SCALE:.0%} size with up to {DRAFT_STEPS} steps, then refine it at full size from the same seed.")
+
         col_gen, col_var = st.columns(2)
         with col_gen:
-            generate_button = st.button("🎨 Generate Inpainting", key="inpaint_generate")
+            generate_button = st.button("📝 Generate Draft" if draft_mode else "🎨 Generate Inpainting", key="inpaint_generate")
         with col_var:
-            variation_button = st.button("🎲 Generate Variation", key="inpaint_variation", disabled=st.session_state.result_image is None)
+            has_result = st.session_state.inpaint_draft if draft_mode else st.session_state.result_image
+            variation_button = st.button("🎲 Generate Variations" if not draft_mode else "🎲 Generate Variation", key="inpaint_variation", disabled=has_result is None)
+            if not draft_mode:
+                variation_count = st.number_input("Seeds per sweep", 2, VARIATION_MAX_COUNT, VARIATION_COUNT, key="inpaint_variation_count", help="Variations are inpainted with new random seeds in one batched run that encodes the prompt and masked image once.")
 
 
-        if generate_button or variation_button:
+        if variation_button and not draft_mode:
+            try:
+                with st.spinner("Loading inpainting model..."):
+                    pipe, device = load_inpainting_model(model_id)
+                img_to_process = normalize_image(final_image_to_process, INPAINT_MAX_SIZE)
+                images, used_seeds = process_inpainting_variations(
+                    pipe, img_to_process, normalize_mask(final_mask_to_process, img_to_process.size), prompt, negative_prompt,
+                    variation_seeds(variation_count), guidance_scale, num_inference_steps, strength)
+                if images:
+                    st.session_state.inpaint_variations = list(zip(used_seeds, images))
+                else:
+                    st.error("Inpainting variations failed.")
+            except Exception as e:
+                st.error(f"Inpainting variations failed: {str(e)}")
+        elif generate_button or variation_button:
              if final_image_to_process and final_mask_to_process:
                 try:
                     with st.spinner("Loading inpainting model..."):
@@ -148,27 +185,15 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
                     current_seed = np.random.randint(0, 2**32 - 1) if variation_button else seed
                     st.session_state.last_seed_inpaint = current_seed
 
-                    # Resize image and mask *before* sending to pipeline if needed
-                    # The pipeline might handle it, but explicit control can be better.
-                    # Use a size compatible with the model (often 512x512 or 768x768)
-                    # For now, assume `resize_image` handled basic sizing.
-                    # Let's ensure they are divisible by 8, which is common for VAEs
-                    width, height = final_image_to_process.size
-                    target_width = (width // 8) * 8
-                    target_height = (height // 8) * 8
-                    if target_width == 0: target_width = 512 # Default fallback
-                    if target_height == 0: target_height = 512
-
-                    if final_image_to_process.size != (target_width, target_height):
-                        st.write(f"Resizing input to {target_width}x{target_height} for model compatibility.")
-                        img_to_process = final_image_to_process.resize((target_width, target_height), Image.LANCZOS)
-                        mask_to_process = final_mask_to_process.resize((target_width, target_height), Image.NEAREST)
-                    else:
-                        img_to_process = final_image_to_process
-                        mask_to_process = final_mask_to_process
+                    # Uploads and the canvas are already normalized, so this is normally a no-op
+                    img_to_process = normalize_image(final_image_to_process, INPAINT_MAX_SIZE)
+                    if img_to_process is not final_image_to_process:
+                        st.write(f"Resizing input to {img_to_process.width}x{img_to_process.height} for model compatibility.")
+                    mask_to_process = normalize_mask(final_mask_to_process, img_to_process.size)
 
 
-                    result_image, used_seed = process_inpainting(
+                    generate = process_inpainting_draft if draft_mode else process_inpainting
+                    result_image, used_seed = generate(
                         pipe,
                         img_to_process,
                         mask_to_process,
@@ -182,7 +207,9 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
 
                     st.session_state.last_seed_inpaint = used_seed
 
-                    if result_image is not None:
+                    if result_image is not None and draft_mode:
+                        st.session_state.inpaint_draft = result_image
+                    elif result_image is not None:
                         st.session_state.result_image = result_image
                         # Automatically save to history is handled inside process_inpainting
                     else:
@@ -194,6 +221,47 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
                  st.warning("Please provide both an image and a mask.")
 
 
+        if draft_mode and st.session_state.inpaint_draft is not None:
+            st.markdown("---")
+            st.markdown(f"### 📝 Draft ({st.session_state.inpaint_draft.width}x{st.session_state.inpaint_draft.height}, Seed: {st.session_state.last_seed_inpaint})")
+            draft_col, action_col = st.columns([2, 1])
+            with draft_col:
+                st.image(st.session_state.inpaint_draft, use_column_width=True)
+            with action_col:
+                if st.button("✨ Refine at full size", key="inpaint_refine"):
+                    try:
+                        with st.spinner("Loading inpainting model..."):
+                            pipe, device = load_inpainting_model(model_id)
+                        img_to_process = normalize_image(final_image_to_process, INPAINT_MAX_SIZE)
+                        refined, used_seed = process_inpainting_refine(
+                            pipe, img_to_process, normalize_mask(final_mask_to_process, img_to_process.size),
+                            prompt, negative_prompt, guidance_scale, num_inference_steps)
+                        if refined is not None:
+                            st.session_state.result_image = refined
+                            st.session_state.last_seed_inpaint = used_seed
+                    except Exception as e:
+                        st.error(f"Refining the draft failed: {str(e)}")
+                stats = st.session_state.get("last_progressive")
+                if stats and stats["mode"] == "inpaint":
+                    first_draft = f"first draft after {stats['time_to_first_image_s']:.1f} s · " if stats["time_to_first_image_s"] is not None else ""
+                    st.caption(f"Last accepted image: {first_draft}{stats['drafts']} draft(s) + refine = {stats['total_s']:.1f} s total")
+
+        if not draft_mode and st.session_state.inpaint_variations:
+            st.markdown("---")
+            st.markdown("### 🎲 Variations — pick one to keep")
+            variation_cols = st.columns(min(len(st.session_state.inpaint_variations), 4))
+            for idx, (variation_seed, variation) in enumerate(st.session_state.inpaint_variations):
+                with variation_cols[idx % len(variation_cols)]:
+                    st.image(variation, caption=f"Seed: {variation_seed}", use_column_width=True)
+                    if st.button(f"✅ Use #{idx+1}", key=f"inpaint_pick_variation_{idx}"):
+                        st.session_state.result_image = variation
+                        st.session_state.last_seed_inpaint = variation_seed
+                        keep_variation_latents("inpaint", idx)
+                        add_to_history("inpaint", variation, prompt)
+            sweep = st.session_state.get("last_variation_sweep")
+            if sweep and sweep["mode"] == "inpaint":
+                st.caption(f"Last sweep: {sweep['count']} seeds in {sweep['total_s']:.1f} s ({sweep['total_s'] / sweep['count']:.1f} s per variation)")
+
         if st.session_state.result_image is not None:
             st.markdown("---")
             st.markdown('<div class="result-container">', unsafe_allow_html=True)
@@ -227,6 +295,8 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
             # Save Project outside the result display columns
             st.markdown("---")
             project_name_inp = st.text_input("Save Project As:", key="inpaint_project_name", placeholder="e.g., Dragon Inpainting")
+            latents = result_latents("inpaint")
+            include_latents = st.checkbox("Include latents", value=PROJECT_LATENTS_DEFAULT, key="inpaint_project_latents", disabled=latents is None, help="Store the final latents with the project, so it can be re-decoded or continued without a full run.")
             if project_name_inp and st.button("💾 Save Project", key="inpaint_save_project"):
                  if final_image_to_process and final_mask_to_process and st.session_state.result_image:
                     orig_path = save_image_to_disk(final_image_to_process, f"{project_name_inp}_orig")
@@ -254,7 +324,7 @@ def inpainting_app(model_id, seed, guidance_scale, num_inference_steps, strength
                                 "result": str(result_path)
                             }
                         }
-                        if save_project(project_name_inp, project_data):
+                        if save_project(project_name_inp, project_data, latents=latents if include_latents else None):
                             st.session_state.projects = load_projects() # Refresh project list
                     else:
                         st.error("Failed to save one or more images for the project.")
@@ -3,7 +3,12 @@ from PIL import Image
 import os
 import json
 
-from projects import load_projects, load_project, delete_project # Use project utilities
+from projects import load_projects, load_project, delete_project, load_project_latents # Use project utilities
+from models import load_text2img_model, load_inpainting_model
+from processing import process_decode_latents, process_continue_text2img, process_continue_inpainting
+from normalize import normalize_image, normalize_mask
+from utils import get_image_download_link
+from config import INPAINT_MAX_SIZE, PROJECT_CONTINUE_STRENGTH
 
 def project_manager_app():
     st.markdown('<div class="info-box">Manage and revisit your saved AI image generation projects.</div>', unsafe_allow_html=True)
@@ -162,6 +167,9 @@ def display_project_details(project_data):
      else:
           st.caption("No file paths found in project data.")
 
+     if project_data.get("latents") and project_data.get("type") in ("text2img", "inpainting"):
+          display_project_latents(project_data)
+
      st.markdown("---")
      col_b1, col_b2 = st.columns([1,5]) # Give more space to delete button message
      with col_b1:
@@ -181,4 +189,56 @@ def display_project_details(project_data):
                        confirm_placeholder.empty() # Clear confirmation
                        st.experimental_rerun()
                   if c2.button("Cancel", key=f"cancel_delete_{name}"):
-                       confirm_placeholder.empty() # Clear confirmation
\ No newline at end of file
+                       confirm_placeholder.empty() # Clear confirmation
+
+
+def display_project_latents(project_data):
+     # Re-decode (VAE only) or continue denoising from the latents saved with the project
+     name = project_data.get('name', 'Unnamed')
+     latents = load_project_latents(project_data)
+     if latents is None:
+          return
+     final, steps = latents["final"], latents["intermediate_steps"]
+     params = project_data.get('params', {})
+     st.markdown("#### Saved Latents")
+     st.caption(f"Shape {tuple(final.shape)}, float16" + (f" · intermediate steps: {', '.join(map(str, steps))}" if steps else ""))
+
+     col_i, col_s, col_c = st.columns(3)
+     index = col_i.number_input("Image", 1, final.shape[0], 1, key=f"latents_index_{name}") - 1 if final.shape[0] > 1 else 0
+     sources = ["Final"] + [f"Step {step}" for step in steps]
+     source = col_s.selectbox("Latents", sources, key=f"latents_source_{name}", help="Intermediate latents are still noisy: they decode to a preview of that step.")
+     strength = col_c.slider("Continue strength", 0.05, 1.0, PROJECT_CONTINUE_STRENGTH, 0.05, key=f"latents_strength_{name}", help="Fraction of the steps re-run from the saved image.")
+     selected = final[index:index + 1] if source == "Final" else latents["intermediate"][sources.index(source) - 1][index:index + 1]
+
+     def load_model():
+          model_id = params.get("model_id")
+          with st.spinner("Loading model..."):
+               pipe, device = load_inpainting_model(model_id) if project_data["type"] == "inpainting" else load_text2img_model(model_id)
+          return pipe
+
+     col_d, col_r = st.columns(2)
+     if col_d.button("🔁 Re-decode", key=f"latents_decode_{name}"):
+          images = process_decode_latents(load_model(), selected)
+          if images:
+               st.session_state.project_latent_result = {"name": name, "image": images[0], "label": f"{source} latents, decoded"}
+     if col_r.button("✨ Continue denoising", key=f"latents_continue_{name}", disabled=source != "Final"):
+          pipe, result = load_model(), None
+          common = (params.get("prompt", ""), params.get("negative_prompt", ""), params.get("seed", -1), params.get("guidance_scale", 7.5), params.get("steps", 30))
+          if project_data["type"] == "inpainting":
+               paths = project_data.get('paths', {})
+               try:
+                    image = normalize_image(Image.open(paths["original"]).convert("RGB"), INPAINT_MAX_SIZE)
+                    mask = normalize_mask(Image.open(paths["mask"]), image.size)
+               except Exception as e:
+                    st.error(f"Could not load the project's original image and mask: {e}")
+               else:
+                    result, used_seed = process_continue_inpainting(pipe, selected, image, mask, *common, strength=strength)
+          else:
+               result, used_seed = process_continue_text2img(pipe, selected, *common, strength=strength)
+          if result is not None:
+               st.session_state.project_latent_result = {"name": name, "image": result, "label": f"Continued ({strength:.0%} of steps, seed {used_seed})"}
+
+     shown = st.session_state.get("project_latent_result")
+     if shown and shown["name"] == name:
+          st.image(shown["image"], caption=shown["label"], use_column_width=True)
+          st.markdown(get_image_download_link(shown["image"], f"{name}_from_latents.png", "📥 Download"), unsafe_allow_html=True)
@@ -1,13 +1,15 @@
 import streamlit as st
-from PIL import Image
 import numpy as np
 import uuid
 import datetime
 
-from utils import resize_image, get_image_download_link, save_image_to_disk, add_to_history
+from utils import get_image_download_link, save_image_to_disk, add_to_history
 from models import load_img2img_model # Restoration often uses Img2Img
 from processing import process_img2img
 from projects import save_project, load_projects
+from upload_cache import get_upload_cache
+from normalize import normalized_size, normalize_image
+from config import ENHANCE_MAX_SIZE
 
 def restore_old_photo_app(model_id, seed, guidance_scale, num_inference_steps, strength):
     st.markdown('<div class="info-box">Upload an old or damaged photo. The AI will attempt to restore it based on your prompt and settings.</div>', unsafe_allow_html=True)
@@ -23,10 +25,12 @@ def restore_old_photo_app(model_id, seed, guidance_scale, num_inference_steps, s
 
     if uploaded_file is not None:
         try:
-            image = Image.open(uploaded_file).convert("RGB")
             # Resize slightly if too large, but try to keep resolution
-            st.session_state.restore_input_image = resize_image(image, max_size=1024)
-            st.session_state.restore_result_image = None # Reset result on new upload
+            image, is_new = get_upload_cache().load_one(
+                "restore_upload", uploaded_file, transform_key="normalized1024", target_size=lambda size: normalized_size(size, ENHANCE_MAX_SIZE))
+            st.session_state.restore_input_image = image
+            if is_new:
+                st.session_state.restore_result_image = None # Reset result on new upload
         except Exception as e:
             st.error(f"Error loading image: {e}")
             st.session_state.restore_input_image = None
@@ -56,17 +60,10 @@ def restore_old_photo_app(model_id, seed, guidance_scale, num_inference_steps, s
                     with st.spinner("Loading restoration model (Img2Img)..."):
                         pipe, device = load_img2img_model(model_id)
 
-                    # Ensure image is suitable size for model
-                    width, height = st.session_state.restore_input_image.size
-                    target_width = (width // 8) * 8
-                    target_height = (height // 8) * 8
-                    if target_width == 0: target_width = 512
-                    if target_height == 0: target_height = 512
-
-                    img_to_process = st.session_state.restore_input_image
-                    if img_to_process.size != (target_width, target_height):
-                        st.write(f"Resizing input to {target_width}x{target_height} for model.")
-                        img_to_process = img_to_process.resize((target_width, target_height), Image.LANCZOS)
+                    # Ensure image is suitable size for model (already normalized on upload)
+                    img_to_process = normalize_image(st.session_state.restore_input_image, ENHANCE_MAX_SIZE)
+                    if img_to_process is not st.session_state.restore_input_image:
+                        st.write(f"Resizing input to {img_to_process.width}x{img_to_process.height} for model.")
 
 
                     result_image, used_seed = process_img2img(
@@ -5,7 +5,8 @@ import datetime
 
 from utils import get_image_download_link, save_image_to_disk, add_to_history
 from models import load_text2img_model
-from processing import process_text2img
+from processing import process_text2img, process_text2img_draft, process_text2img_refine, process_text2img_variations, variation_seeds, keep_variation_latents, result_latents
+from config import DRAFT_SCALE, DRAFT_STEPS, VARIATION_COUNT, VARIATION_MAX_COUNT, PROJECT_LATENTS_DEFAULT
 from projects import save_project, load_projects
 
 def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, height, num_images):
@@ -15,6 +16,10 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
         st.session_state.last_seed_text2img = seed
     if 'generated_text_images' not in st.session_state: # Changed name for clarity
         st.session_state.generated_text_images = []
+    if 't2i_draft_images' not in st.session_state:
+        st.session_state.t2i_draft_images = []
+    if 't2i_variations' not in st.session_state:
+        st.session_state.t2i_variations = [] # (seed, image) pairs of the last sweep
 
     st.markdown("### 💬 Describe the image you want")
     prompt = st.text_area("Prompt", "Epic landscape, fantasy art, mountains, river, detailed, sharp focus, trending on artstation", height=120, key="t2i_prompt")
@@ -41,14 +46,31 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
 
     final_prompt = prompt + style_prompt_text
 
+    draft_mode = st.checkbox("📝 Draft first", key="t2i_draft_mode", help=f"Generate quick drafts at {DRAFT_SCALE:.0%} size with up to {DRAFT_STEPS} steps, then refine the one you like at full size from the same seed.")
+
     col1, col2 = st.columns(2)
     with col1:
-        generate_button = st.button("✨ Generate Images", key="t2i_generate")
+        generate_button = st.button("📝 Generate Drafts" if draft_mode else "✨ Generate Images", key="t2i_generate")
     with col2:
-        variation_button = st.button("🎲 Generate Variations", key="t2i_variation", disabled=not st.session_state.generated_text_images)
+        has_results = st.session_state.t2i_draft_images if draft_mode else st.session_state.generated_text_images
+        variation_button = st.button("🎲 Generate Variations", key="t2i_variation", disabled=not has_results)
+        if not draft_mode:
+            variation_count = st.number_input("Seeds per sweep", 2, VARIATION_MAX_COUNT, VARIATION_COUNT, key="t2i_variation_count", help="Variations are generated with new random seeds in one batched run, much faster than one click per seed.")
 
 
-    if generate_button or variation_button:
+    if variation_button and not draft_mode:
+        try:
+            with st.spinner("Loading text-to-image model..."):
+                pipe, device = load_text2img_model(model_id)
+            images, used_seeds = process_text2img_variations(
+                pipe, final_prompt, negative_prompt, variation_seeds(variation_count), guidance_scale, num_inference_steps, width, height)
+            if images:
+                st.session_state.t2i_variations = list(zip(used_seeds, images))
+            else:
+                st.error("Variation generation failed.")
+        except Exception as e:
+            st.error(f"Variation generation failed: {str(e)}")
+    elif generate_button or variation_button:
         try:
             with st.spinner("Loading text-to-image model..."):
                 pipe, device = load_text2img_model(model_id)
@@ -56,7 +78,8 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
             current_seed = np.random.randint(0, 2**32 - 1) if variation_button else seed
             st.session_state.last_seed_text2img = current_seed
 
-            images, used_seed = process_text2img(
+            generate = process_text2img_draft if draft_mode else process_text2img
+            images, used_seed = generate(
                 pipe,
                 final_prompt,
                 negative_prompt,
@@ -70,7 +93,9 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
 
             st.session_state.last_seed_text2img = used_seed
 
-            if images:
+            if images and draft_mode:
+                st.session_state.t2i_draft_images = images
+            elif images:
                 st.session_state.generated_text_images = images
                 # History is added within process_text2img if num_images == 1
             else:
@@ -81,6 +106,46 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
             st.error(f"Text-to-Image generation failed: {str(e)}")
             st.session_state.generated_text_images = []
 
+    if draft_mode and st.session_state.t2i_draft_images:
+        st.markdown("---")
+        draft_size = st.session_state.t2i_draft_images[0].size
+        st.markdown(f"### 📝 Drafts ({draft_size[0]}x{draft_size[1]}, Seed: {st.session_state.last_seed_text2img}) — refine the one you like")
+        draft_cols = st.columns(min(len(st.session_state.t2i_draft_images), 4))
+        for idx, draft in enumerate(st.session_state.t2i_draft_images):
+            with draft_cols[idx % len(draft_cols)]:
+                st.image(draft, use_column_width=True)
+                if st.button(f"✨ Refine #{idx+1}", key=f"t2i_refine_{idx}"):
+                    try:
+                        with st.spinner("Loading text-to-image model..."):
+                            pipe, device = load_text2img_model(model_id)
+                        refined, used_seed = process_text2img_refine(
+                            pipe, idx, final_prompt, negative_prompt, guidance_scale, num_inference_steps, width, height)
+                        if refined is not None:
+                            st.session_state.generated_text_images = [refined]
+                            st.session_state.last_seed_text2img = used_seed
+                    except Exception as e:
+                        st.error(f"Refining the draft failed: {str(e)}")
+        stats = st.session_state.get("last_progressive")
+        if stats and stats["mode"] == "text2img":
+            first_draft = f"first draft after {stats['time_to_first_image_s']:.1f} s · " if stats["time_to_first_image_s"] is not None else ""
+            st.caption(f"Last accepted image: {first_draft}{stats['drafts']} draft(s) + refine = {stats['total_s']:.1f} s total")
+
+    if not draft_mode and st.session_state.t2i_variations:
+        st.markdown("---")
+        st.markdown("### 🎲 Variations — pick one to keep")
+        variation_cols = st.columns(min(len(st.session_state.t2i_variations), 4))
+        for idx, (variation_seed, variation) in enumerate(st.session_state.t2i_variations):
+            with variation_cols[idx % len(variation_cols)]:
+                st.image(variation, caption=f"Seed: {variation_seed}", use_column_width=True)
+                if st.button(f"✅ Use #{idx+1}", key=f"t2i_pick_variation_{idx}"):
+                    st.session_state.generated_text_images = [variation]
+                    st.session_state.last_seed_text2img = variation_seed
+                    keep_variation_latents("text2img", idx)
+                    add_to_history("text2img", variation, final_prompt)
+        sweep = st.session_state.get("last_variation_sweep")
+        if sweep and sweep["mode"] == "text2img":
+            st.caption(f"Last sweep: {sweep['count']} seeds in {sweep['total_s']:.1f} s ({sweep['total_s'] / sweep['count']:.1f} s per variation)")
+
     if st.session_state.generated_text_images:
         st.markdown("---")
         st.markdown('<div class="result-container">', unsafe_allow_html=True)
@@ -109,6 +174,8 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
         # Save Project
         st.markdown("---")
         project_name_t2i = st.text_input("Save Batch as Project:", key="t2i_project_name", placeholder="e.g., Fantasy Landscapes")
+        latents = result_latents("text2img")
+        include_latents = st.checkbox("Include latents", value=PROJECT_LATENTS_DEFAULT, key="t2i_project_latents", disabled=latents is None, help="Store the final latents with the project (about 32 KB per 512x512 image), so it can be re-decoded or continued without a full run.")
         if project_name_t2i and st.button("💾 Save Project", key="t2i_save_project"):
             image_paths = []
             success = True
@@ -141,5 +208,5 @@ def text2img_app(model_id, seed, guidance_scale, num_inference_steps, width, hei
                     },
                     "paths": image_paths
                 }
-                if save_project(project_name_t2i, project_data):
+                if save_project(project_name_t2i, project_data, latents=latents if include_latents else None):
                      st.session_state.projects = load_projects() # Refresh project list
\ No newline at end of file
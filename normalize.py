@@ -0,0 +1,70 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+from PIL import Image
+
+from imaging import open_image
+from config import INPUT_SIZE_MULTIPLE, NORMALIZE_MEMO_MAX_ENTRIES
+
+# Single-resample input normalization.
+# The model-compatible size (max side, then floored to a multiple of
+# INPUT_SIZE_MULTIPLE) is computed from the original size up front, and each
+# input is resampled exactly once to reach it. Previously inputs were
+# LANCZOS-resized to the max side and then again to a multiple of 8.
+#
+#   open_normalized(file, max_size)   decode (reduced-scale for JPEGs) + one resample
+#   normalize_image(image, max_size)  same for an already decoded image, memoized per input
+#   normalize_mask(mask, size)        NEAREST resize of a mask onto a normalized image
+
+
+def normalized_size(size, max_size=None, multiple=INPUT_SIZE_MULTIPLE):
+    width, height = size
+    if max_size and (width > max_size or height > max_size):
+        if width > height:
+            width, height = max_size, int(height * (max_size / width))
+        else:
+            width, height = int(width * (max_size / height)), max_size
+    width = max(multiple, (width // multiple) * multiple)
+    height = max(multiple, (height // multiple) * multiple)
+    return width, height
+
+
+def open_normalized(source, max_size=None, mode="RGB", multiple=INPUT_SIZE_MULTIPLE):
+    return open_image(source, mode, lambda size: normalized_size(size, max_size, multiple))
+
+
+# Per-input memo: (id(image), args) -> (weakref to the input, normalized image).
+# The weakref guards against a recycled id; the memo never keeps an input alive.
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _memoized(image, key, compute):
+    key = (id(image),) + key
+    with _memo_lock:
+        entry = _memo.get(key)
+        if entry is not None and entry[0]() is image:
+            _memo.move_to_end(key)
+            return entry[1]
+    result = compute()
+    with _memo_lock:
+        _memo[key] = (weakref.ref(image), result)
+        while len(_memo) > NORMALIZE_MEMO_MAX_ENTRIES:
+            _memo.popitem(last=False)
+    return result
+
+
+def normalize_image(image, max_size=None, multiple=INPUT_SIZE_MULTIPLE):
+    size = normalized_size(image.size, max_size, multiple)
+    if image.size == size:
+        return image
+    return _memoized(image, ("image", size), lambda: image.resize(size, Image.LANCZOS))
+
+
+def normalize_mask(mask, size):
+    # Masks stay hard-edged: NEAREST, no reduced-scale decode
+    size = tuple(size)
+    if mask.size == size:
+        return mask
+    return _memoized(mask, ("mask", size), lambda: mask.resize(size, Image.NEAREST))
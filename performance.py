@@ -0,0 +1,95 @@
+import contextlib
+import os
+
+from PIL import Image
+
+from config import CPU_PERF_DEFAULTS
+from lazy_imports import torch
+
+# --- CPU performance mode ---
+# Knobs for CPU-only hosts. Threads and autocast are per-process/per-call and can
+# change freely; channels_last and torch.compile change the loaded modules, so
+# they are part of the model cache key in models.py.
+
+def cpu_perf_options(overrides=None):
+    options = dict(CPU_PERF_DEFAULTS)
+    options.update({k: v for k, v in (overrides or {}).items() if k in options})
+    return options
+
+
+def configure_cpu_threads(num_threads=0, num_interop_threads=0):
+    if num_threads and num_threads != torch.get_num_threads():
+        torch.set_num_threads(int(num_threads))
+    if num_interop_threads and num_interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(int(num_interop_threads))
+        except RuntimeError:
+            pass # Can only be set once, before any inter-op parallel work has started
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def apply_channels_last(pipe):
+    for name in ("unet", "vae"):
+        module = getattr(pipe, name, None)
+        if module is not None:
+            module.to(memory_format=torch.channels_last)
+
+
+def compile_unet(pipe):
+    if not hasattr(torch, "compile") or getattr(pipe.unet, "_orig_mod", None) is not None:
+        return False
+    pipe.unet = torch.compile(pipe.unet)
+    return True
+
+
+def warmup_pipeline(pipe, width=512, height=512, steps=2):
+    # One tiny run so compilation/allocation happens at load time, not on the first user request.
+    # torch.compile specialises on shapes, so warm up at the default request size.
+    kwargs = {"prompt": "warm-up", "num_inference_steps": steps, "output_type": "latent"}
+    pipe_name = type(pipe).__name__
+    if "Inpaint" in pipe_name:
+        kwargs.update(
+            image=Image.new("RGB", (width, height)),
+            mask_image=Image.new("L", (width, height), 255),
+            height=height, width=width,
+        )
+    elif "Img2Img" in pipe_name:
+        kwargs.update(image=Image.new("RGB", (width, height)), strength=1.0)
+    else:
+        kwargs.update(height=height, width=width)
+    with inference_context(pipe):
+        pipe(**kwargs)
+
+
+def apply_cpu_perf(pipe, options):
+    # Load-time knobs (modify the modules)
+    if options.get("channels_last"):
+        apply_channels_last(pipe)
+    compiled = compile_unet(pipe) if options.get("compile_unet") else False
+    if compiled:
+        warmup_pipeline(pipe)
+    return compiled
+
+
+def set_runtime_flags(pipe, **flags):
+    runtime = dict(getattr(pipe, "_studio_runtime", {}))
+    runtime.update(flags)
+    pipe._studio_runtime = runtime
+
+def runtime_flags(pipe):
+    return getattr(pipe, "_studio_runtime", {})
+
+
+@contextlib.contextmanager
+def inference_context(pipe):
+    # No autograd bookkeeping for generation; optional bf16 autocast on CPU
+    with torch.inference_mode():
+        if runtime_flags(pipe).get("bf16_autocast") and pipe.device.type == "cpu":
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                yield
+        else:
+            yield
+
+
+def default_thread_count():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
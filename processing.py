@@ -1,128 +1,384 @@
+import time
 import streamlit as st
-import torch
-import numpy as np
-from PIL import Image
+import engine
+from engine import EngineError
 from utils import add_to_history
+from normalize import normalize_image, normalize_mask
+from instrumentation import record_event
+from deadline import scaled_max_size
+from config import PROJECT_INTERMEDIATE_LATENTS_EVERY, PROJECT_CONTINUE_STRENGTH
+
+# --- Streamlit adapter over engine.py ---
+# Same signatures and (result, seed) returns as before; the engine does the work,
+# this layer turns its errors/events into st.* calls and session state.
+
+def _on_engine_event(event, payload):
+    if event == "warning":
+        st.warning(payload)
+    elif event == "info":
+        st.write(payload)
+    elif event == "memory_plan":
+        st.session_state.last_memory_plan = payload
+    elif event == "profile":
+        st.session_state.last_profile = payload
+    elif event == "run_metrics":
+        st.session_state.last_run_metrics = payload
+
+def _consume_profile_request():
+    # "Profile next run" is one-shot: the armed flag is cleared by the run that uses it
+    if not st.session_state.get("profile_armed"):
+        return False
+    st.session_state.profile_armed = False
+    return True
+
+def _show_error(e):
+    st.error(str(e))
+    if e.hint:
+        st.info(e.hint)
+
+def _deadline_plan(pipe, kind, steps, width, height, guidance_scale, batch=1, strength=1.0):
+    # -> (plan or None, speedups). With a sidebar latency budget, the plan caps steps, size and guidance
+    speedups = st.session_state.get("speedup_options")
+    budget_s = st.session_state.get("deadline_s")
+    if not budget_s:
+        return None, speedups
+    plan = engine.plan_for_deadline(pipe, kind, budget_s, steps, width, height, guidance_scale, batch, strength)
+    if plan is None:
+        st.info("⏱️ No measured runs of this model on this device yet: this run uses the sidebar settings and calibrates the latency budget.")
+        return None, speedups
+    if plan["cfg_truncation"] < 1:
+        speedups = dict(speedups or {})
+        speedups["cfg_truncation"] = min(plan["cfg_truncation"], speedups.get("cfg_truncation", 1.0))
+    return plan, speedups
+
+def _report_deadline(plan, result):
+    if plan is None:
+        return
+    actual_s = result.metrics["total_s"]
+    st.session_state.last_deadline = {**plan, "actual_s": actual_s, "run_id": result.metrics["run_id"]}
+    st.caption(
+        f"⏱️ Budget {plan['budget_s']:.0f} s · predicted {plan['predicted_s']:.1f} s · actual {actual_s:.1f} s "
+        f"({plan['steps']} steps at {plan['width']}x{plan['height']}"
+        + (f", guidance for {plan['cfg_truncation']:.0%} of steps" if plan["cfg_truncation"] < 1 else "") + ")"
+        + ("" if plan["fits"] else " · the budget is too tight even at the cheapest settings")
+    )
+
+# Latents of each mode's current result, for "Include latents" when saving a project
+def _keep_latents(mode, latents, intermediate=None):
+    st.session_state.setdefault("result_latents", {})[mode] = None if latents is None else {"final": latents, "intermediate": intermediate}
+
+def result_latents(mode):
+    return st.session_state.get("result_latents", {}).get(mode)
 
 def process_inpainting(pipe, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength):
     if not pipe:
         st.error("Inpainting model not loaded.")
         return None, seed
 
-    if seed == -1:
-        seed = np.random.randint(0, 2**32 - 1)
+    seed = engine.resolve_seed(seed)
+    with st.spinner("🎨 AI is working on your image (Inpainting)..."):
+        try:
+            result = engine.inpaint(
+                pipe, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+                on_event=_on_engine_event, profile=_consume_profile_request(), speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+                keep_intermediate=PROJECT_INTERMEDIATE_LATENTS_EVERY,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, seed
 
-    generator = torch.Generator(device=pipe.device).manual_seed(seed)
+    _keep_latents("inpaint", result.latents, result.intermediate_latents)
+    add_to_history("inpaint", result.image, prompt)
+    return result.image, seed
 
-    mask_image_l = mask_image.convert("L")
+def process_text2img(pipe, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, num_images=1):
+    if not pipe:
+        st.error("Text-to-Image model not loaded.")
+        return None, seed
 
-    mask_array = np.array(mask_image_l)
-    if np.mean(mask_array) < 127: # If mostly black, invert (assume user painted area to keep)
-         mask_image_l = Image.fromarray(255 - mask_array)
+    seed = engine.resolve_seed(seed)
+    plan, speedups = _deadline_plan(pipe, "text2img", num_inference_steps, width, height, guidance_scale, num_images)
+    if plan is not None:
+        num_inference_steps, width, height = plan["steps"], plan["width"], plan["height"]
+    with st.spinner("✨ AI is generating your images (Text2Img)..."):
+        try:
+            result = engine.text2img(
+                pipe, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, num_images,
+                on_event=_on_engine_event, profile=_consume_profile_request(), speedups=speedups,
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+                keep_intermediate=PROJECT_INTERMEDIATE_LATENTS_EVERY,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, seed
+    _report_deadline(plan, result)
+    _keep_latents("text2img", result.latents, result.intermediate_latents)
 
-    # Ensure image and mask are same size
-    if image.size != mask_image_l.size:
-        st.warning(f"Image ({image.size}) and mask ({mask_image_l.size}) sizes differ. Resizing mask to image size.")
-        mask_image_l = mask_image_l.resize(image.size)
+    if num_images == 1:
+        add_to_history("text2img", result.image, prompt)
+    return result.images, seed
 
 
-    with st.spinner("🎨 AI is working on your image (Inpainting)..."):
+def process_img2img(pipe, image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength):
+    if not pipe:
+        st.error("Image-to-Image model not loaded.")
+        return None, seed
+
+    seed = engine.resolve_seed(seed)
+    plan, speedups = _deadline_plan(pipe, "img2img", num_inference_steps, image.width, image.height, guidance_scale, strength=strength)
+    if plan is not None:
+        num_inference_steps = plan["steps"]
+        if plan["scale"] < 1:
+            image = normalize_image(image, scaled_max_size(image.width, image.height, plan["scale"]))
+    with st.spinner("🤖 AI is processing your image (Img2Img)..."):
         try:
-            result = pipe(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                image=image,
-                mask_image=mask_image_l,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                strength=strength,
-                generator=generator
+            result = engine.img2img(
+                pipe, image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+                on_event=_on_engine_event, profile=_consume_profile_request(), speedups=speedups,
+                scheduler=st.session_state.get("scheduler_preset"),
             )
-
-            if result.images and len(result.images) > 0:
-                 output_image = result.images[0]
-                 add_to_history("inpaint", output_image, prompt)
-                 return output_image, seed
-            else:
-                 st.error("Inpainting failed to produce an image.")
-                 return None, seed
-
-        except Exception as e:
-            st.error(f"Error during inpainting: {str(e)}")
-            st.info("Try reducing image size, adjusting strength/steps, or using a different model.")
+        except EngineError as e:
+            _show_error(e)
             return None, seed
+    _report_deadline(plan, result)
 
-def process_text2img(pipe, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, num_images=1):
+    # Decide if img2img should go to general history
+    # add_to_history("img2img", result.image, prompt)
+    return result.image, seed
+
+
+# --- Variation sweeps ---
+# "Generate Variations": several random seeds in one batched engine call. Nothing goes
+# to history until a variation is picked in the mode's grid.
+
+def _record_sweep(mode, result):
+    st.session_state.last_variation_sweep = {"mode": mode, "count": len(result.seeds), "total_s": result.metrics["total_s"]}
+    st.session_state.setdefault("variation_latents", {})[mode] = result.latents
+
+def keep_variation_latents(mode, index):
+    # A picked variation becomes the mode's result, latents included
+    latents = st.session_state.get("variation_latents", {}).get(mode)
+    _keep_latents(mode, None if latents is None else latents[index:index + 1])
+
+def variation_seeds(count):
+    return [engine.resolve_seed(-1) for _ in range(count)]
+
+def process_text2img_variations(pipe, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, width, height):
     if not pipe:
         st.error("Text-to-Image model not loaded.")
-        return None, seed
+        return None, seeds
 
-    if seed == -1:
-        seed = np.random.randint(0, 2**32 - 1)
+    plan, speedups = _deadline_plan(pipe, "text2img", num_inference_steps, width, height, guidance_scale, len(seeds))
+    if plan is not None:
+        num_inference_steps, width, height = plan["steps"], plan["width"], plan["height"]
+    with st.spinner(f"🎲 Generating {len(seeds)} variations in one batch..."):
+        try:
+            result = engine.text2img_variations(
+                pipe, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, width, height,
+                on_event=_on_engine_event, speedups=speedups, scheduler=st.session_state.get("scheduler_preset"),
+                keep_latents=True,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, seeds
+    _report_deadline(plan, result)
+    _record_sweep("text2img", result)
+    return result.images, result.seeds
 
-    generator = torch.Generator(device=pipe.device).manual_seed(seed)
+def process_inpainting_variations(pipe, image, mask_image, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, strength):
+    if not pipe:
+        st.error("Inpainting model not loaded.")
+        return None, seeds
 
-    with st.spinner("✨ AI is generating your images (Text2Img)..."):
+    with st.spinner(f"🎲 Inpainting {len(seeds)} variations in one batch..."):
         try:
-            result = pipe(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                width=width,
-                height=height,
-                num_images_per_prompt=num_images,
-                generator=generator
+            result = engine.inpaint_variations(
+                pipe, image, mask_image, prompt, negative_prompt, seeds, guidance_scale, num_inference_steps, strength,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
             )
+        except EngineError as e:
+            _show_error(e)
+            return None, seeds
+    _record_sweep("inpaint", result)
+    return result.images, result.seeds
 
-            if result.images:
-                if num_images == 1:
-                    add_to_history("text2img", result.images[0], prompt)
-                return result.images, seed
-            else:
-                st.error("Text-to-Image generation failed to produce images.")
-                return None, seed
 
-        except Exception as e:
-            st.error(f"Error during Text-to-Image generation: {str(e)}")
+# --- Draft & refine (progressive generation) ---
+# Drafts since the last accepted image are tracked per mode: their latents (for
+# refining) and the time spent on them. Refining one accepts it and records
+# time-to-first-image and total time per accepted image as a "progressive_accept" event.
+
+def _draft_state(mode):
+    drafts = st.session_state.setdefault("drafts", {})
+    return drafts.setdefault(mode, {"spent_s": 0.0, "first_image_s": None, "count": 0, "latents": None, "seed": None})
+
+def _record_draft(mode, result, seed):
+    state = _draft_state(mode)
+    state["spent_s"] += result.metrics["total_s"]
+    if state["first_image_s"] is None:
+        state["first_image_s"] = result.metrics["total_s"]
+    state["count"] += 1
+    state["latents"], state["seed"] = result.latents, seed
+
+def _record_accept(mode, result):
+    state = _draft_state(mode)
+    refine_s = result.metrics["total_s"]
+    stats = {
+        "mode": mode, "drafts": state["count"], "time_to_first_image_s": state["first_image_s"],
+        "refine_s": refine_s, "total_s": state["spent_s"] + refine_s, "run_id": result.metrics["run_id"],
+    }
+    record_event("progressive_accept", **stats)
+    st.session_state.last_progressive = stats
+    # Timing starts over for the next image; the latents stay, so another draft of the set can be refined
+    state.update(spent_s=0.0, first_image_s=None, count=0)
+
+def draft_latents_available(mode):
+    return _draft_state(mode)["latents"] is not None
+
+def process_text2img_draft(pipe, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, num_images=1):
+    if not pipe:
+        st.error("Text-to-Image model not loaded.")
+        return None, seed
+
+    seed = engine.resolve_seed(seed)
+    draft_width, draft_height, draft_steps = engine.draft_settings(width, height, num_inference_steps)
+    with st.spinner(f"📝 Drafting at {draft_width}x{draft_height}, {draft_steps} steps..."):
+        try:
+            result = engine.text2img(
+                pipe, prompt, negative_prompt, seed, guidance_scale, draft_steps, draft_width, draft_height, num_images,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+            )
+        except EngineError as e:
+            _show_error(e)
             return None, seed
+    _record_draft("text2img", result, seed)
+    return result.images, seed
 
+def process_text2img_refine(pipe, index, prompt, negative_prompt, guidance_scale, num_inference_steps, width, height):
+    state = _draft_state("text2img")
+    if not pipe or state["latents"] is None:
+        st.error("No draft to refine.")
+        return None, state["seed"]
 
-def process_img2img(pipe, image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength):
+    with st.spinner(f"✨ Refining draft #{index + 1} at {width}x{height}..."):
+        try:
+            result = engine.refine(
+                pipe, state["latents"][index:index + 1], prompt, negative_prompt, state["seed"], guidance_scale,
+                num_inference_steps, width, height,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, state["seed"]
+    seed = state["seed"]
+    _record_accept("text2img", result)
+    _keep_latents("text2img", result.latents)
+    add_to_history("text2img", result.image, prompt)
+    return result.image, seed
+
+def process_inpainting_draft(pipe, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength):
     if not pipe:
-        st.error("Image-to-Image model not loaded.")
+        st.error("Inpainting model not loaded.")
         return None, seed
 
-    if seed == -1:
-        seed = np.random.randint(0, 2**32 - 1)
+    seed = engine.resolve_seed(seed)
+    draft_width, draft_height, draft_steps = engine.draft_settings(image.width, image.height, num_inference_steps)
+    draft_image = normalize_image(image, max(draft_width, draft_height))
+    with st.spinner(f"📝 Drafting at {draft_image.width}x{draft_image.height}, {draft_steps} steps..."):
+        try:
+            result = engine.inpaint(
+                pipe, draft_image, normalize_mask(mask_image, draft_image.size), prompt, negative_prompt, seed,
+                guidance_scale, draft_steps, strength,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, seed
+    _record_draft("inpaint", result, seed)
+    return result.image, seed
+
+def process_inpainting_refine(pipe, image, mask_image, prompt, negative_prompt, guidance_scale, num_inference_steps):
+    state = _draft_state("inpaint")
+    if not pipe or state["latents"] is None:
+        st.error("No draft to refine.")
+        return None, state["seed"]
 
-    generator = torch.Generator(device=pipe.device).manual_seed(seed)
+    with st.spinner(f"✨ Refining the draft at {image.width}x{image.height}..."):
+        try:
+            result = engine.refine_inpaint(
+                pipe, state["latents"], image, mask_image, prompt, negative_prompt, state["seed"], guidance_scale,
+                num_inference_steps,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"), keep_latents=True,
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, state["seed"]
+    seed = state["seed"]
+    _record_accept("inpaint", result)
+    _keep_latents("inpaint", result.latents)
+    add_to_history("inpaint", result.image, prompt)
+    return result.image, seed
 
-    # Ensure image is RGB
-    image = image.convert("RGB")
 
-    with st.spinner("🤖 AI is processing your image (Img2Img)..."):
+# --- Saved project latents ---
+# Reopened text2img / inpainting projects with stored latents: decoding is one VAE
+# pass, continuing re-runs only PROJECT_CONTINUE_STRENGTH of the steps from them.
+
+def process_decode_latents(pipe, latents):
+    if not pipe:
+        st.error("Model not loaded.")
+        return None
+    start = time.perf_counter()
+    with st.spinner("🔁 Decoding saved latents..."):
+        try:
+            images = engine.decode_latents(pipe, latents)
+        except EngineError as e:
+            _show_error(e)
+            return None
+    st.caption(f"Decoded {len(images)} image(s) in {time.perf_counter() - start:.1f} s (VAE only, no denoising)")
+    return images
+
+def process_continue_text2img(pipe, latents, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength=PROJECT_CONTINUE_STRENGTH):
+    if not pipe:
+        st.error("Text-to-Image model not loaded.")
+        return None, seed
+
+    seed = engine.resolve_seed(seed)
+    height, width = (side * pipe.vae_scale_factor for side in latents.shape[-2:])
+    with st.spinner(f"✨ Continuing from saved latents ({strength:.0%} of {num_inference_steps} steps)..."):
         try:
-            result = pipe(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                image=image,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                strength=strength,
-                generator=generator
+            result = engine.refine(
+                pipe, latents, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, width, height, strength,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"),
             )
+        except EngineError as e:
+            _show_error(e)
+            return None, seed
+    add_to_history("text2img", result.image, prompt)
+    return result.image, seed
+
+def process_continue_inpainting(pipe, latents, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength=PROJECT_CONTINUE_STRENGTH):
+    if not pipe:
+        st.error("Inpainting model not loaded.")
+        return None, seed
 
-            if result.images and len(result.images) > 0:
-                output_image = result.images[0]
-                # Decide if img2img should go to general history
-                # add_to_history("img2img", output_image, prompt)
-                return output_image, seed
-            else:
-                st.error("Img2Img processing failed to produce an image.")
-                return None, seed
-
-        except Exception as e:
-            st.error(f"Error during Img2Img processing: {str(e)}")
-            st.info("Try adjusting strength, image size, or using a different model.")
-            return None, seed
\ No newline at end of file
+    seed = engine.resolve_seed(seed)
+    with st.spinner(f"✨ Continuing from saved latents ({strength:.0%} of {num_inference_steps} steps)..."):
+        try:
+            result = engine.refine_inpaint(
+                pipe, latents, image, mask_image, prompt, negative_prompt, seed, guidance_scale, num_inference_steps, strength,
+                on_event=_on_engine_event, speedups=st.session_state.get("speedup_options"),
+                scheduler=st.session_state.get("scheduler_preset"),
+            )
+        except EngineError as e:
+            _show_error(e)
+            return None, seed
+    add_to_history("inpaint", result.image, prompt)
+    return result.image, seed
@@ -0,0 +1,64 @@
+import datetime
+import re
+
+from config import PROFILES_DIR, PROFILE_FIRST_STEP, PROFILE_LAST_STEP, PROFILE_TOP_N
+from lazy_imports import torch, cuda_available
+
+# --- On-demand torch profiler capture ---
+# Wraps a single generation. The profiler is stepped from the pipeline's
+# callback_on_step_end, so only denoising steps FIRST..LAST (1-based) are
+# recorded; text encoding, the first step and VAE decode stay out of the trace
+# to keep the overhead from distorting the run.
+# Profiler step 0 = denoising step 1 (+ prompt encoding), step i = denoising step i+1.
+
+
+class StepProfiler:
+    def __init__(self, label, first_step=PROFILE_FIRST_STEP, last_step=PROFILE_LAST_STEP, top_n=PROFILE_TOP_N, output_dir=PROFILES_DIR):
+        self.label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)
+        self.first_step = max(1, first_step)
+        self.last_step = max(self.first_step, last_step)
+        self.top_n = top_n
+        self.output_dir = output_dir
+        self.cuda = cuda_available()
+        self.paths = {}
+        self._prof = None
+
+    def _export(self, prof):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.label}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        trace_path = self.output_dir / f"{stem}.trace.json"
+        table_path = self.output_dir / f"{stem}.top{self.top_n}.txt"
+        prof.export_chrome_trace(str(trace_path))
+        sort_by = "self_cuda_time_total" if self.cuda else "self_cpu_time_total"
+        table = prof.key_averages().table(sort_by=sort_by, row_limit=self.top_n)
+        with open(table_path, "w") as f:
+            f.write(f"# {self.label}: denoising steps {self.first_step}-{self.last_step}, sorted by {sort_by}\n")
+            f.write(table)
+        self.paths = {"trace": str(trace_path), "table": str(table_path)}
+
+    def __enter__(self):
+        warmup = 1 if self.first_step > 1 else 0
+        ProfilerActivity = torch.profiler.ProfilerActivity
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if self.cuda else [])
+        self._prof = torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(
+                wait=max(0, self.first_step - 1 - warmup),
+                warmup=warmup,
+                active=self.last_step - self.first_step + 1,
+                repeat=1,
+            ),
+            on_trace_ready=self._export,
+            record_shapes=True,
+        )
+        self._prof.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._prof.__exit__(exc_type, exc, tb)
+        return False
+
+    # callback_on_step_end signature
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        self._prof.step()
+        return callback_kwargs
@@ -2,7 +2,9 @@ import streamlit as st
 import json
 import uuid
 import datetime
+import shutil
 from pathlib import Path
+import numpy as np
 from config import PROJECTS_DIR # Import the directory path
 
 
@@ -14,12 +16,32 @@ def load_projects():
         st.error(f"Error loading project list: {e}")
         return []
 
-def save_project(name, data):
+def _latents_dir(name):
+    return PROJECTS_DIR / f"{name}_latents"
+
+def _save_latents(name, latents):
+    # latents: {"final": (N, 4, h, w), "intermediate": [(step, (N, 4, h, w)), ...] or None}
+    # Plain float16 .npy rather than compressed .npz: half of float32, and np.load can
+    # memory-map it (a compressed archive has to be read and inflated whole).
+    directory = _latents_dir(name)
+    shutil.rmtree(directory, ignore_errors=True) # Overwriting a project drops its old arrays
+    directory.mkdir(parents=True)
+    entry = {"final": str(directory / "final.npy"), "dtype": "float16"}
+    np.save(entry["final"], np.asarray(latents["final"], dtype=np.float16))
+    if latents.get("intermediate"):
+        entry["intermediate"] = str(directory / "intermediate.npy")
+        entry["intermediate_steps"] = [step for step, _ in latents["intermediate"]]
+        np.save(entry["intermediate"], np.stack([np.asarray(l, dtype=np.float16) for _, l in latents["intermediate"]]))
+    return entry
+
+def save_project(name, data, latents=None):
     if not name.strip():
         st.error("Project name cannot be empty.")
         return False
     filepath = PROJECTS_DIR / f"{name}.json"
     try:
+        if latents is not None:
+            data["latents"] = _save_latents(name, latents)
         with open(filepath, "w") as f:
             json.dump(data, f, indent=4) # Use indent for readability
         st.success(f"Project '{name}' saved successfully!")
@@ -43,6 +65,22 @@ def load_project(name):
         st.error(f"Error loading project '{name}': {str(e)}")
         return None
 
+def load_project_latents(project_data):
+    # -> {"final": array, "intermediate": array or None, "intermediate_steps": [...]}, or None.
+    # Arrays are read-only memory maps: only the slices that get decoded are read from disk.
+    entry = project_data.get("latents")
+    if not entry:
+        return None
+    try:
+        return {
+            "final": np.load(entry["final"], mmap_mode="r"),
+            "intermediate": np.load(entry["intermediate"], mmap_mode="r") if entry.get("intermediate") else None,
+            "intermediate_steps": entry.get("intermediate_steps", []),
+        }
+    except Exception as e:
+        st.warning(f"Could not load saved latents: {e}")
+        return None
+
 def delete_project(name):
     if not name:
         return False
@@ -50,6 +88,7 @@ def delete_project(name):
     try:
         if filepath.exists():
             filepath.unlink()
+            shutil.rmtree(_latents_dir(name), ignore_errors=True)
             st.success(f"Project '{name}' deleted.")
             return True
         else:
@@ -0,0 +1,61 @@
+import io
+
+from config import QUANT_CACHE_DIR
+from lazy_imports import torch
+
+# --- Dynamic int8 quantization (CPU only) ---
+# Linear layers of the text encoder and UNet get int8 weights with activations
+# quantized on the fly. The quantized modules are pickled to QUANT_CACHE_DIR and
+# handed straight to from_pretrained on later startups, so the fp32 weights of
+# those components are never loaded or requantized again.
+
+QUANTIZED_COMPONENTS = ("text_encoder", "unet")
+
+
+def _cache_path(model_id, component):
+    torch_version = torch.__version__.split("+")[0]
+    safe_id = model_id.replace("/", "--")
+    return QUANT_CACHE_DIR / f"{safe_id}--{component}--int8-dynamic--torch{torch_version}.pt"
+
+
+def quantize_module(module):
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_components(model_id):
+    components = {}
+    for name in QUANTIZED_COMPONENTS:
+        path = _cache_path(model_id, name)
+        if not path.exists():
+            continue
+        try:
+            # Full-module pickle written by save below (local cache, not user input)
+            components[name] = torch.load(path, map_location="cpu", weights_only=False)
+        except Exception:
+            path.unlink(missing_ok=True) # Stale/corrupt entry, requantize
+    return components
+
+
+def quantize_pipeline(pipe, model_id, already_quantized=()):
+    # Returns the names of the components quantized in this call
+    quantized = []
+    QUANT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for name in QUANTIZED_COMPONENTS:
+        module = getattr(pipe, name, None)
+        if module is None or name in already_quantized:
+            continue
+        qmodule = quantize_module(module)
+        setattr(pipe, name, qmodule)
+        path = _cache_path(model_id, name)
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(qmodule, tmp_path)
+        tmp_path.replace(path) # Atomic so a killed save never leaves a half-written cache file
+        quantized.append(name)
+    return quantized
+
+
+def module_size_bytes(module):
+    # Serialized size is the honest number for quantized modules (packed params are not nn.Parameters)
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
@@ -0,0 +1,47 @@
+import contextlib
+import importlib
+
+from config import SCHEDULER_PRESETS, DEFAULT_SCHEDULER
+from performance import runtime_flags, set_runtime_flags
+
+# --- Sampler presets ---
+# Checkpoints ship with a conservative scheduler (PNDM/DDIM) tuned for 30-50 steps;
+# multistep solvers reach a comparable image in 12-20. A preset is swapped in by
+# building the scheduler from the loaded pipeline's original scheduler config, so
+# weights are never reloaded. Instances are kept per pipeline (schedulers hold no
+# weights; set_timesteps resets their state at the start of every call).
+# The swap only lasts for one call: loaded pipelines are shared between sessions,
+# so the engine holds the pipeline's run lock around use_scheduler.
+
+
+def scheduler_names():
+    return list(SCHEDULER_PRESETS)
+
+def recommended_steps(name):
+    return SCHEDULER_PRESETS.get(name, SCHEDULER_PRESETS[DEFAULT_SCHEDULER])["steps"]
+
+
+def _build_scheduler(default, preset):
+    cls = getattr(importlib.import_module("diffusers"), preset["class"])
+    return cls.from_config(default.config, **preset["config"])
+
+@contextlib.contextmanager
+def use_scheduler(pipe, name=None):
+    # Makes `name` the pipeline's scheduler until the block exits; yields the preset name.
+    # Raises ValueError for an unknown preset.
+    name = name or DEFAULT_SCHEDULER
+    if name not in SCHEDULER_PRESETS:
+        raise ValueError(f"Unknown scheduler preset {name!r} (choose from {', '.join(SCHEDULER_PRESETS)})")
+    flags = runtime_flags(pipe)
+    if "default_scheduler" not in flags:
+        set_runtime_flags(pipe, default_scheduler=pipe.scheduler, schedulers={}) # The checkpoint's own, before any swap
+        flags = runtime_flags(pipe)
+    preset, schedulers = SCHEDULER_PRESETS[name], flags["schedulers"]
+    if preset["class"] and name not in schedulers:
+        schedulers[name] = _build_scheduler(flags["default_scheduler"], preset)
+    previous = pipe.scheduler
+    pipe.scheduler = schedulers[name] if preset["class"] else flags["default_scheduler"]
+    try:
+        yield name
+    finally:
+        pipe.scheduler = previous
@@ -0,0 +1,57 @@
+from config import SPEEDUP_DEFAULTS, CFG_UNIT_SCALE_MAX
+
+# --- Per-generation speedups ---
+# Opt-in shortcuts that trade a little fidelity for less UNet work, applied by
+# engine._generate per call (options dict like CPU_PERF_DEFAULTS).
+#
+# CFG truncation: with guidance on, every step runs the UNet on a doubled batch
+# (unconditional + conditional). Late steps mostly refine detail and barely react
+# to guidance. After `cfg_truncation` of the steps, the unconditional half is
+# dropped from prompt_embeds (and from the inpainting mask / masked-image latents),
+# and the pipeline continues without guidance. Keeping guidance for half the steps
+# saves ~25% of UNet work; keeping it for a third saves ~33%.
+
+
+def speedup_options(overrides=None):
+    options = dict(SPEEDUP_DEFAULTS)
+    options.update({k: v for k, v in (overrides or {}).items() if k in options})
+    return options
+
+
+def active_speedups(options):
+    return {k: v for k, v in options.items() if v != SPEEDUP_DEFAULTS[k]}
+
+
+def effective_guidance_scale(guidance_scale, options):
+    # A scale this close to 1 is indistinguishable from the conditional prediction alone
+    if options["cfg_skip_unit_scale"] and guidance_scale <= CFG_UNIT_SCALE_MAX:
+        return 1.0
+    return guidance_scale
+
+
+class CfgTruncation:
+    # callback_on_step_end; tensor_inputs are requested from the pipeline (where it has them)
+    tensor_inputs = ("prompt_embeds", "mask", "masked_image_latents")
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+        self.guided_steps = None
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        # num_timesteps: img2img/inpaint run fewer steps than requested when strength < 1
+        total = getattr(pipe, "num_timesteps", None) or 0
+        if self.guided_steps is None and total and step + 1 >= max(1, round(self.fraction * total)):
+            self.guided_steps = step + 1
+            if pipe.do_classifier_free_guidance and "prompt_embeds" in callback_kwargs:
+                for name in self.tensor_inputs:
+                    if callback_kwargs.get(name) is not None:
+                        callback_kwargs[name] = callback_kwargs[name].chunk(2)[-1] # [uncond, cond] -> cond
+                pipe._guidance_scale = 1.0 # do_classifier_free_guidance is False from the next step on
+        return callback_kwargs
+
+
+def cfg_truncation_callback(options, guidance_scale):
+    fraction = options["cfg_truncation"]
+    if guidance_scale <= 1 or not 0 < fraction < 1:
+        return None
+    return CfgTruncation(fraction)
@@ -0,0 +1,170 @@
+import contextlib
+import math
+
+from config import TOKEN_MERGING_MAX_DOWNSAMPLE, TOKEN_MERGING_MIN_TOKENS
+from lazy_imports import torch
+from performance import set_runtime_flags
+
+# --- Token merging for UNet self-attention (ToMe for Stable Diffusion) ---
+# At 768-1024 px the highest-resolution transformer blocks attend over 9k-16k
+# latent tokens, and self-attention cost grows with the square of that. Before each
+# self-attention (attn1), `ratio` of the tokens are merged into their most similar
+# neighbours. Attention runs on the rest, and its output is copied back to the
+# merged positions ("unmerge"), so the block still returns every token.
+#
+# Destination tokens are one random token per 2x2 cell. Sources are matched to
+# them by cosine similarity (bipartite soft matching). The random choice uses a
+# private generator, reseeded per UNet call, so results stay reproducible at a
+# fixed seed and the pipeline's own RNG is not touched.
+#
+# set_token_merging patches attn1.forward on the instance and can be undone.
+# Loaded pipelines are shared between sessions, so generations use token_merging(),
+# which patches for one call only (under the engine's pipeline run lock).
+# Only blocks whose latent is at most TOKEN_MERGING_MAX_DOWNSAMPLE times smaller
+# than the input latent, with at least TOKEN_MERGING_MIN_TOKENS tokens, are merged.
+
+_SEED = 0
+
+
+def _merge_fns(metric, h, w, r, generator):
+    # metric: (B, N, C) with N = h * w. -> (merge, unmerge)
+    B, N, _ = metric.shape
+    sy = sx = 2
+    with torch.no_grad():
+        hsy, wsx = h // sy, w // sx
+        # One destination (-1) per 2x2 cell; leftover rows/columns are all sources
+        rand_idx = torch.randint(sy * sx, size=(hsy, wsx, 1), generator=generator, device=generator.device).to(metric.device)
+        cells = torch.zeros(hsy, wsx, sy * sx, device=metric.device, dtype=torch.int64)
+        cells.scatter_(dim=2, index=rand_idx, src=-torch.ones_like(rand_idx))
+        cells = cells.view(hsy, wsx, sy, sx).transpose(1, 2).reshape(hsy * sy, wsx * sx)
+        grid = torch.zeros(h, w, device=metric.device, dtype=torch.int64)
+        grid[:hsy * sy, :wsx * sx] = cells
+        order = grid.reshape(1, -1, 1).argsort(dim=1)
+        num_dst = hsy * wsx
+        a_idx, b_idx = order[:, num_dst:, :], order[:, :num_dst, :] # sources, destinations
+
+        def split(x):
+            C = x.shape[-1]
+            src = torch.gather(x, dim=1, index=a_idx.expand(B, N - num_dst, C))
+            dst = torch.gather(x, dim=1, index=b_idx.expand(B, num_dst, C))
+            return src, dst
+
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = split(metric)
+        scores = a @ b.transpose(-1, -2)
+        r = min(a.shape[1], r)
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+        unm_idx = edge_idx[..., r:, :] # Sources kept as they are
+        src_idx = edge_idx[..., :r, :] # Sources merged into a destination
+        dst_idx = torch.gather(node_idx[..., None], dim=-2, index=src_idx)
+
+    def merge(x):
+        src, dst = split(x)
+        n, t1, c = src.shape
+        unm = torch.gather(src, dim=-2, index=unm_idx.expand(n, t1 - r, c))
+        src = torch.gather(src, dim=-2, index=src_idx.expand(n, r, c))
+        dst = dst.scatter_reduce(-2, dst_idx.expand(n, r, c), src, reduce="mean")
+        return torch.cat([unm, dst], dim=1)
+
+    def unmerge(x):
+        unm_len = unm_idx.shape[1]
+        unm, dst = x[..., :unm_len, :], x[..., unm_len:, :]
+        c = unm.shape[-1]
+        src = torch.gather(dst, dim=-2, index=dst_idx.expand(B, r, c))
+        out = torch.zeros(B, N, c, device=x.device, dtype=x.dtype)
+        sources = a_idx.expand(B, a_idx.shape[1], 1)
+        out.scatter_(dim=-2, index=b_idx.expand(B, num_dst, c), src=dst)
+        out.scatter_(dim=-2, index=torch.gather(sources, dim=1, index=unm_idx).expand(B, unm_len, c), src=unm)
+        out.scatter_(dim=-2, index=torch.gather(sources, dim=1, index=src_idx).expand(B, r, c), src=src)
+        return out
+
+    return merge, unmerge
+
+
+class TokenMerging:
+    def __init__(self, unet, ratio):
+        self.unet = unet
+        self.ratio = ratio
+        self._latent_hw = None
+        self._generator = None
+        self._patched = []
+        self._handle = None
+
+    def _unet_pre(self, module, args, kwargs):
+        sample = args[0] if args else kwargs["sample"]
+        self._latent_hw = tuple(sample.shape[-2:])
+        device = sample.device.type if sample.device.type == "cuda" else "cpu" # MPS: CPU generator
+        if self._generator is None or self._generator.device.type != device:
+            self._generator = torch.Generator(device=device)
+        self._generator.manual_seed(_SEED)
+
+    def _grid(self, num_tokens):
+        # (h, w) of a block's token grid, or None if it should not be merged
+        if self._latent_hw is None or num_tokens < TOKEN_MERGING_MIN_TOKENS:
+            return None
+        height, width = self._latent_hw
+        downsample = round(math.sqrt(height * width / num_tokens))
+        if downsample > TOKEN_MERGING_MAX_DOWNSAMPLE:
+            return None
+        h, w = math.ceil(height / downsample), math.ceil(width / downsample)
+        return (h, w) if h * w == num_tokens else None
+
+    def _merged_forward(self, original):
+        def forward(hidden_states, encoder_hidden_states=None, attention_mask=None, **kwargs):
+            grid = self._grid(hidden_states.shape[1]) if hidden_states.dim() == 3 else None
+            r = int(hidden_states.shape[1] * self.ratio)
+            if grid is None or r <= 0 or encoder_hidden_states is not None or attention_mask is not None:
+                return original(hidden_states, encoder_hidden_states, attention_mask, **kwargs)
+            merge, unmerge = _merge_fns(hidden_states, *grid, r, self._generator)
+            return unmerge(original(merge(hidden_states), None, None, **kwargs))
+        return forward
+
+    def apply(self):
+        self._handle = self.unet.register_forward_pre_hook(self._unet_pre, with_kwargs=True)
+        for name, module in self.unet.named_modules():
+            if name.endswith("attn1"):
+                previous = module.__dict__.get("forward")
+                module.forward = self._merged_forward(module.forward)
+                self._patched.append((module, previous))
+        return self
+
+    def remove(self):
+        if self._handle is not None:
+            self._handle.remove()
+            self._handle = None
+        for module, previous in self._patched:
+            if previous is None:
+                del module.forward
+            else:
+                module.forward = previous
+        self._patched = []
+
+
+def set_token_merging(pipe, ratio):
+    # -> True if merging is active. Re-applying with a new ratio only updates it;
+    # ratio 0 restores the original attention.
+    current = getattr(pipe, "_studio_token_merging", None)
+    unet = getattr(pipe, "unet", None)
+    if ratio > 0 and (unet is None or getattr(unet, "_orig_mod", None) is not None):
+        ratio = 0 # Compiled UNet: patching would invalidate the compiled graph
+    if current is not None and ratio > 0:
+        current.ratio = ratio
+    elif current is not None:
+        current.remove()
+        pipe._studio_token_merging = None
+    elif ratio > 0:
+        pipe._studio_token_merging = TokenMerging(unet, ratio).apply()
+    set_runtime_flags(pipe, token_merging=ratio)
+    return ratio > 0
+
+
+@contextlib.contextmanager
+def token_merging(pipe, ratio):
+    # Merging for the duration of the block; yields the ratio in effect (0 if not applied)
+    applied = set_token_merging(pipe, ratio)
+    try:
+        yield ratio if applied else 0.0
+    finally:
+        if applied:
+            set_token_merging(pipe, 0)
@@ -0,0 +1,86 @@
+import hashlib
+import io
+from collections import OrderedDict
+
+import streamlit as st
+
+from imaging import open_image
+from config import UPLOAD_CACHE_MAX_ENTRIES
+
+# Decode-once cache for st.file_uploader files.
+# Uploaders keep returning the same files on every rerun, so decoding and resizing
+# them inline repeats the work (and used to reset results) on every slider move.
+# Entries are keyed by content hash + transform_key, which must identify both
+# target_size (reduced-scale decode + resample, see imaging.open_image) and transform.
+# The file ID -> hash mapping means
+# an unchanged upload is not even re-hashed. Lives in session state (file IDs are
+# per session).
+
+
+def _file_id(uploaded_file):
+    # UploadedFile.file_id in current Streamlit, .id in older releases
+    return getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None)
+
+
+class UploadCache:
+    def __init__(self, max_entries=UPLOAD_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._digests = {} # file ID -> content hash
+        self._images = OrderedDict() # (content hash, mode, transform key) -> processed image
+        self._last_seen = {} # widget key -> content hashes of its last upload
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, uploaded_file):
+        file_id = _file_id(uploaded_file)
+        digest = self._digests.get(file_id) if file_id else None
+        if digest is None:
+            digest = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+            if file_id:
+                self._digests[file_id] = digest
+        return digest
+
+    def get(self, uploaded_file, mode="RGB", transform_key=None, transform=None, target_size=None):
+        digest = self._digest(uploaded_file)
+        key = (digest, mode, transform_key)
+        image = self._images.get(key)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+            return digest, image
+        self.misses += 1
+        image = open_image(io.BytesIO(uploaded_file.getvalue()), mode, target_size)
+        if transform is not None:
+            image = transform(image)
+        self._images[key] = image
+        while len(self._images) > self.max_entries:
+            self._images.popitem(last=False)
+        return digest, image
+
+    def load(self, widget_key, uploaded_files, mode="RGB", transform_key=None, transform=None, target_size=None):
+        # -> (images, changed, errors). changed is True only when the widget's set of
+        # files differs (by content) from its previous call: a genuinely new upload.
+        digests, images, errors = [], [], []
+        for uploaded_file in uploaded_files:
+            try:
+                digest, image = self.get(uploaded_file, mode, transform_key, transform, target_size)
+            except Exception as e:
+                errors.append((uploaded_file.name, e))
+                continue
+            digests.append(digest)
+            images.append(image)
+        changed = self._last_seen.get(widget_key) != tuple(digests)
+        self._last_seen[widget_key] = tuple(digests)
+        return images, changed, errors
+
+    def load_one(self, widget_key, uploaded_file, mode="RGB", transform_key=None, transform=None, target_size=None):
+        images, changed, errors = self.load(widget_key, [uploaded_file], mode, transform_key, transform, target_size)
+        if errors:
+            raise errors[0][1]
+        return images[0], changed
+
+
+def get_upload_cache():
+    if "upload_cache" not in st.session_state:
+        st.session_state.upload_cache = UploadCache()
+    return st.session_state.upload_cache
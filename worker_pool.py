@@ -0,0 +1,211 @@
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from config import WORKER_TUNING_PATH, setup_logging
+
+logger = logging.getLogger("studio.workers")
+
+# --- Multi-process worker pool for batch items ---
+# On many-core CPUs one pipeline call stops scaling well before all cores are
+# busy. A WorkerPool starts N spawned processes. Each one loads its own pipeline
+# with threads_per_worker intra-op threads, and batch items are sharded across them.
+# map() streams results back in submission order as they complete.
+#
+# autotune() measures images/min for several workers x threads splits of the
+# same thread budget and stores the best one in WORKER_TUNING_PATH, where
+# batch_runner --workers auto picks it up.
+
+_worker = {}
+
+
+def _default_factory(kind, model_id, cpu_options):
+    import engine
+    return engine.load_pipeline(kind, model_id, cpu_options)[0]
+
+
+def _init_worker(kind, model_id, threads_per_worker, cpu_options, pipeline_factory):
+    options = dict(cpu_options or {})
+    if threads_per_worker:
+        # One inter-op thread per worker: parallelism comes from the processes
+        options.update(num_threads=threads_per_worker, num_interop_threads=1)
+    _worker["kind"] = kind
+    try:
+        _worker["pipe"] = (pipeline_factory or _default_factory)(kind, model_id, options)
+    except Exception as e:
+        # A raising initializer makes Pool respawn the worker forever; fail the items instead
+        _worker["pipe"] = None
+        _worker["load_error"] = f"Worker could not load {model_id}: {e}"
+
+
+def _run_item(item):
+    from engine import EngineError
+    from batch_runner import run_job
+
+    index, job = item
+    start = time.perf_counter()
+    try:
+        if _worker["pipe"] is None:
+            raise EngineError(_worker["load_error"])
+        images = run_job(_worker["pipe"], job)
+        error = None
+    except (EngineError, OSError, ValueError, KeyError) as e:
+        images, error = [], str(e)
+    except Exception as e:
+        # Anything else would propagate out of imap and abort the whole map(); fail only this item
+        logger.exception("Worker %d: item %d raised an unexpected error", os.getpid(), index)
+        images, error = [], f"{type(e).__name__}: {e}"
+    return {"index": index, "images": images, "error": error, "seconds": time.perf_counter() - start, "pid": os.getpid()}
+
+
+class WorkerPool:
+    def __init__(self, kind, model_id, workers, threads_per_worker=0, cpu_options=None, pipeline_factory=None):
+        self.kind = kind
+        self.model_id = model_id
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        # spawn: forked copies of a process that already ran torch (or Streamlit) are not safe
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(
+            workers, initializer=_init_worker,
+            initargs=(kind, model_id, threads_per_worker, cpu_options, pipeline_factory),
+        )
+
+    def map(self, jobs):
+        # jobs: batch_runner job dicts (image/mask may be paths or PIL images)
+        # -> yields {"index", "images", "error", "seconds", "pid"} in job order
+        yield from self._pool.imap(_run_item, enumerate(jobs), chunksize=1)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+
+# --- Autotuning ---
+def candidate_splits(total_threads, max_workers):
+    # Divisors of the thread budget plus powers of two, so every split uses the whole budget or close to it
+    workers = {w for w in range(1, max_workers + 1) if total_threads % w == 0}
+    w = 1
+    while w <= min(max_workers, total_threads):
+        workers.add(w)
+        w *= 2
+    return [(w, max(1, total_threads // w)) for w in sorted(workers)]
+
+
+def _tuning_key(kind, model_id, total_threads):
+    return f"{kind}|{model_id}|{total_threads}"
+
+
+def load_tuning():
+    try:
+        return json.loads(WORKER_TUNING_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def tuned_split(kind, model_id, total_threads=None):
+    entry = load_tuning().get(_tuning_key(kind, model_id, total_threads or os.cpu_count()))
+    return (entry["workers"], entry["threads_per_worker"]) if entry else None
+
+
+def measure_split(kind, model_id, jobs, workers, threads_per_worker, cpu_options=None, pipeline_factory=None):
+    with WorkerPool(kind, model_id, workers, threads_per_worker, cpu_options, pipeline_factory) as pool:
+        # Warm-up round: waits for every worker's model load and first-call overhead
+        list(pool.map(jobs[:workers]))
+        start = time.perf_counter()
+        results = list(pool.map(jobs))
+        elapsed = time.perf_counter() - start
+    images = sum(len(r["images"]) for r in results)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "images": images,
+        "errors": sum(1 for r in results if r["error"]),
+        "elapsed_s": elapsed,
+        "images_per_min": 60 * images / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def autotune(kind, model_id, make_job, total_threads=None, max_workers=8, items_per_worker=2,
+             cpu_options=None, pipeline_factory=None, save=True):
+    # make_job(i) -> batch_runner job dict; each split runs items_per_worker * max(workers) items
+    total_threads = total_threads or os.cpu_count()
+    splits = candidate_splits(total_threads, max_workers)
+    jobs = [make_job(i) for i in range(items_per_worker * max(w for w, _ in splits))]
+    trials = []
+    for workers, threads in splits:
+        logger.info("Trying %d workers x %d threads...", workers, threads)
+        trial = measure_split(kind, model_id, jobs, workers, threads, cpu_options, pipeline_factory)
+        logger.info("  %.2f images/min", trial["images_per_min"])
+        trials.append(trial)
+    best = max(trials, key=lambda t: t["images_per_min"])
+    result = {
+        "kind": kind, "model_id": model_id, "total_threads": total_threads,
+        "workers": best["workers"], "threads_per_worker": best["threads_per_worker"],
+        "images_per_min": best["images_per_min"], "trials": trials,
+        "time": datetime.datetime.now().isoformat(),
+    }
+    if save:
+        tuning = load_tuning()
+        tuning[_tuning_key(kind, model_id, total_threads)] = result
+        WORKER_TUNING_PATH.parent.mkdir(parents=True, exist_ok=True)
+        WORKER_TUNING_PATH.write_text(json.dumps(tuning, indent=2))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the workers x threads split with the best images/min.")
+    parser.add_argument("--op", choices=["text2img", "inpaint", "img2img"], default="text2img")
+    parser.add_argument("--model-id", help="Defaults to config.DEFAULT_MODEL_IDS[op]")
+    parser.add_argument("--prompt", default="a photo of an astronaut riding a horse")
+    parser.add_argument("--image", help="Input image for inpaint/img2img")
+    parser.add_argument("--mask", help="Mask for inpaint")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", type=int, default=512, help="text2img width/height")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="Total thread budget to split")
+    parser.add_argument("--max-workers", type=int, default=8, help="Upper bound; every worker holds a full copy of the model")
+    parser.add_argument("--items-per-worker", type=int, default=2)
+    args = parser.parse_args()
+    setup_logging()
+
+    from config import DEFAULT_MODEL_IDS
+    model_id = args.model_id or DEFAULT_MODEL_IDS[args.op]
+    pipeline_factory = None
+    if model_id == "tiny": # Offline random-weight stand-in (benchmarks/tiny_pipelines.py)
+        from benchmarks.tiny_pipelines import load_tiny_pipeline as pipeline_factory
+
+    def make_job(i):
+        return {
+            "op": args.op, "id": str(i), "prompt": args.prompt, "negative_prompt": "", "seed": i,
+            "guidance_scale": 7.5, "steps": args.steps, "strength": 0.75,
+            "width": args.size, "height": args.size, "num_images": 1,
+            "image": args.image, "mask": args.mask,
+        }
+
+    result = autotune(args.op, model_id, make_job, args.threads, args.max_workers, args.items_per_worker,
+                      pipeline_factory=pipeline_factory)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()